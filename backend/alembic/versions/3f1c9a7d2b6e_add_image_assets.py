@@ -0,0 +1,46 @@
+"""add image assets
+
+Revision ID: 3f1c9a7d2b6e
+Revises: 78d1174cc6d4
+Create Date: 2026-10-19 09:12:40.118203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c9a7d2b6e'
+down_revision: Union[str, None] = '78d1174cc6d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('image_assets',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('source_url', sa.String(length=1000), nullable=False),
+    sa.Column('status', sa.String(length=16), server_default='pending', nullable=False),
+    sa.Column('content_hash', sa.String(length=64), nullable=True),
+    sa.Column('content_type', sa.String(length=64), nullable=True),
+    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('error', sa.String(length=500), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('fetched_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('source_url')
+    )
+    op.create_index(op.f('ix_image_assets_content_hash'), 'image_assets', ['content_hash'], unique=False)
+    op.add_column('items', sa.Column('cover_image_hash', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_items_cover_image_url'), 'items', ['cover_image_url'], unique=False)
+    op.add_column('collections', sa.Column('icon_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('collections', 'icon_hash')
+    op.drop_index(op.f('ix_items_cover_image_url'), table_name='items')
+    op.drop_column('items', 'cover_image_hash')
+    op.drop_index(op.f('ix_image_assets_content_hash'), table_name='image_assets')
+    op.drop_table('image_assets')
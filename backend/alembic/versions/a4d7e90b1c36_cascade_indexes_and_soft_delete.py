@@ -0,0 +1,45 @@
+"""cascade indexes and soft delete
+
+Revision ID: a4d7e90b1c36
+Revises: e61a0f9c3b47
+Create Date: 2026-10-19 15:32:08.417260
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4d7e90b1c36'
+down_revision: Union[str, None] = 'e61a0f9c3b47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Without these, every ON DELETE CASCADE step is a sequential scan of the child table.
+FK_INDEXES = [
+    ("ix_collections_owner_id", "collections", "owner_id"),
+    ("ix_collection_fields_collection_id", "collection_fields", "collection_id"),
+    ("ix_items_collection_id", "items", "collection_id"),
+    ("ix_item_field_values_item_id", "item_field_values", "item_id"),
+    ("ix_item_field_values_field_id", "item_field_values", "field_id"),
+]
+
+
+def upgrade() -> None:
+    op.add_column('collections', sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True))
+
+    # CONCURRENTLY cannot run inside a transaction; IF NOT EXISTS makes a rerun after
+    # a failed build safe (drop the INVALID index by hand first in that case)
+    with op.get_context().autocommit_block():
+        for name, table, column in FK_INDEXES:
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({column})")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _, _ in reversed(FK_INDEXES):
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+    op.drop_column('collections', 'deleted_at')
@@ -0,0 +1,156 @@
+"""add ranks
+
+Revision ID: b58e1d7c2a40
+Revises: 7e5d0c9a3f21
+Create Date: 2026-10-19 19:41:27.905113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b58e1d7c2a40'
+down_revision: Union[str, None] = '7e5d0c9a3f21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Evenly spaced ranks in the order lists showed so far (see app.ranks): items newest
+# first, fields by sort_order. One transaction per collection for items.
+RESPACED_RANK = "(100000000000 + row_number() OVER ({order}) * 1000)::text"
+
+BACKFILL_FIELDS_SQL = f"""
+    UPDATE collection_fields AS f SET rank = r.rank
+    FROM (
+        SELECT id, {RESPACED_RANK.format(order="PARTITION BY collection_id ORDER BY sort_order, created_at, id")} AS rank
+        FROM collection_fields
+    ) r
+    WHERE f.id = r.id
+"""
+
+BACKFILL_ITEMS_SQL = f"""
+    UPDATE items AS i SET rank = r.rank
+    FROM (
+        SELECT id, {RESPACED_RANK.format(order="ORDER BY created_at DESC, id")} AS rank
+        FROM items WHERE collection_id = CAST(:cid AS uuid)
+    ) r
+    WHERE i.collection_id = CAST(:cid AS uuid) AND i.id = r.id
+"""
+
+
+# Until every worker runs code that sets ranks, old ones keep inserting rows without
+# one, during the backfill and after it. These triggers give such rows the rank the
+# app would (items first, fields last, as app.ranks' first_rank/last_rank), under the
+# same per-collection lock; they are created with the columns, before any backfill.
+RANK_TRIGGERS_SQL = """
+    CREATE FUNCTION rank_to_numeric(r text) RETURNS numeric LANGUAGE plpgsql IMMUTABLE AS $$
+    DECLARE
+        n numeric := 0;
+        i int;
+    BEGIN
+        FOR i IN 1..12 LOOP
+            n := n * 62 + strpos('0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz', substr(r, i, 1)) - 1;
+        END LOOP;
+        RETURN n;
+    END $$;
+
+    CREATE FUNCTION numeric_to_rank(n numeric) RETURNS text LANGUAGE plpgsql IMMUTABLE AS $$
+    DECLARE
+        out text := '';
+        i int;
+    BEGIN
+        n := greatest(0, least(n, 62::numeric ^ 12 - 1));
+        FOR i IN 1..12 LOOP
+            out := substr('0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz', (n % 62)::int + 1, 1) || out;
+            n := div(n, 62);
+        END LOOP;
+        RETURN out;
+    END $$;
+
+    CREATE FUNCTION items_missing_rank() RETURNS trigger LANGUAGE plpgsql AS $$
+    DECLARE
+        edge text;
+    BEGIN
+        IF NEW.rank IS NULL THEN
+            PERFORM pg_advisory_xact_lock(hashtextextended('ranks:' || NEW.collection_id, 0));
+            SELECT rank INTO edge FROM items
+            WHERE collection_id = NEW.collection_id AND rank IS NOT NULL ORDER BY rank LIMIT 1;
+            NEW.rank := CASE WHEN edge IS NULL THEN 'V00000000000' ELSE numeric_to_rank(rank_to_numeric(edge) - 1) END;
+        END IF;
+        RETURN NEW;
+    END $$;
+
+    CREATE FUNCTION collection_fields_missing_rank() RETURNS trigger LANGUAGE plpgsql AS $$
+    DECLARE
+        edge text;
+    BEGIN
+        IF NEW.rank IS NULL THEN
+            PERFORM pg_advisory_xact_lock(hashtextextended('ranks:' || NEW.collection_id, 0));
+            SELECT rank INTO edge FROM collection_fields
+            WHERE collection_id = NEW.collection_id AND rank IS NOT NULL AND deleted_at IS NULL
+            ORDER BY rank DESC LIMIT 1;
+            NEW.rank := CASE WHEN edge IS NULL THEN 'V00000000000' ELSE numeric_to_rank(rank_to_numeric(edge) + 1) END;
+        END IF;
+        RETURN NEW;
+    END $$;
+
+    CREATE TRIGGER items_missing_rank BEFORE INSERT ON items
+        FOR EACH ROW EXECUTE FUNCTION items_missing_rank();
+    CREATE TRIGGER collection_fields_missing_rank BEFORE INSERT ON collection_fields
+        FOR EACH ROW EXECUTE FUNCTION collection_fields_missing_rank();
+"""
+
+
+def _set_not_null(table: str) -> None:
+    # a validated CHECK lets SET NOT NULL skip its table scan under ACCESS EXCLUSIVE
+    op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_rank_not_null CHECK (rank IS NOT NULL) NOT VALID")
+    op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {table}_rank_not_null")
+    op.execute(f"ALTER TABLE {table} ALTER COLUMN rank SET NOT NULL")
+    op.execute(f"ALTER TABLE {table} DROP CONSTRAINT {table}_rank_not_null")
+
+
+def upgrade() -> None:
+    op.add_column('collection_fields', sa.Column('rank', sa.String(collation='C'), nullable=True))
+    op.add_column('items', sa.Column('rank', sa.String(collation='C'), nullable=True))
+    op.execute(RANK_TRIGGERS_SQL)
+
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+
+        op.execute(BACKFILL_FIELDS_SQL)
+        for (cid,) in conn.execute(sa.text("SELECT id FROM collections")).all():
+            conn.execute(sa.text(BACKFILL_ITEMS_SQL), {"cid": str(cid)})
+
+        _set_not_null("collection_fields")
+        _set_not_null("items")
+
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_collection_fields_collection_rank "
+            "ON collection_fields (collection_id, rank, id)"
+        )
+
+        # partitioned tables take no CONCURRENTLY: build each partition's index
+        # concurrently and attach it to an initially invalid parent index, which
+        # becomes valid once every partition has one
+        op.execute("CREATE INDEX IF NOT EXISTS ix_items_collection_rank ON ONLY items (collection_id, rank, id)")
+        partitions = conn.execute(sa.text(
+            "SELECT c.relname FROM pg_inherits JOIN pg_class c ON c.oid = inhrelid "
+            "WHERE inhparent = 'items'::regclass ORDER BY c.relname"
+        )).scalars().all()
+        for partition in partitions:
+            index = f"ix_{partition}_collection_rank"
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {partition} (collection_id, rank, id)")
+            op.execute(f"ALTER INDEX ix_items_collection_rank ATTACH PARTITION {index}")
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS items_missing_rank ON items")
+    op.execute("DROP TRIGGER IF EXISTS collection_fields_missing_rank ON collection_fields")
+    op.execute("DROP FUNCTION IF EXISTS items_missing_rank(), collection_fields_missing_rank()")
+    op.execute("DROP FUNCTION IF EXISTS rank_to_numeric(text), numeric_to_rank(numeric)")
+    op.execute("DROP INDEX IF EXISTS ix_items_collection_rank")
+    op.execute("DROP INDEX IF EXISTS ix_collection_fields_collection_rank")
+    op.drop_column('items', 'rank')
+    op.drop_column('collection_fields', 'rank')
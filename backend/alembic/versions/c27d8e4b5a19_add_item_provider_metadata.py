@@ -0,0 +1,34 @@
+"""add item provider metadata
+
+Revision ID: c27d8e4b5a19
+Revises: 9c4e2a61f0d8
+Create Date: 2026-10-19 11:26:52.590114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c27d8e4b5a19'
+down_revision: Union[str, None] = '9c4e2a61f0d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('items', sa.Column('source', sa.String(length=16), nullable=True))
+    op.add_column('items', sa.Column('external_id', sa.String(length=64), nullable=True))
+    op.add_column('items', sa.Column('metadata_json', sa.JSON(), nullable=True))
+    op.add_column('items', sa.Column('metadata_refreshed_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index('ix_items_source_external_id', 'items', ['source', 'external_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_items_source_external_id', table_name='items')
+    op.drop_column('items', 'metadata_refreshed_at')
+    op.drop_column('items', 'metadata_json')
+    op.drop_column('items', 'external_id')
+    op.drop_column('items', 'source')
@@ -0,0 +1,207 @@
+"""dictionary-encode select values
+
+Revision ID: c3a9f04e7b15
+Revises: b58e1d7c2a40
+Create Date: 2026-10-19 20:26:43.518220
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3a9f04e7b15'
+down_revision: Union[str, None] = 'b58e1d7c2a40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Moves select values from {"value": "PS5"} JSON to option codes (see app.options):
+#
+#   1. build each select field's dictionary: its configured options_json choices in
+#      order, then every other label its values use; one transaction per collection
+#   2. rewrite the values field by field in keyset batches, one transaction each
+#
+# Both run after the schema changes have committed, so the ACCESS EXCLUSIVE lock those
+# take on item_field_values is never held across a scan of the values.
+#
+# Only plain values are converted: a string for single_select, a list of strings for
+# multi_select, with no other keys. Everything else, and fields in the middle of a
+# retype, keep the JSON form, which the app reads as before.
+
+BATCH_SIZE = 5000
+MIN_UUID = "00000000-0000-0000-0000-000000000000"
+
+PLAIN_VALUE = """
+    json_typeof(v.value_json) = 'object'
+    AND v.value_json->>'t' IS NULL
+    AND (SELECT count(*) FROM json_object_keys(v.value_json)) = 1
+"""
+PLAIN_SINGLE = f"({PLAIN_VALUE} AND json_typeof(v.value_json->'value') = 'string' AND v.value_json->>'value' <> '')"
+PLAIN_MULTI = f"""({PLAIN_VALUE} AND json_typeof(v.value_json->'value') = 'array'
+    AND NOT EXISTS (
+        SELECT 1 FROM json_array_elements(v.value_json->'value') e WHERE json_typeof(e) <> 'string'
+    ))"""
+
+SELECT_FIELDS = """
+    SELECT id, collection_id, data_type FROM collection_fields
+    WHERE data_type IN ('single_select', 'multi_select')
+      AND pending_data_type IS NULL AND deleted_at IS NULL
+"""
+
+BUILD_OPTIONS_SQL = f"""
+    WITH fields AS ({SELECT_FIELDS} AND collection_id = CAST(:collection AS uuid)),
+    labels AS (
+        SELECT f.id AS field_id, o.label, o.n AS pos
+        FROM fields f
+        JOIN collection_fields cf ON cf.id = f.id
+        CROSS JOIN LATERAL json_array_elements_text(
+            CASE WHEN json_typeof(cf.options_json->'options') = 'array' THEN cf.options_json->'options' ELSE '[]'::json END
+        ) WITH ORDINALITY AS o(label, n)
+        UNION ALL
+        SELECT f.id, v.value_json->>'value', NULL
+        FROM fields f JOIN item_field_values v ON v.collection_id = CAST(:collection AS uuid) AND v.field_id = f.id
+        WHERE f.data_type = 'single_select' AND {PLAIN_SINGLE}
+        UNION ALL
+        SELECT f.id, e.label, NULL
+        FROM fields f JOIN item_field_values v ON v.collection_id = CAST(:collection AS uuid) AND v.field_id = f.id
+        CROSS JOIN LATERAL json_array_elements_text(v.value_json->'value') AS e(label)
+        WHERE f.data_type = 'multi_select' AND {PLAIN_MULTI}
+    )
+    INSERT INTO collection_field_options (field_id, code, label)
+    SELECT field_id, row_number() OVER (PARTITION BY field_id ORDER BY min(pos) NULLS LAST, label), label
+    FROM labels
+    WHERE label IS NOT NULL
+    GROUP BY field_id, label
+"""
+
+# each returns the last id of its batch, or NULL when the field is done
+ENCODE_SQL = {
+    "single_select": f"""
+        WITH batch AS (
+            SELECT v.id FROM item_field_values v
+            WHERE v.collection_id = :collection AND v.field_id = :field AND v.id > CAST(:after AS uuid)
+            ORDER BY v.id LIMIT :limit
+        ),
+        encoded AS (
+            UPDATE item_field_values AS v
+            SET value_code = o.code, value_json = NULL
+            FROM batch b, collection_field_options o
+            WHERE v.collection_id = :collection AND v.id = b.id
+              AND o.field_id = v.field_id AND o.label = v.value_json->>'value'
+              AND {PLAIN_SINGLE}
+        )
+        SELECT id FROM batch ORDER BY id DESC LIMIT 1
+    """,
+    "multi_select": f"""
+        WITH batch AS (
+            SELECT v.id FROM item_field_values v
+            WHERE v.collection_id = :collection AND v.field_id = :field AND v.id > CAST(:after AS uuid)
+            ORDER BY v.id LIMIT :limit
+        ),
+        encoded AS (
+            UPDATE item_field_values AS v
+            SET value_codes = COALESCE((
+                    SELECT array_agg(o.code ORDER BY e.n)
+                    FROM json_array_elements_text(v.value_json->'value') WITH ORDINALITY AS e(label, n)
+                    JOIN collection_field_options o ON o.field_id = v.field_id AND o.label = e.label
+                ), '{{}}'),
+                value_json = NULL
+            FROM batch b
+            WHERE v.collection_id = :collection AND v.id = b.id AND {PLAIN_MULTI}
+              -- labels written since the dictionary was built stay JSON rather than get lost
+              AND NOT EXISTS (
+                  SELECT 1 FROM json_array_elements_text(v.value_json->'value') AS e(label)
+                  WHERE NOT EXISTS (
+                      SELECT 1 FROM collection_field_options o WHERE o.field_id = v.field_id AND o.label = e.label
+                  )
+              )
+        )
+        SELECT id FROM batch ORDER BY id DESC LIMIT 1
+    """,
+}
+
+INDEXES = [
+    (
+        "ix_item_field_values_field_code",
+        "(collection_id, field_id, value_code) WHERE value_code IS NOT NULL",
+    ),
+    ("ix_item_field_values_codes", "USING gin (value_codes)"),
+]
+
+
+def _create_partitioned_index(conn, name: str, definition: str) -> None:
+    # as in b58e1d7c2a40: concurrently per partition, attached to an ON ONLY parent
+    op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY item_field_values {definition}")
+    partitions = conn.execute(sa.text(
+        "SELECT c.relname FROM pg_inherits JOIN pg_class c ON c.oid = inhrelid "
+        "WHERE inhparent = 'item_field_values'::regclass ORDER BY c.relname"
+    )).scalars().all()
+    for partition in partitions:
+        index = f"{name}_{partition.rsplit('_', 1)[-1]}"
+        op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {partition} {definition}")
+        op.execute(f"ALTER INDEX {name} ATTACH PARTITION {index}")
+
+
+def upgrade() -> None:
+    op.create_table(
+        'collection_field_options',
+        sa.Column('field_id', sa.UUID(), nullable=False),
+        sa.Column('code', sa.Integer(), nullable=False),
+        sa.Column('label', sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(['field_id'], ['collection_fields.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('field_id', 'code'),
+        sa.UniqueConstraint('field_id', 'label', name='uq_collection_field_options_label'),
+    )
+    op.add_column('item_field_values', sa.Column('value_code', sa.Integer(), nullable=True))
+    op.add_column('item_field_values', sa.Column('value_codes', postgresql.ARRAY(sa.Integer()), nullable=True))
+    op.alter_column('item_field_values', 'value_json', existing_type=sa.JSON(), nullable=True)
+
+    # entering the block commits the DDL above
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+
+        collections = conn.execute(sa.text(f"SELECT DISTINCT collection_id FROM ({SELECT_FIELDS}) f")).scalars().all()
+        for collection_id in collections:
+            conn.execute(sa.text(BUILD_OPTIONS_SQL), {"collection": str(collection_id)})
+
+        for field_id, collection_id, data_type in conn.execute(sa.text(SELECT_FIELDS)).all():
+            after = MIN_UUID
+            while after is not None:
+                last = conn.execute(
+                    sa.text(ENCODE_SQL[data_type]),
+                    {"collection": collection_id, "field": field_id, "after": after, "limit": BATCH_SIZE},
+                ).scalar()
+                after = str(last) if last is not None else None
+
+        for name, definition in INDEXES:
+            _create_partitioned_index(conn, name, definition)
+        op.execute("ANALYZE item_field_values")
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_item_field_values_codes")
+    op.execute("DROP INDEX IF EXISTS ix_item_field_values_field_code")
+    # every row without JSON gets it back, so SET NOT NULL cannot fail; a code whose
+    # option is gone decodes to null, as the app reads it
+    op.execute("""
+        UPDATE item_field_values AS v
+        SET value_json = CASE
+            WHEN v.value_codes IS NOT NULL THEN json_build_object('value', COALESCE((
+                SELECT json_agg(o.label ORDER BY c.n)
+                FROM unnest(v.value_codes) WITH ORDINALITY AS c(code, n)
+                JOIN collection_field_options o ON o.field_id = v.field_id AND o.code = c.code
+            ), '[]'::json))
+            ELSE json_build_object('value', (
+                SELECT o.label FROM collection_field_options o
+                WHERE o.field_id = v.field_id AND o.code = v.value_code
+            ))
+        END
+        WHERE v.value_json IS NULL
+    """)
+    op.alter_column('item_field_values', 'value_json', existing_type=sa.JSON(), nullable=False)
+    op.drop_column('item_field_values', 'value_codes')
+    op.drop_column('item_field_values', 'value_code')
+    op.drop_table('collection_field_options')
@@ -0,0 +1,52 @@
+"""add field migrations
+
+Revision ID: d93b6f2e7a10
+Revises: a4d7e90b1c36
+Create Date: 2026-10-19 16:21:44.083952
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd93b6f2e7a10'
+down_revision: Union[str, None] = 'a4d7e90b1c36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('collection_fields', sa.Column('pending_data_type', sa.String(length=32), nullable=True))
+    op.add_column('collection_fields', sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True))
+
+    op.create_table('field_migrations',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('field_id', sa.UUID(), nullable=True),
+    sa.Column('job_id', sa.UUID(), nullable=True),
+    sa.Column('kind', sa.String(length=16), nullable=False),
+    sa.Column('from_type', sa.String(length=32), nullable=True),
+    sa.Column('to_type', sa.String(length=32), nullable=True),
+    sa.Column('status', sa.String(length=16), server_default='running', nullable=False),
+    sa.Column('phase', sa.String(length=16), nullable=False),
+    sa.Column('cursor', sa.UUID(), nullable=True),
+    sa.Column('total', sa.Integer(), nullable=True),
+    sa.Column('processed', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('failed', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('errors', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['field_id'], ['collection_fields.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_field_migrations_field_id'), 'field_migrations', ['field_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_field_migrations_field_id'), table_name='field_migrations')
+    op.drop_table('field_migrations')
+    op.drop_column('collection_fields', 'deleted_at')
+    op.drop_column('collection_fields', 'pending_data_type')
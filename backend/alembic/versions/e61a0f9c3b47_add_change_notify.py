@@ -0,0 +1,56 @@
+"""add change notify
+
+Revision ID: e61a0f9c3b47
+Revises: 5b8f13c0d7e2
+Create Date: 2026-10-19 14:55:31.904518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e61a0f9c3b47'
+down_revision: Union[str, None] = '5b8f13c0d7e2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # One NOTIFY per owner per statement, delivered only if the transaction commits.
+    # Payload: {"o": owner_id, "c": [collection ids]}; "c" is null past 50 collections
+    # to stay well under the 8000 byte payload limit.
+    op.execute("""
+        CREATE FUNCTION notify_change_log() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify(
+                'collector_changes',
+                json_build_object(
+                    'o', s.owner_id,
+                    'c', CASE WHEN s.n <= 50 THEN to_json(s.collections) END
+                )::text
+            )
+            FROM (
+                SELECT owner_id,
+                       array_agg(DISTINCT collection_id) FILTER (WHERE collection_id IS NOT NULL) AS collections,
+                       count(DISTINCT collection_id) AS n
+                FROM new_rows
+                GROUP BY owner_id
+            ) s;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER change_log_notify
+        AFTER INSERT ON change_log
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_change_log()
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER change_log_notify ON change_log")
+    op.execute("DROP FUNCTION notify_change_log()")
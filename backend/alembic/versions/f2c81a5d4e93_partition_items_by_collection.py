@@ -0,0 +1,273 @@
+"""partition items by collection
+
+Revision ID: f2c81a5d4e93
+Revises: d93b6f2e7a10
+Create Date: 2026-10-19 17:08:52.316470
+
+"""
+import time
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2c81a5d4e93'
+down_revision: Union[str, None] = 'd93b6f2e7a10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Converts items and item_field_values into tables hash-partitioned by collection_id
+# while the app keeps writing to the old ones:
+#
+#   1. create the partitioned copies (*_part) next to the old tables
+#   2. mirror every write on the old items table into items_part with a trigger
+#   3. copy items over in keyset batches, each its own short transaction
+#   4. same for item_field_values, deriving collection_id from the item (the backfill)
+#   5. swap the tables in one short transaction under a lock_timeout
+#
+# Only step 5 blocks writers, for as long as two DROP TABLEs and some renames take.
+# The app code that sets item_field_values.collection_id must be deployed with it.
+
+PARTITIONS = 16
+BATCH_SIZE = 5000
+SWAP_LOCK_TIMEOUT = "5s"
+SWAP_ATTEMPTS = 20
+
+ITEM_COLUMNS = [
+    "id", "collection_id", "title", "notes", "cover_image_url", "cover_image_hash",
+    "source", "external_id", "metadata_json", "metadata_refreshed_at", "created_at", "updated_at",
+]
+VALUE_COLUMNS = ["id", "collection_id", "item_id", "field_id", "value_json"]
+
+MIN_UUID = "00000000-0000-0000-0000-000000000000"
+
+
+def _cols(columns, prefix=""):
+    return ", ".join(f"{prefix}{c}" for c in columns)
+
+
+def _updates(columns):
+    return ", ".join(f"{c} = EXCLUDED.{c}" for c in columns if c not in ("id", "collection_id"))
+
+
+def _create_partitioned_tables() -> None:
+    op.execute("""
+        CREATE TABLE items_part (
+            id uuid NOT NULL,
+            collection_id uuid NOT NULL,
+            title varchar(200) NOT NULL,
+            notes varchar(2000),
+            cover_image_url varchar(1000),
+            cover_image_hash varchar(64),
+            source varchar(16),
+            external_id varchar(64),
+            metadata_json json,
+            metadata_refreshed_at timestamptz,
+            created_at timestamptz NOT NULL DEFAULT now(),
+            updated_at timestamptz NOT NULL DEFAULT now(),
+            CONSTRAINT items_part_pkey PRIMARY KEY (collection_id, id),
+            CONSTRAINT items_collection_id_fkey FOREIGN KEY (collection_id)
+                REFERENCES collections (id) ON DELETE CASCADE
+        ) PARTITION BY HASH (collection_id)
+    """)
+    op.execute("""
+        CREATE TABLE item_field_values_part (
+            id uuid NOT NULL,
+            collection_id uuid NOT NULL,
+            item_id uuid NOT NULL,
+            field_id uuid NOT NULL,
+            value_json json NOT NULL,
+            CONSTRAINT item_field_values_part_pkey PRIMARY KEY (collection_id, id),
+            CONSTRAINT item_field_values_field_id_fkey FOREIGN KEY (field_id)
+                REFERENCES collection_fields (id) ON DELETE CASCADE
+        ) PARTITION BY HASH (collection_id)
+    """)
+    for i in range(PARTITIONS):
+        op.execute(
+            f"CREATE TABLE items_p{i:02d} PARTITION OF items_part "
+            f"FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {i})"
+        )
+        op.execute(
+            f"CREATE TABLE item_field_values_p{i:02d} PARTITION OF item_field_values_part "
+            f"FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {i})"
+        )
+
+    # temporary names; the old tables still own the final ones until the swap.
+    # The primary key leads with collection_id, so lookups by id alone need their own index.
+    op.execute("CREATE INDEX ix_items_part_id ON items_part (id)")
+    op.execute("CREATE INDEX ix_items_part_cover_image_url ON items_part (cover_image_url)")
+    op.execute("CREATE INDEX ix_items_part_source_external_id ON items_part (source, external_id)")
+    op.execute("CREATE INDEX ix_item_field_values_part_collection_item ON item_field_values_part (collection_id, item_id)")
+    op.execute("CREATE INDEX ix_item_field_values_part_field_id ON item_field_values_part (field_id)")
+
+
+def _create_mirror_triggers(table: str) -> None:
+    # AFTER ROW triggers fire in name order, so the RI cascade triggers ("RI_...") run
+    # before these: a cascaded delete waits for a copy batch's FOR SHARE lock before the
+    # mirror removes the parent from the new table.
+    if table == "items":
+        upsert = f"""
+            INSERT INTO items_part ({_cols(ITEM_COLUMNS)})
+            VALUES ({_cols(ITEM_COLUMNS, "NEW.")})
+            ON CONFLICT (collection_id, id) DO UPDATE SET {_updates(ITEM_COLUMNS)};
+        """
+    else:
+        # collection_id comes from the item: the old table has no such column
+        upsert = f"""
+            INSERT INTO item_field_values_part ({_cols(VALUE_COLUMNS)})
+            SELECT NEW.id, i.collection_id, NEW.item_id, NEW.field_id, NEW.value_json
+            FROM items i WHERE i.id = NEW.item_id
+            ON CONFLICT (collection_id, id) DO UPDATE SET {_updates(VALUE_COLUMNS)};
+        """
+    old_key = "OLD.collection_id" if table == "items" else "(SELECT collection_id FROM items_part WHERE id = OLD.item_id)"
+
+    op.execute(f"""
+        CREATE FUNCTION {table}_mirror() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                DELETE FROM {table}_part WHERE id = OLD.id AND collection_id = {old_key};
+                IF TG_OP = 'DELETE' THEN
+                    RETURN OLD;
+                END IF;
+            END IF;
+            {upsert}
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute(f"""
+        CREATE TRIGGER {table}_mirror AFTER INSERT OR UPDATE OR DELETE ON {table}
+        FOR EACH ROW EXECUTE FUNCTION {table}_mirror()
+    """)
+
+
+def _copy(conn, source_sql: str, target: str, columns: list[str]) -> None:
+    """Copies source_sql's rows (keyset-ordered by id, :after/:limit bound) in batches.
+
+    FOR SHARE keeps a concurrent delete from committing between our read and our
+    insert; ON CONFLICT DO NOTHING keeps a newer version the mirror already wrote.
+    """
+    after = MIN_UUID
+    while True:
+        last = conn.execute(
+            sa.text(f"""
+                WITH batch AS ({source_sql}),
+                copied AS (
+                    INSERT INTO {target} ({_cols(columns)})
+                    SELECT {_cols(columns)} FROM batch
+                    ON CONFLICT DO NOTHING
+                )
+                SELECT id FROM batch ORDER BY id DESC LIMIT 1
+            """),
+            {"after": after, "limit": BATCH_SIZE},
+        ).scalar()
+        if last is None:
+            return
+        after = str(last)
+
+
+def _swap(conn) -> None:
+    swap = f"""
+        DO $$
+        BEGIN
+            SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}';
+            LOCK TABLE items, item_field_values IN ACCESS EXCLUSIVE MODE;
+
+            DROP TRIGGER item_field_values_mirror ON item_field_values;
+            DROP TRIGGER items_mirror ON items;
+            DROP TABLE item_field_values;
+            DROP TABLE items;
+
+            ALTER TABLE items_part RENAME TO items;
+            ALTER INDEX items_part_pkey RENAME TO items_pkey;
+            ALTER INDEX ix_items_part_id RENAME TO ix_items_id;
+            ALTER INDEX ix_items_part_cover_image_url RENAME TO ix_items_cover_image_url;
+            ALTER INDEX ix_items_part_source_external_id RENAME TO ix_items_source_external_id;
+
+            ALTER TABLE item_field_values_part RENAME TO item_field_values;
+            ALTER INDEX item_field_values_part_pkey RENAME TO item_field_values_pkey;
+            ALTER INDEX ix_item_field_values_part_collection_item RENAME TO ix_item_field_values_collection_item;
+            ALTER INDEX ix_item_field_values_part_field_id RENAME TO ix_item_field_values_field_id;
+        END;
+        $$
+    """
+    for attempt in range(SWAP_ATTEMPTS):
+        try:
+            conn.execute(sa.text(swap))
+            return
+        except sa.exc.OperationalError as e:
+            # lock_not_available: a long transaction holds the tables; try again
+            # rather than queueing every writer behind our lock request
+            if getattr(e.orig, "sqlstate", None) != "55P03" or attempt == SWAP_ATTEMPTS - 1:
+                raise
+            time.sleep(1 + attempt)
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+
+        _create_partitioned_tables()
+        _create_mirror_triggers("items")
+        _copy(
+            conn,
+            f"SELECT {_cols(ITEM_COLUMNS)} FROM items WHERE id > CAST(:after AS uuid) "
+            "ORDER BY id LIMIT :limit FOR SHARE",
+            "items_part",
+            ITEM_COLUMNS,
+        )
+
+        # items_part is complete and mirrored from here on, and item_field_values_part is
+        # still empty, so the composite FK is added without a validation scan
+        op.execute("""
+            ALTER TABLE item_field_values_part ADD CONSTRAINT item_field_values_item_fkey
+            FOREIGN KEY (collection_id, item_id) REFERENCES items_part (collection_id, id) ON DELETE CASCADE
+        """)
+        _create_mirror_triggers("item_field_values")
+        _copy(
+            conn,
+            "SELECT v.id, i.collection_id, v.item_id, v.field_id, v.value_json "
+            "FROM item_field_values v JOIN items i ON i.id = v.item_id "
+            "WHERE v.id > CAST(:after AS uuid) ORDER BY v.id LIMIT :limit FOR SHARE OF v",
+            "item_field_values_part",
+            VALUE_COLUMNS,
+        )
+
+        _swap(conn)
+        op.execute("DROP FUNCTION item_field_values_mirror()")
+        op.execute("DROP FUNCTION items_mirror()")
+        op.execute("ANALYZE items")
+        op.execute("ANALYZE item_field_values")
+
+
+def downgrade() -> None:
+    # offline: back to plain tables in one transaction
+    op.execute("""
+        CREATE TABLE items_plain (LIKE items INCLUDING DEFAULTS);
+        INSERT INTO items_plain SELECT * FROM items;
+        CREATE TABLE item_field_values_plain AS
+            SELECT id, item_id, field_id, value_json FROM item_field_values;
+        DROP TABLE item_field_values;
+        DROP TABLE items;
+
+        ALTER TABLE items_plain RENAME TO items;
+        ALTER TABLE items ADD CONSTRAINT items_pkey PRIMARY KEY (id);
+        ALTER TABLE items ADD CONSTRAINT items_collection_id_fkey FOREIGN KEY (collection_id)
+            REFERENCES collections (id) ON DELETE CASCADE;
+        CREATE INDEX ix_items_collection_id ON items (collection_id);
+        CREATE INDEX ix_items_cover_image_url ON items (cover_image_url);
+        CREATE INDEX ix_items_source_external_id ON items (source, external_id);
+
+        ALTER TABLE item_field_values_plain RENAME TO item_field_values;
+        ALTER TABLE item_field_values ALTER COLUMN item_id SET NOT NULL,
+            ALTER COLUMN field_id SET NOT NULL, ALTER COLUMN value_json SET NOT NULL;
+        ALTER TABLE item_field_values ADD CONSTRAINT item_field_values_pkey PRIMARY KEY (id);
+        ALTER TABLE item_field_values ADD CONSTRAINT item_field_values_item_id_fkey FOREIGN KEY (item_id)
+            REFERENCES items (id) ON DELETE CASCADE;
+        ALTER TABLE item_field_values ADD CONSTRAINT item_field_values_field_id_fkey FOREIGN KEY (field_id)
+            REFERENCES collection_fields (id) ON DELETE CASCADE;
+        CREATE INDEX ix_item_field_values_item_id ON item_field_values (item_id);
+        CREATE INDEX ix_item_field_values_field_id ON item_field_values (field_id);
+    """)
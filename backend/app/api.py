@@ -1,29 +1,60 @@
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import delete, tuple_
 from sqlalchemy.orm import Session
 from fastapi import Response
 import os
 import httpx
 from fastapi import Query
-from pydantic import BaseModel
+from pydantic import TypeAdapter, ValidationError
+from app.clone import clone_collection
 from app.db import get_db
+from app.images import queue_image
+from app.enrichment import mark_collection_stale, queue_refresh
+from app.field_migrations import migration_accepted, start_delete, start_retype
+from app.jobs import accepted
+from app.purge import is_large, soft_delete_collection
+from app.ranks import first_rank, last_rank, move
+from app.sync import record_change
+from app.options import encode, option_counts, rename_option, sync_configured_options
+from app.values import value_view
+from app.providers import (
+    ANILIST_URL,
+    RAWG_API_URL,
+    TMDB_API_URL,
+    normalize_anilist,
+    normalize_rawg,
+    normalize_tmdb,
+)
 from app.models import (
     User,
     Collection,
     CollectionField,
+    FieldMigration,
     Item,
     ItemFieldValue,
 )
 from app.schemas import (
+    BatchOperation,
+    BatchRequest,
+    BatchResult,
+    CollectionClone,
     CollectionCreate,
     CollectionOut,
+    CollectionUpdate,
     CollectionFieldCreate,
     CollectionFieldOut,
+    CollectionFieldUpdate,
+    FieldMigrationOut,
+    FieldOptionOut,
+    FieldOptionUpdate,
     ItemCreate,
     ItemOut,
+    ItemUpdate,
     ItemFieldValueUpsert,
     ItemFieldValueOut,
+    MoveRequest,
     RegisterRequest,
     LoginRequest,
     TokenPair,
@@ -36,10 +67,10 @@ from app.auth import (
     create_refresh_token,
     decode_token,
     get_current_user,
+    get_read_db,
 )
 
 router = APIRouter()
-ANILIST_URL = "https://graphql.anilist.co"
 
 QUERY = """
 query ($search: String) {
@@ -58,23 +89,91 @@ query ($search: String) {
 
 def get_owned_collection(db: Session, collection_id: UUID, owner_id: UUID) -> Collection:
     col = db.get(Collection, collection_id)
-    if not col or col.owner_id != owner_id:
+    if not col or col.owner_id != owner_id or col.deleted_at is not None:
         raise HTTPException(status_code=404, detail="Collection not found")
     return col
 
 
+def get_owned_item(db: Session, item_id: UUID, owner_id: UUID) -> Item:
+    # by id alone this probes every items partition's primary key index; routes that
+    # know the collection should filter on it instead
+    item = db.get(Item, item_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
+
+    col = db.get(Collection, item.collection_id)
+    if not col or col.owner_id != owner_id or col.deleted_at is not None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return item
+
+
+def get_owned_field(db: Session, field_id: UUID, owner_id: UUID, *, include_deleted: bool = False, lock: bool = False) -> CollectionField:
+    field = db.get(CollectionField, field_id, with_for_update=lock)
+    if not field or (field.deleted_at is not None and not include_deleted):
+        raise HTTPException(status_code=404, detail="Field not found")
+
+    col = db.get(Collection, field.collection_id)
+    if not col or col.owner_id != owner_id or col.deleted_at is not None:
+        raise HTTPException(status_code=404, detail="Field not found")
+    return field
+
+
+# The _apply_* helpers do the work of one write without committing, so the
+# single-object routes and POST /batch share them.
+
+
 # -------------------------
 # Collections
 # -------------------------
 
+def _apply_create_collection(db: Session, user: User, payload: CollectionCreate) -> Collection:
+    c = Collection(owner_id=user.id, name=payload.name, description=payload.description,collection_type=payload.collection_type,icon_url=payload.icon_url,)
+    c.icon_hash = queue_image(db, c.icon_url)
+    db.add(c)
+    db.flush()
+    record_change(db, user.id, "collection", c.id, collection_id=c.id)
+    return c
+
+
+def _apply_update_collection(db: Session, user: User, collection_id: UUID, payload: CollectionUpdate) -> Collection:
+    col = get_owned_collection(db, collection_id, user.id)
+
+    if payload.name is not None:
+        col.name = payload.name
+    if payload.description is not None:
+        col.description = payload.description
+    if payload.icon_url is not None and payload.icon_url != col.icon_url:
+        col.icon_url = payload.icon_url
+        col.icon_hash = queue_image(db, col.icon_url)
+    if payload.collection_type is not None:
+        col.collection_type = payload.collection_type
+
+    db.flush()
+    record_change(db, user.id, "collection", col.id, collection_id=col.id)
+    return col
+
+
+def _apply_delete_collection(db: Session, user: User, collection_id: UUID) -> UUID | None:
+    """Deletes via ON DELETE CASCADE, or soft-deletes and returns the purge job id for large collections."""
+    col = get_owned_collection(db, collection_id, user.id)
+
+    job_id = None
+    if is_large(db, col.id):
+        job_id = soft_delete_collection(db, col)
+    else:
+        db.execute(delete(Collection).where(Collection.id == col.id))
+    db.flush()
+    record_change(db, user.id, "collection", collection_id, "delete", collection_id)
+    return job_id
+
+
 @router.post("/collections", response_model=CollectionOut)
 def create_collection(
     payload: CollectionCreate,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    c = Collection(owner_id=current_user.id, name=payload.name, description=payload.description,collection_type=payload.collection_type,)
-    db.add(c)
+    c = _apply_create_collection(db, current_user, payload)
     db.commit()
     db.refresh(c)
     return c
@@ -83,11 +182,11 @@ def create_collection(
 @router.get("/collections", response_model=list[CollectionOut])
 def list_collections(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     return (
         db.query(Collection)
-        .filter(Collection.owner_id == current_user.id)
+        .filter(Collection.owner_id == current_user.id, Collection.deleted_at.is_(None))
         .order_by(Collection.created_at.desc())
         .all()
     )
@@ -98,32 +197,40 @@ def delete_collection(
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    col = db.get(Collection, collection_id)
-    if not col or col.owner_id != user.id:
-        raise HTTPException(status_code=404, detail="Collection not found")
-
-    db.delete(col)
+    job_id = _apply_delete_collection(db, user, collection_id)
     db.commit()
+    if job_id is not None:
+        return accepted(job_id)
     return Response(status_code=204)
 
-# -------------------------
-# Fields
-# -------------------------
 
-@router.post("/collections/{collection_id}/fields", response_model=CollectionFieldOut)
-def create_field(
+@router.post("/collections/{collection_id}/clone", response_model=CollectionOut)
+def clone_collection_route(
     collection_id: UUID,
-    payload: CollectionFieldCreate,
-    current_user: User = Depends(get_current_user),
+    payload: CollectionClone,
+    user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    col = get_owned_collection(db, collection_id, current_user.id)
+    src = get_owned_collection(db, collection_id, user.id)
+    name = payload.name or f"{src.name} (copy)"[:120]
+    c = clone_collection(db, src, user.id, name, payload.include_items)
+    db.commit()
+    db.refresh(c)
+    return c
+
+# -------------------------
+# Fields
+# -------------------------
+
+def _apply_create_field(db: Session, user: User, collection_id: UUID, payload: CollectionFieldCreate) -> CollectionField:
+    col = get_owned_collection(db, collection_id, user.id)
 
     existing = (
         db.query(CollectionField)
         .filter(
             CollectionField.collection_id == col.id,
             CollectionField.field_key == payload.field_key,
+            CollectionField.deleted_at.is_(None),
         )
         .first()
     )
@@ -137,9 +244,24 @@ def create_field(
         data_type=payload.data_type,
         required=payload.required,
         sort_order=payload.sort_order,
+        rank=last_rank(db, CollectionField, col.id),
         options_json=payload.options_json,
     )
     db.add(f)
+    db.flush()
+    sync_configured_options(db, f)
+    record_change(db, user.id, "field", f.id, collection_id=col.id)
+    return f
+
+
+@router.post("/collections/{collection_id}/fields", response_model=CollectionFieldOut)
+def create_field(
+    collection_id: UUID,
+    payload: CollectionFieldCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    f = _apply_create_field(db, current_user, collection_id, payload)
     db.commit()
     db.refresh(f)
     return f
@@ -149,57 +271,305 @@ def create_field(
 def list_fields(
     collection_id: UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     col = get_owned_collection(db, collection_id, current_user.id)
 
     return (
         db.query(CollectionField)
-        .filter(CollectionField.collection_id == col.id)
-        .order_by(CollectionField.sort_order.asc(), CollectionField.created_at.asc())
+        .filter(CollectionField.collection_id == col.id, CollectionField.deleted_at.is_(None))
+        .order_by(CollectionField.rank.asc(), CollectionField.id.asc())
         .all()
     )
 
 
-# -------------------------
-# Items
-# -------------------------
+def _apply_update_field(db: Session, user: User, field_id: UUID, payload: CollectionFieldUpdate) -> tuple[CollectionField, FieldMigration | None]:
+    """Metadata changes apply at once; a data_type change returns the migration it started."""
+    # row lock: waits for in-flight value writes, which hold the field FOR SHARE
+    f = get_owned_field(db, field_id, user.id, lock=True)
 
-@router.post("/collections/{collection_id}/items", response_model=ItemOut)
-def create_item(
-    collection_id: UUID,
-    payload: ItemCreate,
+    if payload.field_key is not None and payload.field_key != f.field_key:
+        taken = (
+            db.query(CollectionField)
+            .filter(
+                CollectionField.collection_id == f.collection_id,
+                CollectionField.field_key == payload.field_key,
+                CollectionField.deleted_at.is_(None),
+            )
+            .first()
+        )
+        if taken:
+            raise HTTPException(status_code=409, detail="field_key already exists in this collection")
+        f.field_key = payload.field_key
+    if payload.label is not None:
+        f.label = payload.label
+    if payload.required is not None:
+        f.required = payload.required
+    if payload.sort_order is not None:
+        f.sort_order = payload.sort_order
+    if payload.options_json is not None:
+        f.options_json = payload.options_json
+        sync_configured_options(db, f)
+
+    migration = None
+    if payload.data_type is not None and payload.data_type != f.data_type:
+        if f.pending_data_type is not None:
+            raise HTTPException(status_code=409, detail="A data_type migration is already running for this field")
+        migration = start_retype(db, f, payload.data_type, user.id)
+
+    db.flush()
+    record_change(db, user.id, "field", f.id, collection_id=f.collection_id)
+    return f, migration
+
+
+def _apply_delete_field(db: Session, user: User, field_id: UUID) -> FieldMigration | None:
+    f = get_owned_field(db, field_id, user.id, lock=True)
+    collection_id = f.collection_id
+    migration = start_delete(db, f, user.id)
+    db.flush()
+    record_change(db, user.id, "field", field_id, "delete", collection_id)
+    return migration
+
+
+@router.patch("/fields/{field_id}", response_model=CollectionFieldOut)
+def update_field(
+    field_id: UUID,
+    payload: CollectionFieldUpdate,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    col = get_owned_collection(db, collection_id, current_user.id)
+    """Renames and option edits are immediate. A data_type change answers 202 and converts
+    the values in the background; GET /fields/{id}/migration reports progress."""
+    f, migration = _apply_update_field(db, current_user, field_id, payload)
+    db.commit()
+    if migration is not None:
+        return migration_accepted(migration)
+    db.refresh(f)
+    return f
+
+
+@router.delete("/fields/{field_id}", status_code=204)
+def delete_field(
+    field_id: UUID,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    migration = _apply_delete_field(db, current_user, field_id)
+    db.commit()
+    if migration is not None:
+        return migration_accepted(migration)
+    return Response(status_code=204)
+
+
+@router.post("/fields/{field_id}/move", response_model=CollectionFieldOut)
+def move_field(
+    field_id: UUID,
+    payload: MoveRequest,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    f = get_owned_field(db, field_id, user.id)
+    _apply_move(db, user, f, payload)
+    db.commit()
+    db.refresh(f)
+    return f
+
+
+@router.get("/fields/{field_id}/options", response_model=list[FieldOptionOut])
+def list_field_options(
+    field_id: UUID,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    """The field's select options with how many values choose each."""
+    f = get_owned_field(db, field_id, current_user.id)
+    return option_counts(db, f)
+
+
+@router.patch("/fields/{field_id}/options/{code}", response_model=FieldOptionOut)
+def update_field_option(
+    field_id: UUID,
+    code: int,
+    payload: FieldOptionUpdate,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Renames an option; values store its code, so none of them is rewritten."""
+    f = get_owned_field(db, field_id, user.id, lock=True)
+    try:
+        option = rename_option(db, f, code, payload.label)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Option not found")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    record_change(db, user.id, "field", f.id, collection_id=f.collection_id)
+    db.commit()
+    return FieldOptionOut.model_validate(option)
+
+
+@router.get("/fields/{field_id}/migration", response_model=FieldMigrationOut)
+def get_field_migration(
+    field_id: UUID,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    get_owned_field(db, field_id, current_user.id, include_deleted=True)
+    m = (
+        db.query(FieldMigration)
+        .filter(FieldMigration.field_id == field_id)
+        .order_by(FieldMigration.created_at.desc())
+        .first()
+    )
+    if not m:
+        raise HTTPException(status_code=404, detail="No migration for this field")
+    return m
+
+
+# -------------------------
+# Items
+# -------------------------
+
+def _apply_create_item(db: Session, user: User, collection_id: UUID, payload: ItemCreate) -> Item:
+    col = get_owned_collection(db, collection_id, user.id)
 
     item = Item(
         collection_id=col.id,
         title=payload.title,
         notes=payload.notes,
         cover_image_url=payload.cover_image_url,
+        cover_image_hash=queue_image(db, payload.cover_image_url),
+        source=payload.source,
+        external_id=payload.external_id,
+        # newest first unless moved
+        rank=first_rank(db, Item, col.id),
     )
+    if item.source and item.external_id:
+        queue_refresh(db, item.source)
     db.add(item)
+    db.flush()
+    record_change(db, user.id, "item", item.id, collection_id=col.id)
+    return item
+
+
+def _apply_update_item(db: Session, user: User, item_id: UUID, payload: ItemUpdate) -> Item:
+    item = get_owned_item(db, item_id, user.id)
+
+    if payload.title is not None:
+        item.title = payload.title
+    if payload.notes is not None:
+        item.notes = payload.notes
+    if payload.cover_image_url is not None and payload.cover_image_url != item.cover_image_url:
+        item.cover_image_url = payload.cover_image_url
+        item.cover_image_hash = queue_image(db, item.cover_image_url)
+
+    db.flush()
+    record_change(db, user.id, "item", item.id, collection_id=item.collection_id)
+    return item
+
+
+def _apply_delete_item(db: Session, user: User, item_id: UUID) -> None:
+    item = get_owned_item(db, item_id, user.id)
+    collection_id = item.collection_id
+    db.execute(delete(Item).where(Item.collection_id == collection_id, Item.id == item_id))
+    db.flush()
+    record_change(db, user.id, "item", item_id, "delete", collection_id)
+
+
+@router.post("/collections/{collection_id}/items", response_model=ItemOut)
+def create_item(
+    collection_id: UUID,
+    payload: ItemCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    item = _apply_create_item(db, current_user, collection_id, payload)
     db.commit()
     db.refresh(item)
     return item
 
 
+def _parse_cursor(cursor: str) -> tuple[str, UUID]:
+    rank, _, item_id = cursor.rpartition(".")
+    try:
+        return rank, UUID(item_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @router.get("/collections/{collection_id}/items", response_model=list[ItemOut])
 def list_items(
+    collection_id: UUID,
+    response: Response,
+    limit: int | None = Query(default=None, ge=1, le=1000),
+    cursor: str | None = Query(default=None, max_length=200),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+):
+    """Items in rank order. With limit, pages by keyset on (rank, id); X-Next-Cursor
+    carries the cursor for the next page while there is one."""
+    col = get_owned_collection(db, collection_id, current_user.id)
+
+    q = db.query(Item).filter(Item.collection_id == col.id)
+    if cursor is not None:
+        q = q.filter(tuple_(Item.rank, Item.id) > tuple_(*_parse_cursor(cursor)))
+    q = q.order_by(Item.rank.asc(), Item.id.asc())
+    if limit is None:
+        return q.all()
+
+    items = q.limit(limit).all()
+    if len(items) == limit:
+        response.headers["X-Next-Cursor"] = f"{items[-1].rank}.{items[-1].id}"
+    return items
+
+
+def _apply_move(db: Session, user: User, row: Item | CollectionField, payload: MoveRequest) -> None:
+    if payload.after_id is None and payload.before_id is None:
+        raise HTTPException(status_code=422, detail="after_id or before_id is required")
+    try:
+        move(db, row, payload.after_id, payload.before_id, user.id)
+    except LookupError:
+        raise HTTPException(status_code=422, detail="after_id and before_id must be in the same collection")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    db.flush()
+    record_change(db, user.id, "item" if isinstance(row, Item) else "field", row.id, collection_id=row.collection_id)
+
+
+@router.post("/items/{item_id}/move", response_model=ItemOut)
+def move_item(
+    item_id: UUID,
+    payload: MoveRequest,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    item = get_owned_item(db, item_id, user.id)
+    _apply_move(db, user, item, payload)
+    db.commit()
+    db.refresh(item)
+    return item
+
+@router.post("/collections/{collection_id}/refresh-metadata", status_code=202)
+def refresh_collection_metadata(
     collection_id: UUID,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     col = get_owned_collection(db, collection_id, current_user.id)
+    sources = mark_collection_stale(db, col.id)
+    db.commit()
+    return {"queued": sources}
 
-    return (
-        db.query(Item)
-        .filter(Item.collection_id == col.id)
-        .order_by(Item.created_at.desc())
-        .all()
-    )
+@router.patch("/items/{item_id}", response_model=ItemOut)
+def update_item(
+    item_id: UUID,
+    payload: ItemUpdate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    item = _apply_update_item(db, current_user, item_id, payload)
+    db.commit()
+    db.refresh(item)
+    return item
 
 @router.delete("/items/{item_id}")
 def delete_item(
@@ -207,15 +577,7 @@ def delete_item(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    item = db.get(Item, item_id)
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
-
-    col = db.get(Collection, item.collection_id)
-    if not col or col.owner_id != current_user.id:
-        raise HTTPException(status_code=404, detail="Item not found")
-
-    db.delete(item)
+    _apply_delete_item(db, current_user, item_id)
     db.commit()
     return {"ok": True}
 
@@ -224,74 +586,81 @@ def delete_item(
 # Item field values
 # -------------------------
 
-@router.post("/items/{item_id}/values", response_model=list[ItemFieldValueOut])
-def upsert_item_values(
-    item_id: UUID,
-    payload: list[ItemFieldValueUpsert],
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-):
+def _item_values(db: Session, item: Item) -> list[dict]:
+    rows = (
+        db.query(ItemFieldValue, CollectionField)
+        .join(CollectionField, ItemFieldValue.field_id == CollectionField.id)
+        .filter(
+            ItemFieldValue.collection_id == item.collection_id,
+            ItemFieldValue.item_id == item.id,
+            CollectionField.deleted_at.is_(None),
+        )
+        .all()
+    )
+
+    return [value_view(v, f) for (v, f) in rows]
+
+
+def _apply_upsert_values(db: Session, user: User, item_id: UUID, payload: list[ItemFieldValueUpsert]) -> list[dict]:
     item = db.get(Item, item_id)
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
 
     # verify ownership via collection
-    col = get_owned_collection(db, item.collection_id, current_user.id)
+    col = get_owned_collection(db, item.collection_id, user.id)
 
+    # FOR SHARE: a concurrent retype cut-over waits for this write, and this write
+    # sees the field's type as of after it, so value_json never misses a representation
     fields = (
         db.query(CollectionField)
-        .filter(CollectionField.collection_id == col.id)
+        .filter(CollectionField.collection_id == col.id, CollectionField.deleted_at.is_(None))
+        .with_for_update(read=True)
         .all()
     )
     field_by_key = {f.field_key: f for f in fields}
 
-    results: list[ItemFieldValue] = []
-
+    touched: list[ItemFieldValue] = []
     for entry in payload:
         f = field_by_key.get(entry.field_key)
         if not f:
             raise HTTPException(status_code=400, detail=f"Unknown field_key: {entry.field_key}")
 
-        new_value = {"value": entry.value}
+        columns = encode(db, f, entry.value)
 
         existing = (
             db.query(ItemFieldValue)
-            .filter(ItemFieldValue.item_id == item_id, ItemFieldValue.field_id == f.id)
+            .filter(
+                ItemFieldValue.collection_id == col.id,
+                ItemFieldValue.item_id == item_id,
+                ItemFieldValue.field_id == f.id,
+            )
             .first()
         )
         if existing:
-            existing.value_json = new_value
-            results.append(existing)
+            for name, column_value in columns.items():
+                setattr(existing, name, column_value)
+            touched.append(existing)
         else:
-            v = ItemFieldValue(item_id=item_id, field_id=f.id, value_json=new_value)
+            v = ItemFieldValue(collection_id=col.id, item_id=item_id, field_id=f.id, **columns)
             db.add(v)
-            results.append(v)
+            touched.append(v)
 
+    db.flush()
+    for v in touched:
+        record_change(db, user.id, "value", v.id, collection_id=col.id)
+    return _item_values(db, item)
 
-    db.commit()
-    for r in results:
-        db.refresh(r)
-
-    rows = (
-        db.query(ItemFieldValue, CollectionField)
-        .join(CollectionField, ItemFieldValue.field_id == CollectionField.id)
-        .filter(ItemFieldValue.item_id == item_id)
-        .all()
-    )
 
-    return [
-        {
-            "id": v.id,
-            "item_id": v.item_id,
-            "field_id": v.field_id,
-            "field_key": f.field_key,
-            "label": f.label,
-            "data_type": f.data_type,
-            "value": (v.value_json or {}).get("value"),
-            "value_json": v.value_json,
-        }
-        for (v, f) in rows
-    ]
+@router.post("/items/{item_id}/values", response_model=list[ItemFieldValueOut])
+def upsert_item_values(
+    item_id: UUID,
+    payload: list[ItemFieldValueUpsert],
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    rows = _apply_upsert_values(db, current_user, item_id, payload)
+    db.commit()
+    return rows
 
 
 
@@ -299,38 +668,118 @@ def upsert_item_values(
 def list_item_values(
     item_id: UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    item = db.get(Item, item_id)
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
+    item = get_owned_item(db, item_id, current_user.id)
+    return _item_values(db, item)
 
-    col = db.get(Collection, item.collection_id)
-    if not col or col.owner_id != current_user.id:
-        raise HTTPException(status_code=404, detail="Item not found")
 
-    rows = (
-        db.query(ItemFieldValue, CollectionField)
-        .join(CollectionField, ItemFieldValue.field_id == CollectionField.id)
-        .filter(ItemFieldValue.item_id == item_id)
-        .all()
-    )
+# -------------------------
+# Batch
+# -------------------------
+
+BATCH_OPS = {
+    "create_collection": CollectionCreate,
+    "update_collection": CollectionUpdate,
+    "delete_collection": None,
+    "create_field": CollectionFieldCreate,
+    "update_field": CollectionFieldUpdate,
+    "delete_field": None,
+    "create_item": ItemCreate,
+    "update_item": ItemUpdate,
+    "delete_item": None,
+    "upsert_values": list[ItemFieldValueUpsert],
+}
 
-    return [
-        {
-            "id": v.id,
-            "item_id": v.item_id,
-            "field_id": v.field_id,
-            "field_key": f.field_key,
-            "label": f.label,
-            "data_type": f.data_type,
-            "value": (v.value_json or {}).get("value"),
-            "value_json": v.value_json,
-        }
-        for (v, f) in rows
-    ]
 
+def _resolve_id(raw: str | None, refs: dict[str, UUID], name: str) -> UUID:
+    """Accepts a UUID or "$ref" naming an object created earlier in the batch."""
+    if raw is None:
+        raise HTTPException(status_code=422, detail=f"{name} is required")
+    if raw.startswith("$"):
+        if raw[1:] not in refs:
+            raise HTTPException(status_code=422, detail=f"Unknown reference: {raw}")
+        return refs[raw[1:]]
+    try:
+        return UUID(raw)
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Invalid {name}: {raw}")
+
+
+def _run_batch_op(db: Session, user: User, op: BatchOperation, refs: dict[str, UUID]) -> tuple[UUID | None, object]:
+    schema = BATCH_OPS[op.op]
+    data = TypeAdapter(schema).validate_python(op.data if op.data is not None else {}) if schema else None
+
+    if op.op == "create_collection":
+        c = _apply_create_collection(db, user, data)
+        return c.id, CollectionOut.model_validate(c)
+    if op.op == "update_collection":
+        c = _apply_update_collection(db, user, _resolve_id(op.collection_id, refs, "collection_id"), data)
+        return c.id, CollectionOut.model_validate(c)
+    if op.op == "delete_collection":
+        collection_id = _resolve_id(op.collection_id, refs, "collection_id")
+        job_id = _apply_delete_collection(db, user, collection_id)
+        return collection_id, {"job_id": job_id} if job_id else None
+    if op.op == "create_field":
+        f = _apply_create_field(db, user, _resolve_id(op.collection_id, refs, "collection_id"), data)
+        return f.id, CollectionFieldOut.model_validate(f)
+    if op.op == "update_field":
+        f, migration = _apply_update_field(db, user, _resolve_id(op.field_id, refs, "field_id"), data)
+        if migration is not None:
+            return f.id, {"job_id": migration.job_id, "migration_id": migration.id}
+        return f.id, CollectionFieldOut.model_validate(f)
+    if op.op == "delete_field":
+        field_id = _resolve_id(op.field_id, refs, "field_id")
+        migration = _apply_delete_field(db, user, field_id)
+        return field_id, {"job_id": migration.job_id, "migration_id": migration.id} if migration else None
+    if op.op == "create_item":
+        item = _apply_create_item(db, user, _resolve_id(op.collection_id, refs, "collection_id"), data)
+        return item.id, ItemOut.model_validate(item)
+    if op.op == "update_item":
+        item = _apply_update_item(db, user, _resolve_id(op.item_id, refs, "item_id"), data)
+        return item.id, ItemOut.model_validate(item)
+    if op.op == "delete_item":
+        item_id = _resolve_id(op.item_id, refs, "item_id")
+        _apply_delete_item(db, user, item_id)
+        return item_id, None
+    if op.op == "upsert_values":
+        item_id = _resolve_id(op.item_id, refs, "item_id")
+        return item_id, [ItemFieldValueOut.model_validate(r) for r in _apply_upsert_values(db, user, item_id, data)]
+    raise HTTPException(status_code=422, detail=f"Unknown op: {op.op}")
+
+
+@router.post("/batch", response_model=list[BatchResult])
+def run_batch(
+    payload: BatchRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Runs the operations in order in one transaction; any failure rolls back all of them."""
+    refs: dict[str, UUID] = {}
+    results: list[BatchResult] = []
+
+    for index, op in enumerate(payload.operations):
+        try:
+            object_id, result = _run_batch_op(db, current_user, op, refs)
+        except HTTPException as e:
+            db.rollback()
+            raise HTTPException(
+                status_code=e.status_code,
+                detail={"index": index, "op": op.op, "ref": op.ref, "detail": e.detail},
+            )
+        except ValidationError as e:
+            db.rollback()
+            raise HTTPException(
+                status_code=422,
+                detail={"index": index, "op": op.op, "ref": op.ref, "detail": e.errors(include_url=False)},
+            )
+
+        if op.ref:
+            refs[op.ref] = object_id
+        results.append(BatchResult(index=index, op=op.op, ref=op.ref, id=object_id, result=result))
 
+    db.commit()
+    return results
 
 
 # -------------------------
@@ -400,7 +849,7 @@ def search_games(
     if not key:
         raise HTTPException(status_code=500, detail="RAWG_API_KEY not set")
 
-    url = "https://api.rawg.io/api/games"
+    url = f"{RAWG_API_URL}/games"
     params = {"key": key, "search": q, "page_size": 10}
 
     with httpx.Client(timeout=10) as client:
@@ -408,17 +857,7 @@ def search_games(
         r.raise_for_status()
         data = r.json()
 
-    results = []
-    for g in data.get("results", []):
-        results.append({
-            "source": "rawg",
-            "external_id": g.get("id"),
-            "title": g.get("name"),
-            "cover_url": g.get("background_image"),
-            "released": g.get("released"),
-        })
-
-    return results
+    return [normalize_rawg(g) for g in data.get("results", [])]
 
 
 @router.get("/search/movies")
@@ -430,7 +869,7 @@ def search_movies(
     if not key:
         raise HTTPException(status_code=500, detail="TMDB_API_KEY not set")
 
-    url = "https://api.themoviedb.org/3/search/movie"
+    url = f"{TMDB_API_URL}/search/movie"
     params = {"api_key": key, "query": q, "include_adult": "false"}
 
     with httpx.Client(timeout=10) as client:
@@ -438,20 +877,7 @@ def search_movies(
         r.raise_for_status()
         data = r.json()
 
-    results = []
-    for m in data.get("results", [])[:10]:
-        poster = m.get("poster_path")
-        cover_url = f"https://image.tmdb.org/t/p/w500{poster}" if poster else None
-
-        results.append({
-            "source": "tmdb",
-            "external_id": m.get("id"),
-            "title": m.get("title"),
-            "cover_url": cover_url,
-            "released": m.get("release_date"),
-        })
-
-    return results
+    return [normalize_tmdb(m) for m in data.get("results", [])[:10]]
 
 
 @router.get("/search/anime")
@@ -469,32 +895,8 @@ def search_anime(
         data = r.json()
 
     media = data.get("data", {}).get("Page", {}).get("media", []) or []
-    out = []
-    for m in media:
-        title = (m.get("title") or {})
-        start = (m.get("startDate") or {})
-        released = "-".join(
-            [str(x).zfill(2) for x in [start.get("year"), start.get("month"), start.get("day")] if x]
-        ) or None
-
-        out.append({
-            "source": "anilist",          # match your other endpoints naming
-            "external_id": m.get("id"),   # match your other endpoints naming
-            "title": title.get("english") or title.get("romaji") or title.get("native") or "",
-            "cover_url": (m.get("coverImage") or {}).get("large"),
-            "released": released,
-            "episodes": m.get("episodes"),
-            "score": m.get("averageScore"),
-        })
-
-    return out
-
-
-class CollectionUpdate(BaseModel):
-    name: str | None = None
-    description: str | None = None
-    icon_url: str | None = None
-    collection_type: str | None = None
+    return [normalize_anilist(m) for m in media]
+
 
 @router.patch("/collections/{collection_id}", response_model=CollectionOut)
 def update_collection(
@@ -503,17 +905,7 @@ def update_collection(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    col = get_owned_collection(db, collection_id, current_user.id)
-
-    if payload.name is not None:
-        col.name = payload.name
-    if payload.description is not None:
-        col.description = payload.description
-    if payload.icon_url is not None:
-        col.icon_url = payload.icon_url
-    if payload.collection_type is not None:
-        col.collection_type = payload.collection_type
-
+    col = _apply_update_collection(db, current_user, collection_id, payload)
     db.commit()
     db.refresh(col)
-    return col
\ No newline at end of file
+    return col
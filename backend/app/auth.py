@@ -3,13 +3,13 @@ from datetime import datetime, timedelta, timezone
 from typing import Any
 from uuid import UUID
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
-from app.db import get_db
+from app.db import READ_PIN_HEADER, ReadSessionLocal, get_db, reads_pinned_to_primary
 from app.models import User
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -18,6 +18,8 @@ JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "dev-only-change-me")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+# comma-separated; these users may call the /admin/* routes
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
@@ -66,6 +68,38 @@ def decode_token(token: str) -> dict[str, Any]:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
 
+def access_claims(token: str) -> tuple[UUID, int]:
+    """User id and expiry (epoch seconds) of an access token, without touching the database."""
+    payload = decode_token(token)
+    if payload.get("type") != "access":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Wrong token type")
+    try:
+        return UUID(payload.get("sub") or ""), int(payload["exp"])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token subject")
+
+
+def owner_from_token(token: str) -> UUID:
+    """User id from an access token, without touching the database."""
+    return access_claims(token)[0]
+
+
+def get_token_claims(request: Request) -> tuple[UUID, int]:
+    """Like get_current_user but DB-free, for long-lived connections; also accepts ?access_token=.
+
+    Returns the user id and the token's expiry, past which the connection must end.
+    """
+    header = request.headers.get("authorization", "")
+    token = header[7:] if header.lower().startswith("bearer ") else request.query_params.get("access_token")
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return access_claims(token)
+
+
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
     payload = decode_token(token)
     if payload.get("type") != "access":
@@ -83,4 +117,32 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     user = db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    # lets the session pin this user's follow-up reads to the primary after a write
+    db.info["owner_id"] = user.id
     return user
+
+
+def get_admin_user(current_user: User = Depends(get_current_user)) -> User:
+    if current_user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
+    return current_user
+
+
+def get_read_db(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+) -> Session:
+    """Session for read-only routes: the replica, unless the user has just written."""
+    if reads_pinned_to_primary(current_user.id, request.headers.get(READ_PIN_HEADER)):
+        yield db
+        return
+
+    # the primary session was only needed for auth; hand its connection back to the pool
+    # (closing detaches current_user but keeps its loaded attributes)
+    db.close()
+    read_db = ReadSessionLocal()
+    try:
+        yield read_db
+    finally:
+        read_db.close()
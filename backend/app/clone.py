@@ -0,0 +1,90 @@
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.models import Collection
+from app.sync import record_change
+
+# A clone is one INSERT ... SELECT statement; no row passes through Python. Its
+# sub-statements share a snapshot, so items or values written to the source meanwhile
+# are either copied whole or not at all, and the foreign keys are checked once at the
+# end, after every copy is in.
+#
+# Copies get their ids from md5(<new collection id> || <old id>): a deterministic
+# remap, so values find their copied item and field without a mapping table, and two
+# clones of one collection never share ids. Every copied row is also logged in
+# change_log for GET /sync.
+CLONE_SQL = text("""
+    WITH new_fields AS (
+        INSERT INTO collection_fields (
+            id, collection_id, field_key, label, data_type, required, sort_order, rank, options_json
+        )
+        SELECT md5(CAST(:new AS text) || f.id::text)::uuid, :new,
+               f.field_key, f.label, f.data_type, f.required, f.sort_order, f.rank, f.options_json
+        FROM collection_fields f
+        WHERE f.collection_id = :src AND f.deleted_at IS NULL
+        RETURNING id
+    ),
+    new_options AS (
+        INSERT INTO collection_field_options (field_id, code, label)
+        SELECT md5(CAST(:new AS text) || o.field_id::text)::uuid, o.code, o.label
+        FROM collection_field_options o
+        JOIN collection_fields f ON f.id = o.field_id
+        WHERE f.collection_id = :src AND f.deleted_at IS NULL
+    ),
+    new_items AS (
+        INSERT INTO items (
+            id, collection_id, title, notes, cover_image_url, cover_image_hash,
+            source, external_id, metadata_json, metadata_refreshed_at, rank
+        )
+        SELECT md5(CAST(:new AS text) || i.id::text)::uuid, :new,
+               i.title, i.notes, i.cover_image_url, i.cover_image_hash,
+               i.source, i.external_id, i.metadata_json, i.metadata_refreshed_at, i.rank
+        FROM items i
+        WHERE i.collection_id = :src AND :with_items
+        RETURNING id
+    ),
+    -- a field in the middle of a retype is cloned with its current type only, so its
+    -- values are copied as they currently read (see app.values.effective_value)
+    new_values AS (
+        INSERT INTO item_field_values (id, collection_id, item_id, field_id, value_code, value_codes, value_json)
+        SELECT md5(CAST(:new AS text) || v.id::text)::uuid, :new,
+               md5(CAST(:new AS text) || v.item_id::text)::uuid,
+               md5(CAST(:new AS text) || v.field_id::text)::uuid,
+               -- option codes stay valid: the options are copied with the same codes
+               v.value_code, v.value_codes,
+               CASE
+                   WHEN v.value_json->>'t' IS NULL THEN v.value_json
+                   WHEN v.value_json->>'t' = f.data_type THEN json_build_object('value', v.value_json->'next')
+                   ELSE json_build_object('value', v.value_json->'value')
+               END
+        FROM item_field_values v
+        JOIN collection_fields f ON f.id = v.field_id AND f.deleted_at IS NULL
+        WHERE v.collection_id = :src AND :with_items
+        RETURNING id
+    )
+    INSERT INTO change_log (owner_id, entity, entity_id, collection_id, op)
+    SELECT :owner, 'field', id, :new, 'upsert' FROM new_fields
+    UNION ALL SELECT :owner, 'item', id, :new, 'upsert' FROM new_items
+    UNION ALL SELECT :owner, 'value', id, :new, 'upsert' FROM new_values
+""")
+
+
+def clone_collection(db: Session, src: Collection, owner_id: UUID, name: str, include_items: bool) -> Collection:
+    """Copies src's fields, and optionally its items and values, into a new collection
+    in the caller's transaction."""
+    c = Collection(
+        owner_id=owner_id,
+        name=name,
+        description=src.description,
+        collection_type=src.collection_type,
+        icon_url=src.icon_url,
+        icon_hash=src.icon_hash,
+    )
+    db.add(c)
+    db.flush()
+    record_change(db, owner_id, "collection", c.id, collection_id=c.id)
+
+    db.execute(CLONE_SQL, {"src": src.id, "new": c.id, "owner": owner_id, "with_items": include_items})
+    return c
@@ -0,0 +1,201 @@
+import os
+import zlib
+
+import anyio
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Accept-Encoding-negotiated compression of every response worth it. brotli and zstd
+# are used when their packages are installed; gzip always is. Streaming responses are
+# compressed chunk by chunk, each flushed so the client gets it right away.
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# below this, headers and framing outweigh the saving
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", "6"))
+# bodies at least this big are compressed in the threadpool rather than on the event
+# loop, where a large one (a /sync/snapshot) would stall every other request
+COMPRESSION_OFFLOAD_BYTES = int(os.getenv("COMPRESSION_OFFLOAD_BYTES", str(64 * 1024)))
+
+# media types with enough redundancy to be worth it; not event streams, whose
+# consumers expect each event as soon as it is sent
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html", "text/csv", "image/svg+xml")
+
+# preferred first when the client accepts several equally
+AVAILABLE_ENCODINGS = [
+    encoding for encoding, module in (("zstd", zstandard), ("br", brotli), ("gzip", zlib)) if module is not None
+]
+
+
+def negotiate(accept_encoding: str) -> str | None:
+    """The encoding to answer an Accept-Encoding header with; None for identity."""
+    weights: dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            weights[name.strip()] = q
+
+    best, best_q = None, 0.0
+    for encoding in AVAILABLE_ENCODINGS:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def is_compressible(content_type: str) -> bool:
+    return content_type.split(";", 1)[0].strip().lower() in COMPRESSIBLE_TYPES
+
+
+class StreamCompressor:
+    """Incremental compressor; compress(chunk) returns everything decodable so far."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "zstd":
+            self.obj = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        elif encoding == "br":
+            self.obj = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            # wbits 31: a gzip header and trailer around the deflate stream
+            self.obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "zstd":
+            return self.obj.compress(data) + self.obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        if self.encoding == "br":
+            return self.obj.process(data) + self.obj.flush()
+        return self.obj.compress(data) + self.obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "zstd":
+            return self.obj.compress(data) + self.obj.flush()
+        if self.encoding == "br":
+            return self.obj.process(data) + self.obj.finish()
+        return self.obj.compress(data) + self.obj.flush()
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    return StreamCompressor(encoding).finish(data)
+
+
+async def off_loop(fn, data: bytes) -> bytes:
+    """fn(data), run in the threadpool when data is big enough to block the loop."""
+    if len(data) >= COMPRESSION_OFFLOAD_BYTES:
+        return await anyio.to_thread.run_sync(fn, data)
+    return fn(data)
+
+
+def _header(headers, name: bytes) -> bytes | None:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def with_vary(headers: list[tuple[bytes, bytes]]) -> list[tuple[bytes, bytes]]:
+    """headers plus Vary: Accept-Encoding unless they already say so."""
+    vary = _header(headers, b"vary")
+    if vary is None:
+        return headers + [(b"vary", b"Accept-Encoding")]
+    if b"accept-encoding" in vary.lower() or vary.strip() == b"*":
+        return headers
+    return [(k, v) for k, v in headers if k.lower() != b"vary"] + [(b"vary", vary + b", Accept-Encoding")]
+
+
+def encoded_headers(headers, encoding: str, length: int | None) -> list[tuple[bytes, bytes]]:
+    """headers of a response re-encoded with encoding; length None for chunked."""
+    out = [(k, v) for k, v in headers if k.lower() not in (b"content-length", b"content-encoding", b"etag")]
+    out.append((b"content-encoding", encoding.encode()))
+    if length is not None:
+        out.append((b"content-length", str(length).encode()))
+    return with_vary(out)
+
+
+class CompressionMiddleware:
+    """Compresses compressible responses of at least COMPRESSION_MIN_BYTES.
+
+    Single-message bodies are compressed in one go and keep a Content-Length; streamed
+    bodies are compressed as they arrive and sent chunked. Responses that already carry
+    a Content-Encoding (the response cache's precompressed variants) pass through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD" or not COMPRESSION_ENABLED:
+            return await self.app(scope, receive, send)
+        encoding = negotiate((_header(scope.get("headers", ()), b"accept-encoding") or b"").decode("latin-1"))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        compressor: StreamCompressor | None = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if passthrough:
+                return await send(message)
+
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", ()))
+                length = _header(headers, b"content-length")
+                if (
+                    message["status"] in (204, 206, 304)
+                    or _header(headers, b"content-encoding") is not None
+                    or not is_compressible((_header(headers, b"content-type") or b"").decode("latin-1"))
+                    or (length is not None and int(length) < COMPRESSION_MIN_BYTES)
+                ):
+                    passthrough = True
+                    return await send(message)
+                # wait for the body to decide
+                start = message
+                return
+
+            if message["type"] != "http.response.body":
+                return await send(message)
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                headers = list(start.get("headers", ()))
+                if not more_body:
+                    passthrough = True
+                    if len(body) < COMPRESSION_MIN_BYTES:
+                        await send({**start, "headers": with_vary(headers)})
+                        return await send(message)
+                    body = await off_loop(lambda data: compress(data, encoding), body)
+                    await send({**start, "headers": encoded_headers(headers, encoding, len(body))})
+                    return await send({**message, "body": body})
+                compressor = StreamCompressor(encoding)
+                await send({**start, "headers": encoded_headers(headers, encoding, None)})
+
+            if more_body:
+                chunk = await off_loop(compressor.compress, body)
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            else:
+                body = await off_loop(compressor.finish, body)
+                await send({"type": "http.response.body", "body": body, "more_body": False})
+
+        await self.app(scope, receive, send_compressed)
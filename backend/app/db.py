@@ -1,16 +1,154 @@
-from sqlalchemy import create_engine
+import hashlib
+import hmac
+import os
+import time
+from uuid import UUID
+
+from fastapi import Request
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, Session
 
 # inside docker network: hostname is "db"
 DATABASE_URL_DOCKER = "postgresql+psycopg://app:app@db:5432/collector"
 
-engine = create_engine(DATABASE_URL_DOCKER, pool_pre_ping=True)
+DATABASE_URL = os.getenv("DATABASE_URL", DATABASE_URL_DOCKER)
+# optional streaming replica for read-only routes
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+DB_IDLE_IN_TX_TIMEOUT_MS = int(os.getenv("DB_IDLE_IN_TX_TIMEOUT_MS", "60000"))
+DB_APPLICATION_NAME = os.getenv("DB_APPLICATION_NAME", "collector-api")
+
+# how long an owner's reads stay on the primary after they wrote something
+DB_REPLICA_STICKY_SECONDS = float(os.getenv("DB_REPLICA_STICKY_SECONDS", "5"))
+# signs read pins; any worker that verifies one must share it. The API refuses to start
+# without one (see main.lifespan); the job worker never signs or checks pins
+READ_PIN_SECRET = os.getenv("READ_PIN_SECRET") or os.getenv("JWT_SECRET_KEY")
+READ_PIN_HEADER = "X-Read-Pin"
+# where ReadPinMiddleware leaves room in the ASGI scope for a pin to send
+READ_PIN_SCOPE_KEY = "app.read_pin"
+
+
+def _make_engine(url: str, application_name: str):
+    return create_engine(
+        url,
+        pool_pre_ping=True,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        connect_args={
+            "connect_timeout": DB_CONNECT_TIMEOUT,
+            "application_name": application_name,
+            # server-side guards, applied to every statement/transaction on the connection
+            "options": (
+                f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+                f" -c idle_in_transaction_session_timeout={DB_IDLE_IN_TX_TIMEOUT_MS}"
+            ),
+        },
+    )
+
+
+engine = _make_engine(DATABASE_URL, DB_APPLICATION_NAME)
+replica_engine = (
+    _make_engine(DATABASE_REPLICA_URL, f"{DB_APPLICATION_NAME}-ro") if DATABASE_REPLICA_URL else None
+)
 
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+ReadSessionLocal = sessionmaker(bind=replica_engine or engine, autoflush=False, autocommit=False)
+
 
-def get_db() -> Session:
+def get_db(request: Request) -> Session:
     db = SessionLocal()
+    # a commit with writes hands the client a read pin through ReadPinMiddleware
+    db.info["read_pin"] = request.scope.get(READ_PIN_SCOPE_KEY)
     try:
         yield db
     finally:
         db.close()
+
+
+# -------------------------
+# Read-your-writes stickiness
+# -------------------------
+#
+# The pin travels with the client rather than living in one process: after a write the
+# response carries X-Read-Pin, the client sends it back, and whichever worker serves
+# the next read keeps it on the primary until the pin expires. The header is added by
+# ReadPinMiddleware, so it reaches the client whatever Response object the route returns.
+
+def _pin_signature(owner_id: UUID, until_ms: int) -> str:
+    message = f"{owner_id}:{until_ms}".encode()
+    return hmac.new(READ_PIN_SECRET.encode(), message, hashlib.sha256).hexdigest()[:32]
+
+
+def make_read_pin(owner_id: UUID) -> str:
+    until_ms = int((time.time() + DB_REPLICA_STICKY_SECONDS) * 1000)
+    return f"{until_ms}.{_pin_signature(owner_id, until_ms)}"
+
+
+def reads_pinned_to_primary(owner_id: UUID, pin: str | None) -> bool:
+    """Whether pin, as sent back by the client, still keeps owner_id's reads on the primary."""
+    if not pin:
+        return False
+    until, _, signature = pin.partition(".")
+    try:
+        until_ms = int(until)
+    except ValueError:
+        return False
+    if not hmac.compare_digest(signature, _pin_signature(owner_id, until_ms)):
+        return False
+    return time.time() * 1000 < until_ms
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _flagged_on_flush(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _flagged_on_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _pin_writer(session):
+    owner_id = session.info.get("owner_id")
+    pin = session.info.get("read_pin")
+    if session.info.pop("wrote", False) and owner_id is not None and pin is not None:
+        pin["value"] = make_read_pin(owner_id)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_write(session):
+    session.info.pop("wrote", None)
+
+
+class ReadPinMiddleware:
+    """Adds X-Read-Pin to the response of a request whose session committed writes."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        pin: dict = {}
+        scope[READ_PIN_SCOPE_KEY] = pin
+
+        async def send_with_pin(message):
+            if message["type"] == "http.response.start" and "value" in pin:
+                headers = [
+                    (k, v) for k, v in message.get("headers", ()) if k.lower() != READ_PIN_HEADER.lower().encode()
+                ]
+                headers.append((READ_PIN_HEADER.lower().encode(), pin["value"].encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_pin)
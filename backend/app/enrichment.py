@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+from uuid import UUID
+
+import httpx
+from sqlalchemy import text, update
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal, engine
+from app.jobs import enqueue, job_handler, schedule
+from app.models import Item
+from app.providers import FETCHERS
+
+log = logging.getLogger(__name__)
+
+METADATA_MAX_AGE_HOURS = float(os.getenv("METADATA_MAX_AGE_HOURS", "168"))
+# distinct (source, external_id) keys fetched and written back per round
+REFRESH_CHUNK = int(os.getenv("METADATA_REFRESH_CHUNK", "500"))
+# keys per job run before it hands over to a follow-up job
+REFRESH_MAX_KEYS_PER_RUN = int(os.getenv("METADATA_REFRESH_MAX_KEYS", "5000"))
+REFRESH_INTERVAL_SECONDS = float(os.getenv("METADATA_REFRESH_INTERVAL", "3600"))
+# a refresh finding another one running for its provider retries after this
+REFRESH_BUSY_DELAY_SECONDS = float(os.getenv("METADATA_REFRESH_BUSY_DELAY", "60"))
+
+# session-level, so it is held across the run's many short transactions
+TRY_LOCK_SQL = text("SELECT pg_try_advisory_lock(hashtextextended(:key, 0))")
+UNLOCK_SQL = text("SELECT pg_advisory_unlock(hashtextextended(:key, 0))")
+
+STALE_KEYS_SQL = text("""
+    SELECT external_id
+    FROM items
+    WHERE source = :source
+      AND external_id IS NOT NULL
+      AND (metadata_refreshed_at IS NULL
+           OR metadata_refreshed_at < now() - make_interval(secs => :max_age))
+    GROUP BY external_id
+    ORDER BY min(metadata_refreshed_at) NULLS FIRST
+    LIMIT :limit
+""")
+
+# one statement per chunk: every item sharing a key is updated at once, and keys the
+# provider no longer knows keep their old metadata but are still marked as checked.
+# Items whose metadata actually changed are logged for GET /sync.
+WRITE_BACK_SQL = text("""
+    WITH src AS (
+        SELECT o.id, o.collection_id, o.metadata_json::text AS old_metadata, u.metadata
+        FROM json_to_recordset(CAST(:rows AS json)) AS u(external_id text, metadata json)
+        JOIN items o ON o.source = :source AND o.external_id = u.external_id
+    ),
+    updated AS (
+        UPDATE items AS i
+        SET metadata_json = COALESCE(src.metadata, i.metadata_json),
+            metadata_refreshed_at = now()
+        FROM src
+        WHERE i.collection_id = src.collection_id AND i.id = src.id
+        RETURNING i.id, i.collection_id, src.old_metadata IS DISTINCT FROM i.metadata_json::text AS changed
+    )
+    INSERT INTO change_log (owner_id, entity, entity_id, collection_id, op)
+    SELECT c.owner_id, 'item', u.id, u.collection_id, 'upsert'
+    FROM updated u JOIN collections c ON c.id = u.collection_id
+    WHERE u.changed
+""")
+
+
+def queue_refresh(db: Session, source: str, delay_seconds: float = 30) -> UUID:
+    """Coalesces refresh requests for a provider into one pending job."""
+    return enqueue(
+        db,
+        "items.refresh_metadata",
+        {"source": source},
+        priority=-2,
+        delay_seconds=delay_seconds,
+        dedupe_key=f"items.refresh_metadata:{source}",
+    )
+
+
+def mark_collection_stale(db: Session, collection_id: UUID) -> list[str]:
+    """Forces the next refresh to include this collection; returns the providers involved."""
+    sources = db.execute(
+        text("""
+            SELECT DISTINCT source FROM items
+            WHERE collection_id = :cid AND source IS NOT NULL AND external_id IS NOT NULL
+        """),
+        {"cid": collection_id},
+    ).scalars().all()
+    db.execute(
+        update(Item)
+        .where(Item.collection_id == collection_id, Item.source.isnot(None))
+        .values(metadata_refreshed_at=None)
+    )
+    for source in sources:
+        queue_refresh(db, source, delay_seconds=0)
+    return list(sources)
+
+
+def refresh_source(source: str, max_keys: int = REFRESH_MAX_KEYS_PER_RUN) -> tuple[int, bool]:
+    """Refreshes up to max_keys stale keys of one provider; returns (keys, more_left)."""
+    fetch = FETCHERS[source]
+    done = 0
+
+    with httpx.Client(timeout=15) as client:
+        while done < max_keys:
+            limit = min(REFRESH_CHUNK, max_keys - done)
+            db = SessionLocal()
+            try:
+                keys = list(db.execute(
+                    STALE_KEYS_SQL,
+                    {"source": source, "max_age": METADATA_MAX_AGE_HOURS * 3600, "limit": limit},
+                ).scalars())
+            finally:
+                db.close()
+            if not keys:
+                return done, False
+
+            # no connection is held while waiting on the provider
+            found = fetch(client, keys)
+            rows = [{"external_id": k, "metadata": found.get(k)} for k in keys]
+
+            db = SessionLocal()
+            try:
+                db.execute(WRITE_BACK_SQL, {"source": source, "rows": json.dumps(rows, default=str)})
+                db.commit()
+            finally:
+                db.close()
+            done += len(keys)
+
+    return done, True
+
+
+def _requeue(source: str, delay_seconds: float) -> None:
+    db = SessionLocal()
+    try:
+        queue_refresh(db, source, delay_seconds=delay_seconds)
+        db.commit()
+    finally:
+        db.close()
+
+
+@job_handler("items.refresh_metadata", concurrency=len(FETCHERS), max_attempts=3, backoff_seconds=60)
+def refresh_metadata_job(payload: dict) -> dict:
+    source = payload["source"]
+    key = f"refresh:{source}"
+
+    # the dedupe key only coalesces queued jobs: one queued while another runs would
+    # read the same stale keys and double the calls against a rate-limited provider.
+    # The lock lives on its own autocommit connection, idle between statements.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+        if not lock_conn.execute(TRY_LOCK_SQL, {"key": key}).scalar():
+            # the running one may already be past its last look for stale keys
+            _requeue(source, REFRESH_BUSY_DELAY_SECONDS)
+            log.info("%s refresh already running; retrying in %.0fs", source, REFRESH_BUSY_DELAY_SECONDS)
+            return {"refreshed": 0, "more": True, "busy": True}
+        try:
+            refreshed, more = refresh_source(source)
+        finally:
+            lock_conn.execute(UNLOCK_SQL, {"key": key})
+
+    if more:
+        _requeue(source, 0)
+    log.info("refreshed %d %s keys (more: %s)", refreshed, source, more)
+    return {"refreshed": refreshed, "more": more}
+
+
+for _source in FETCHERS:
+    schedule(
+        "items.refresh_metadata",
+        {"source": _source},
+        every_seconds=REFRESH_INTERVAL_SECONDS,
+        dedupe_key=f"items.refresh_metadata:{_source}",
+    )
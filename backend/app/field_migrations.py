@@ -0,0 +1,270 @@
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from uuid import UUID
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, text, update
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal
+from app.jobs import enqueue, job_handler
+from app.models import Collection, CollectionField, FieldMigration
+from app.options import codes_for
+from app.purge import PURGE_THRESHOLD
+from app.schemas import FieldMigrationOut
+from app.sync import record_change
+from app.values import SELECT_TYPES, codable_labels, coded_columns, compact_value, dual_value, option_labels, stored_value
+
+log = logging.getLogger(__name__)
+
+# values per migration transaction; each batch holds row locks only on its own values
+FIELD_MIGRATION_BATCH_SIZE = int(os.getenv("FIELD_MIGRATION_BATCH_SIZE", "1000"))
+FIELD_MIGRATION_BATCH_PAUSE = float(os.getenv("FIELD_MIGRATION_BATCH_PAUSE", "0.05"))
+# conversion failures kept on the migration row; the rest are only counted
+FIELD_MIGRATION_MAX_ERRORS = int(os.getenv("FIELD_MIGRATION_MAX_ERRORS", "100"))
+
+# every statement here also filters on the field's collection_id, which confines it
+# to one item_field_values partition
+COUNT_SQL = text("SELECT count(*) FROM item_field_values WHERE collection_id = :collection AND field_id = :field")
+
+COUNT_UP_TO_SQL = text("""
+    SELECT count(*) FROM (
+        SELECT 1 FROM item_field_values WHERE collection_id = :collection AND field_id = :field LIMIT :limit
+    ) s
+""")
+
+# keyset walk over the field's values in id order; the cursor survives restarts
+BATCH_SQL = text("""
+    SELECT id, item_id, value_json, value_code, value_codes
+    FROM item_field_values
+    WHERE collection_id = :collection AND field_id = :field
+      AND (CAST(:cursor AS uuid) IS NULL OR id > CAST(:cursor AS uuid))
+    ORDER BY id
+    LIMIT :limit
+    FOR UPDATE
+""")
+
+# the dual form is JSON, so option codes are decoded into it
+UPDATE_VALUES_SQL = text("""
+    UPDATE item_field_values AS v
+    SET value_json = u.value_json, value_code = NULL, value_codes = NULL
+    FROM json_to_recordset(CAST(:rows AS json)) AS u(id uuid, value_json json)
+    WHERE v.collection_id = :collection AND v.id = u.id
+""")
+
+# compaction changes what clients see for the value, so it is logged for GET /sync
+COMPACT_VALUES_SQL = text("""
+    WITH updated AS (
+        UPDATE item_field_values AS v
+        SET value_json = u.value_json, value_code = u.value_code, value_codes = u.value_codes
+        FROM json_to_recordset(CAST(:rows AS json)) AS u(id uuid, value_json json, value_code int, value_codes int[])
+        WHERE v.collection_id = :collection AND v.id = u.id
+        RETURNING v.id
+    )
+    INSERT INTO change_log (owner_id, entity, entity_id, collection_id, op)
+    SELECT :owner, 'value', id, :collection, 'upsert' FROM updated
+""")
+
+DELETE_VALUES_BATCH_SQL = text("""
+    DELETE FROM item_field_values WHERE collection_id = :collection AND id IN (
+        SELECT id FROM item_field_values WHERE collection_id = :collection AND field_id = :field LIMIT :limit
+    )
+""")
+
+
+def migration_accepted(m: FieldMigration) -> JSONResponse:
+    """202 response pointing the client at the migration progress endpoint."""
+    status_url = f"/fields/{m.field_id}/migration"
+    return JSONResponse(
+        status_code=202,
+        content=FieldMigrationOut.model_validate(m).model_dump(mode="json"),
+        headers={"Location": status_url},
+    )
+
+
+def _start(db: Session, field: CollectionField, owner_id: UUID, **kwargs) -> FieldMigration:
+    m = FieldMigration(field_id=field.id, from_type=field.data_type, errors=[], **kwargs)
+    db.add(m)
+    db.flush()
+    m.job_id = enqueue(db, "fields.migrate", {"migration_id": str(m.id)}, owner_id=owner_id)
+    return m
+
+
+def start_retype(db: Session, field: CollectionField, to_type: str, owner_id: UUID) -> FieldMigration:
+    """Marks field as migrating to to_type and queues the backfill, in the caller's transaction.
+
+    Reads keep using the old type until the backfill is done; writes meanwhile store
+    both representations (see app.values.encode_value).
+    """
+    field.pending_data_type = to_type
+    return _start(db, field, owner_id, kind="retype", to_type=to_type, phase="backfill")
+
+
+def start_delete(db: Session, field: CollectionField, owner_id: UUID) -> FieldMigration | None:
+    """Deletes field via ON DELETE CASCADE, or hides it and queues a batched purge of its
+    values when it has too many to drop in one transaction."""
+    db.execute(
+        update(FieldMigration)
+        .where(FieldMigration.field_id == field.id, FieldMigration.status == "running")
+        .values(status="cancelled", finished_at=datetime.now(timezone.utc))
+    )
+
+    large = db.execute(
+        COUNT_UP_TO_SQL,
+        {"collection": field.collection_id, "field": field.id, "limit": PURGE_THRESHOLD + 1},
+    ).scalar() > PURGE_THRESHOLD
+    if not large:
+        db.execute(delete(CollectionField).where(CollectionField.id == field.id))
+        return None
+
+    field.deleted_at = datetime.now(timezone.utc)
+    return _start(db, field, owner_id, kind="delete", phase="purge")
+
+
+def _record_error(m: FieldMigration, row, value_json: dict) -> None:
+    m.failed += 1
+    if len(m.errors) < FIELD_MIGRATION_MAX_ERRORS:
+        # reassigned, not appended: plain JSON columns do not track in-place changes
+        m.errors = m.errors + [{
+            "value_id": str(row.id),
+            "item_id": str(row.item_id),
+            "value": value_json.get("value"),
+            "error": value_json["err"],
+        }]
+
+
+def _finish(m: FieldMigration, status: str) -> bool:
+    m.status = status
+    m.finished_at = datetime.now(timezone.utc)
+    return True
+
+
+def _next_batch(db: Session, m: FieldMigration, field: CollectionField) -> list:
+    return db.execute(
+        BATCH_SQL,
+        {
+            "collection": field.collection_id,
+            "field": field.id,
+            "cursor": str(m.cursor) if m.cursor else None,
+            "limit": FIELD_MIGRATION_BATCH_SIZE,
+        },
+    ).all()
+
+
+def _backfill(db: Session, m: FieldMigration, field: CollectionField, owner_id: UUID) -> bool:
+    rows = _next_batch(db, m, field)
+
+    if not rows:
+        # cut-over: every value already carries the new representation, so flipping
+        # the type is one row update and reads switch to "next" atomically
+        field.data_type = m.to_type
+        field.pending_data_type = None
+        record_change(db, owner_id, "field", field.id, collection_id=field.collection_id)
+        m.phase = "compact"
+        m.cursor = None
+        m.processed = 0
+        return False
+
+    labels = option_labels(field)
+    updates = []
+    for row in rows:
+        value_json = dual_value(stored_value(row, field.data_type, labels), field, m.to_type)
+        if "err" in value_json:
+            _record_error(m, row, value_json)
+        updates.append({"id": str(row.id), "value_json": value_json})
+
+    db.execute(UPDATE_VALUES_SQL, {"rows": json.dumps(updates), "collection": field.collection_id})
+    m.processed += len(rows)
+    m.cursor = rows[-1].id
+    return False
+
+
+def _compact(db: Session, m: FieldMigration, field: CollectionField, owner_id: UUID) -> bool:
+    rows = _next_batch(db, m, field)
+    if not rows:
+        return _finish(m, "succeeded")
+
+    compacted = {row.id: compact_value(row.value_json, field.data_type) for row in rows if "t" in (row.value_json or {})}
+
+    # values of a select type become option codes, like fresh writes (see app.options)
+    labels = {}
+    if field.data_type in SELECT_TYPES:
+        labels = {
+            value_id: found
+            for value_id, value_json in compacted.items()
+            if "invalid" not in value_json
+            and (found := codable_labels(field.data_type, value_json["value"])) is not None
+        }
+    codes = codes_for(db, field, [label for found in labels.values() for label in found]) if labels else {}
+
+    updates = []
+    for value_id, value_json in compacted.items():
+        if value_id in labels:
+            columns = coded_columns(field.data_type, labels[value_id], codes)
+        else:
+            columns = {"value_json": value_json, "value_code": None, "value_codes": None}
+        updates.append({"id": str(value_id), **columns})
+    if updates:
+        db.execute(
+            COMPACT_VALUES_SQL,
+            {"rows": json.dumps(updates), "owner": owner_id, "collection": field.collection_id},
+        )
+    m.processed += len(rows)
+    m.cursor = rows[-1].id
+    return False
+
+
+def _purge(db: Session, m: FieldMigration, field: CollectionField, owner_id: UUID) -> bool:
+    deleted = db.execute(
+        DELETE_VALUES_BATCH_SQL,
+        {"collection": field.collection_id, "field": field.id, "limit": FIELD_MIGRATION_BATCH_SIZE},
+    ).rowcount
+    if deleted == 0:
+        db.execute(delete(CollectionField).where(CollectionField.id == field.id))
+        return _finish(m, "succeeded")
+    m.processed += deleted
+    return False
+
+
+PHASES = {"backfill": _backfill, "compact": _compact, "purge": _purge}
+
+
+@job_handler("fields.migrate", concurrency=2, max_attempts=10, backoff_seconds=30)
+def migrate_field_job(payload: dict) -> dict:
+    """Runs a field migration batch by batch, one short transaction each; a crash or
+    retry resumes from the stored cursor."""
+    migration_id = UUID(payload["migration_id"])
+
+    while True:
+        db = SessionLocal()
+        try:
+            # row lock: serializes with a cancelling DELETE /fields/{id}
+            m = db.get(FieldMigration, migration_id, with_for_update=True)
+            if m is None:
+                return {"status": "missing"}
+            if m.status != "running":
+                return {"status": m.status}
+
+            field = db.get(CollectionField, m.field_id) if m.field_id else None
+            if field is None or (m.kind == "retype" and field.deleted_at is not None):
+                _finish(m, "cancelled")
+                db.commit()
+                return {"status": m.status}
+
+            if m.total is None:
+                m.total = db.execute(COUNT_SQL, {"collection": field.collection_id, "field": field.id}).scalar()
+            owner_id = db.get(Collection, field.collection_id).owner_id
+
+            done = PHASES[m.phase](db, m, field, owner_id)
+            db.commit()
+            result = {"status": m.status, "processed": m.processed, "failed": m.failed}
+        finally:
+            db.close()
+
+        if done:
+            log.info("field migration %s finished: %s", migration_id, result)
+            return result
+        time.sleep(FIELD_MIGRATION_BATCH_PAUSE)
@@ -0,0 +1,333 @@
+import hashlib
+import io
+import ipaddress
+import os
+import re
+import socket
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+from PIL import Image
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal
+from app.jobs import enqueue, job_handler
+from app.models import Collection, ImageAsset, Item
+
+router = APIRouter()
+
+IMAGE_STORE_DIR = Path(os.getenv("IMAGE_STORE_DIR", "/data/images"))
+IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", "15"))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(20 * 1024 * 1024)))
+IMAGE_WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", "80"))
+IMAGE_MAX_REDIRECTS = int(os.getenv("IMAGE_MAX_REDIRECTS", "5"))
+
+# image URLs come from users: only the standard port of each allowed scheme, and only
+# public addresses
+ALLOWED_PORTS = {"http": 80, "https": 443}
+
+# Destinations exempt from that, for tests and benchmarks that serve images from a local
+# stub, e.g. IMAGE_FETCH_ALLOW_HOSTS="127.0.0.1:8788,images.test:*". Comma-separated host
+# names or CIDRs, each optionally followed by :port or :* for any port (without one, only
+# the standard ports); IPv6 goes in brackets, as in [::1]:8788. Keep it empty in production.
+IMAGE_FETCH_ALLOW_HOSTS = os.getenv("IMAGE_FETCH_ALLOW_HOSTS", "")
+
+# grid tiles, list rows and detail headers
+THUMB_WIDTHS = (128, 256, 512)
+SIZES = {str(w) for w in THUMB_WIDTHS} | {"original"}
+
+# long-lived: a hash never points at different bytes
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# Pillow only raises DecompressionBombError above twice this (and merely warns in
+# between), so _store also checks the dimensions against it
+Image.MAX_IMAGE_PIXELS = 40_000_000
+
+ORIGINAL_EXTENSIONS = {
+    "GIF": "gif",
+    "JPEG": "jpg",
+    "PNG": "png",
+    "WEBP": "webp",
+}
+
+
+def _asset_dir(content_hash: str) -> Path:
+    return IMAGE_STORE_DIR / content_hash[:2] / content_hash
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _allow_entry(entry: str) -> tuple[str | ipaddress.IPv4Network | ipaddress.IPv6Network, frozenset | None]:
+    """(host name or network, ports) of one IMAGE_FETCH_ALLOW_HOSTS entry; None for any port."""
+    host, port = entry, ""
+    if entry.startswith("["):
+        host, _, rest = entry[1:].partition("]")
+        port = rest.removeprefix(":")
+    elif entry.count(":") == 1:
+        host, _, port = entry.partition(":")
+    if port == "*":
+        ports = None
+    else:
+        ports = frozenset({int(port)} if port else ALLOWED_PORTS.values())
+    try:
+        return ipaddress.ip_network(host, strict=False), ports
+    except ValueError:
+        return host.lower().rstrip("."), ports
+
+
+ALLOW_LIST = [_allow_entry(e.strip()) for e in IMAGE_FETCH_ALLOW_HOSTS.split(",") if e.strip()]
+
+
+def _allow_listed(target: str | ipaddress.IPv4Address | ipaddress.IPv6Address, port: int) -> bool:
+    for allowed, ports in ALLOW_LIST:
+        if ports is not None and port not in ports:
+            continue
+        if isinstance(allowed, str):
+            if allowed == target:
+                return True
+        elif not isinstance(target, str) and target in allowed:
+            return True
+    return False
+
+
+def _pin_public(url: httpx.URL) -> httpx.URL:
+    """url with its host replaced by one of its addresses, if they are all public.
+
+    Connecting to the checked address rather than the name leaves no window for DNS to
+    answer differently the second time (rebinding to an internal address). Destinations
+    on IMAGE_FETCH_ALLOW_HOSTS skip the public address and standard port checks.
+    """
+    default_port = ALLOWED_PORTS.get(url.scheme)
+    if default_port is None or not url.host:
+        raise ValueError(f"Unsupported image URL: {url}")
+    port = url.port or default_port
+    by_name = _allow_listed(url.host.lower().rstrip("."), port)
+
+    try:
+        infos = socket.getaddrinfo(url.host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise ValueError(f"Cannot resolve {url.host}: {e}") from e
+    addresses = [ipaddress.ip_address(info[4][0].split("%", 1)[0]) for info in infos]
+    for address in addresses:
+        mapped = getattr(address, "ipv4_mapped", None) or address
+        if by_name or _allow_listed(mapped, port):
+            continue
+        if port != default_port:
+            raise ValueError(f"Refusing non-standard port {port}")
+        # is_global excludes private, loopback, link-local, shared and reserved ranges
+        if not mapped.is_global or mapped.is_multicast:
+            raise ValueError(f"Refusing to fetch from {url.host} ({address})")
+    return url.copy_with(host=str(addresses[0]))
+
+
+def _download(url: str) -> tuple[bytes, str]:
+    target = httpx.URL(url)
+    # redirects are followed by hand so that every hop gets the same destination check
+    with httpx.Client(timeout=IMAGE_FETCH_TIMEOUT) as client:
+        for _ in range(IMAGE_MAX_REDIRECTS + 1):
+            request = client.build_request(
+                "GET",
+                _pin_public(target),
+                headers={"Host": target.netloc.decode("ascii")},
+                # TLS still negotiates and verifies the certificate for the name
+                extensions={"sni_hostname": target.host},
+            )
+            with client.send(request, stream=True) as r:
+                if r.is_redirect:
+                    target = target.join(r.headers["location"])
+                    continue
+                r.raise_for_status()
+                content_type = r.headers.get("content-type", "").split(";")[0].strip()
+                if not content_type.startswith("image/"):
+                    raise ValueError(f"Not an image: {content_type or 'unknown content type'}")
+
+                buf = bytearray()
+                for chunk in r.iter_bytes():
+                    buf.extend(chunk)
+                    if len(buf) > IMAGE_MAX_BYTES:
+                        raise ValueError("Image too large")
+                return bytes(buf), content_type
+    raise ValueError(f"More than {IMAGE_MAX_REDIRECTS} redirects")
+
+
+def _store(data: bytes) -> str:
+    """Writes the original and its thumbnails under the content hash; returns the hash."""
+    content_hash = hashlib.sha256(data).hexdigest()
+    target = _asset_dir(content_hash)
+
+    with Image.open(io.BytesIO(data)) as img:
+        if img.width * img.height > Image.MAX_IMAGE_PIXELS:
+            raise ValueError(f"Image too large: {img.width}x{img.height} pixels")
+        fmt = img.format or ""
+        original = target / f"original.{ORIGINAL_EXTENSIONS.get(fmt, 'bin')}"
+        if not original.exists():
+            _write_atomic(original, data)
+
+        # Image.open() is positioned on the first frame, so animated GIFs get a still poster
+        img.seek(0)
+        frame = img.convert("RGBA" if img.mode in ("RGBA", "LA", "P") else "RGB")
+
+        for width in THUMB_WIDTHS:
+            path = target / f"{width}.webp"
+            if path.exists():
+                continue
+            if frame.width > width:
+                height = max(1, round(frame.height * width / frame.width))
+                thumb = frame.resize((width, height), Image.LANCZOS)
+            else:
+                thumb = frame
+
+            out = io.BytesIO()
+            thumb.save(out, "WEBP", quality=IMAGE_WEBP_QUALITY, method=4)
+            _write_atomic(path, out.getvalue())
+
+    return content_hash
+
+
+def queue_image(db: Session, url: str | None) -> str | None:
+    """Registers url with the pipeline in the caller's transaction.
+
+    Returns the hash if it is already cached, otherwise queues a fetch job.
+    """
+    if not url:
+        return None
+
+    db.execute(
+        insert(ImageAsset)
+        .values(source_url=url)
+        .on_conflict_do_nothing(index_elements=[ImageAsset.source_url])
+    )
+    asset = db.query(ImageAsset).filter(ImageAsset.source_url == url).first()
+    if asset and asset.status == "ready":
+        return asset.content_hash
+
+    url_key = hashlib.sha1(url.encode()).hexdigest()
+    enqueue(db, "images.fetch", {"url": url}, priority=-1, dedupe_key=f"images.fetch:{url_key}")
+    return None
+
+
+LINK_SQL = text("""
+    WITH linked_items AS (
+        UPDATE items SET cover_image_hash = :hash
+        WHERE cover_image_url = :url AND cover_image_hash IS DISTINCT FROM :hash
+        RETURNING id, collection_id
+    ),
+    linked_collections AS (
+        UPDATE collections SET icon_hash = :hash
+        WHERE icon_url = :url AND icon_hash IS DISTINCT FROM :hash
+        RETURNING id, owner_id
+    )
+    INSERT INTO change_log (owner_id, entity, entity_id, collection_id, op)
+    SELECT c.owner_id, 'item', li.id, li.collection_id, 'upsert'
+    FROM linked_items li JOIN collections c ON c.id = li.collection_id
+    UNION ALL
+    SELECT lc.owner_id, 'collection', lc.id, lc.id, 'upsert'
+    FROM linked_collections lc
+""")
+
+
+def link_image(db: Session, url: str, content_hash: str) -> None:
+    """Points every item/collection using url at the cached copy and logs them for sync."""
+    db.execute(LINK_SQL, {"url": url, "hash": content_hash})
+
+
+def ingest_image(url: str) -> None:
+    """Fetches url once and stores it; safe to call repeatedly for the same url.
+
+    Download and decode errors are recorded on the asset and re-raised so the job retries.
+    """
+    db = SessionLocal()
+    try:
+        asset = db.query(ImageAsset).filter(ImageAsset.source_url == url).first()
+        if not asset:
+            return
+
+        if asset.status != "ready":
+            asset.attempts += 1
+            try:
+                data, content_type = _download(url)
+                asset.content_hash = _store(data)
+                asset.content_type = content_type
+                asset.status = "ready"
+                asset.error = None
+                asset.fetched_at = datetime.now(timezone.utc)
+            except (
+                httpx.HTTPError, httpx.InvalidURL, OSError, ValueError,
+                Image.DecompressionBombError,
+            ) as e:
+                asset.status = "failed"
+                asset.error = str(e)[:500]
+                db.commit()
+                raise
+
+        link_image(db, url, asset.content_hash)
+        db.commit()
+    finally:
+        db.close()
+
+
+@job_handler("images.fetch", concurrency=4, max_attempts=5, backoff_seconds=30)
+def fetch_image_job(payload: dict) -> None:
+    ingest_image(payload["url"])
+
+
+def backfill() -> int:
+    """Queues a fetch job for every referenced url that has no cached copy yet."""
+    db = SessionLocal()
+    try:
+        urls = {u for (u,) in db.query(Item.cover_image_url).filter(Item.cover_image_url.isnot(None)).distinct()}
+        urls |= {u for (u,) in db.query(Collection.icon_url).filter(Collection.icon_url.isnot(None)).distinct()}
+        queued = sum(1 for url in urls if queue_image(db, url) is None)
+        db.commit()
+    finally:
+        db.close()
+    return queued
+
+
+# -------------------------
+# Serving
+# -------------------------
+
+@router.get("/images/{content_hash}/{size}")
+def get_image(content_hash: str, size: str):
+    if not HASH_RE.fullmatch(content_hash) or size not in SIZES:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    target = _asset_dir(content_hash)
+    if size == "original":
+        path = next(target.glob("original.*"), None)
+        media_type = None
+    else:
+        path = target / f"{size}.webp"
+        media_type = "image/webp"
+
+    if path is None or not path.is_file():
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    return FileResponse(
+        path,
+        media_type=media_type,
+        headers={"Cache-Control": IMMUTABLE_CACHE, "ETag": f'"{content_hash}-{size}"'},
+    )
+
+
+if __name__ == "__main__":
+    print(f"queued {backfill()} images")
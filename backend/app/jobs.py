@@ -0,0 +1,298 @@
+import json
+import os
+import random
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.auth import get_current_user
+from app.db import SessionLocal, get_db
+from app.models import Job, User
+from app.schemas import JobOut
+
+router = APIRouter()
+
+# succeeded and failed jobs are deleted this long after they finish
+JOB_RETENTION_DAYS = float(os.getenv("JOB_RETENTION_DAYS", "14"))
+
+
+@dataclass
+class JobType:
+    kind: str
+    handler: Callable[[dict], dict | None]
+    concurrency: int = 1
+    max_attempts: int = 5
+    backoff_seconds: float = 5.0
+
+
+@dataclass
+class Periodic:
+    kind: str
+    payload: dict
+    every_seconds: float
+    dedupe_key: str
+
+
+# kind -> JobType, filled in by @job_handler at import time
+registry: dict[str, JobType] = {}
+# recurring jobs the worker enqueues on its own
+periodic: list[Periodic] = []
+
+
+def job_handler(kind: str, *, concurrency: int = 1, max_attempts: int = 5, backoff_seconds: float = 5.0):
+    """Registers fn(payload) as the handler for kind.
+
+    concurrency caps how many jobs of this kind one worker process runs at once.
+    """
+    def decorator(fn: Callable[[dict], dict | None]):
+        registry[kind] = JobType(kind, fn, concurrency, max_attempts, backoff_seconds)
+        return fn
+    return decorator
+
+
+def schedule(kind: str, payload: dict, *, every_seconds: float, dedupe_key: str) -> None:
+    """Asks workers to enqueue kind every every_seconds; the dedupe_key keeps several
+    workers from piling up copies."""
+    periodic.append(Periodic(kind, payload, every_seconds, dedupe_key))
+
+
+def enqueue(
+    db: Session,
+    kind: str,
+    payload: dict[str, Any],
+    *,
+    priority: int = 0,
+    delay_seconds: float = 0,
+    owner_id: UUID | None = None,
+    dedupe_key: str | None = None,
+    max_attempts: int | None = None,
+) -> UUID:
+    """Adds a job in the caller's transaction; it becomes visible to workers on commit.
+
+    With a dedupe_key, an already queued job with the same key is reused.
+    """
+    job_type = registry.get(kind)
+    job_id = uuid.uuid4()
+    run_at = datetime.now(timezone.utc) + timedelta(seconds=delay_seconds)
+
+    stmt = insert(Job).values(
+        id=job_id,
+        kind=kind,
+        payload=payload,
+        priority=priority,
+        run_at=run_at,
+        owner_id=owner_id,
+        dedupe_key=dedupe_key,
+        max_attempts=max_attempts or (job_type.max_attempts if job_type else 5),
+    )
+    if dedupe_key is None:
+        db.execute(stmt)
+        return job_id
+
+    inserted = db.execute(
+        stmt.on_conflict_do_nothing(
+            index_elements=[Job.dedupe_key],
+            index_where=text("status = 'queued'"),
+        ).returning(Job.id)
+    ).scalar()
+    if inserted:
+        return inserted
+
+    existing = db.execute(
+        text("SELECT id FROM jobs WHERE dedupe_key = :key AND status = 'queued'"),
+        {"key": dedupe_key},
+    ).scalar()
+    return existing or job_id
+
+
+def accepted(job_id: UUID) -> JSONResponse:
+    """202 response pointing the client at the job status endpoint."""
+    status_url = f"/jobs/{job_id}"
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": str(job_id), "status_url": status_url},
+        headers={"Location": status_url},
+    )
+
+
+# -------------------------
+# Worker-side queue operations
+# -------------------------
+
+# dedupe_key is cleared on claim: once running, a new trigger deserves a new job,
+# and a retried job must not collide with one queued in the meantime
+CLAIM_SQL = text("""
+    UPDATE jobs
+    SET status = 'running', locked_at = now(), locked_by = :worker,
+        attempts = attempts + 1, dedupe_key = NULL, updated_at = now()
+    WHERE id IN (
+        SELECT id FROM jobs
+        WHERE status = 'queued' AND kind = :kind AND run_at <= now()
+        ORDER BY priority DESC, run_at
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, kind, payload, attempts, max_attempts
+""")
+
+
+def claim(db: Session, kind: str, limit: int, worker: str) -> list[Any]:
+    rows = db.execute(CLAIM_SQL, {"kind": kind, "limit": limit, "worker": worker}).all()
+    db.commit()
+    return rows
+
+
+# The outcome of a run is only recorded while the job is still that run's: once it has
+# been requeued as stale (and maybe claimed by another worker), the late result is
+# dropped. The mark_* functions return False then.
+OWNED_BY_WORKER = "id = :id AND locked_by = :worker AND status = 'running'"
+
+
+def mark_succeeded(db: Session, job_id: UUID, worker: str, result: dict | None) -> bool:
+    updated = db.execute(
+        text(f"""
+            UPDATE jobs
+            SET status = 'succeeded', result = CAST(:result AS json), last_error = NULL,
+                locked_at = NULL, locked_by = NULL, finished_at = now(), updated_at = now()
+            WHERE {OWNED_BY_WORKER}
+        """),
+        {"id": job_id, "worker": worker, "result": _json(result)},
+    ).rowcount
+    db.commit()
+    return updated > 0
+
+
+def mark_failed(
+    db: Session, job_id: UUID, worker: str, attempts: int, max_attempts: int, error: str, backoff_seconds: float
+) -> bool:
+    if attempts >= max_attempts:
+        updated = db.execute(
+            text(f"""
+                UPDATE jobs
+                SET status = 'failed', last_error = :error,
+                    locked_at = NULL, locked_by = NULL, finished_at = now(), updated_at = now()
+                WHERE {OWNED_BY_WORKER}
+            """),
+            {"id": job_id, "worker": worker, "error": error[:2000]},
+        ).rowcount
+    else:
+        # exponential backoff with jitter so failing jobs don't retry in lockstep
+        delay = backoff_seconds * (2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
+        updated = db.execute(
+            text(f"""
+                UPDATE jobs
+                SET status = 'queued', last_error = :error,
+                    run_at = now() + make_interval(secs => :delay),
+                    locked_at = NULL, locked_by = NULL, updated_at = now()
+                WHERE {OWNED_BY_WORKER}
+            """),
+            {"id": job_id, "worker": worker, "error": error[:2000], "delay": delay},
+        ).rowcount
+    db.commit()
+    return updated > 0
+
+
+def heartbeat(db: Session, job_ids: list[UUID]) -> None:
+    if not job_ids:
+        return
+    db.execute(
+        text("UPDATE jobs SET locked_at = now() WHERE id = ANY(:ids) AND status = 'running'"),
+        {"ids": job_ids},
+    )
+    db.commit()
+
+
+def requeue_stale(db: Session, visibility_seconds: float) -> int:
+    """Puts back jobs whose worker stopped heartbeating (crashed or was killed).
+
+    The lost run already counted as an attempt when it was claimed, so a job that keeps
+    killing its worker fails once it is out of attempts instead of coming back forever.
+    """
+    result = db.execute(
+        text("""
+            UPDATE jobs
+            SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                last_error = 'worker stopped heartbeating (crashed or killed) during attempt '
+                             || attempts,
+                finished_at = CASE WHEN attempts >= max_attempts THEN now() END,
+                locked_at = NULL, locked_by = NULL, updated_at = now()
+            WHERE status = 'running' AND locked_at < now() - make_interval(secs => :visibility)
+        """),
+        {"visibility": visibility_seconds},
+    )
+    db.commit()
+    return result.rowcount
+
+
+def _json(value: Any) -> str | None:
+    return None if value is None else json.dumps(value, default=str)
+
+
+# -------------------------
+# Retention
+# -------------------------
+
+@job_handler("jobs.prune_finished", max_attempts=3)
+def prune_finished(payload: dict) -> dict:
+    db = SessionLocal()
+    try:
+        deleted = 0
+        while True:
+            # bounded batches keep each transaction short
+            result = db.execute(
+                text("""
+                    DELETE FROM jobs WHERE id IN (
+                        SELECT id FROM jobs
+                        WHERE status IN ('succeeded', 'failed')
+                          AND finished_at < now() - make_interval(secs => :secs)
+                        LIMIT 10000
+                    )
+                """),
+                {"secs": JOB_RETENTION_DAYS * 86400},
+            )
+            db.commit()
+            deleted += result.rowcount
+            if result.rowcount < 10000:
+                return {"deleted": deleted}
+    finally:
+        db.close()
+
+
+schedule("jobs.prune_finished", {}, every_seconds=86400, dedupe_key="jobs.prune_finished")
+
+
+# -------------------------
+# Status endpoints
+# -------------------------
+
+@router.get("/jobs/{job_id}", response_model=JobOut)
+def get_job(
+    job_id: UUID,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    job = db.get(Job, job_id)
+    if not job or job.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/jobs", response_model=list[JobOut])
+def list_jobs(
+    status: str | None = Query(default=None),
+    limit: int = Query(default=50, ge=1, le=200),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    q = db.query(Job).filter(Job.owner_id == current_user.id)
+    if status:
+        q = q.filter(Job.status == status)
+    return q.order_by(Job.created_at.desc()).limit(limit).all()
@@ -0,0 +1,374 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+import psycopg
+from fastapi import HTTPException, Request
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from app.auth import owner_from_token
+from app.db import DATABASE_URL, SessionLocal
+from app.jobs import job_handler, schedule
+
+log = logging.getLogger(__name__)
+
+LIMITS_ENABLED = os.getenv("LIMITS_ENABLED", "true").lower() in ("1", "true", "yes")
+# "memory" (per process) or "postgres" (rate limits shared by every worker process)
+LIMITS_BACKEND = os.getenv("LIMITS_BACKEND", "memory")
+LIMITS_PG_CONNECTIONS = int(os.getenv("LIMITS_PG_CONNECTIONS", "2"))
+
+# overload detection: if even the fastest request in an interval waited longer than the
+# target for a threadpool thread, the queue is standing rather than bursting
+LIMITS_QUEUE_TARGET_MS = float(os.getenv("LIMITS_QUEUE_TARGET_MS", "50"))
+LIMITS_QUEUE_INTERVAL_MS = float(os.getenv("LIMITS_QUEUE_INTERVAL_MS", "500"))
+# past target * this factor, everything below write priority is shed too
+LIMITS_SEVERE_FACTOR = float(os.getenv("LIMITS_SEVERE_FACTOR", "4"))
+
+
+@dataclass
+class RouteClass:
+    name: str
+    # in-flight requests per user (0 = unlimited)
+    user_concurrency: int
+    # in-flight requests of this class in the process, all users together (0 = unlimited)
+    class_concurrency: int
+    # sustained requests per second per user, and how many may arrive at once
+    rate: float
+    burst: int
+    # under overload, lower priorities are shed first
+    priority: int
+
+
+def _route_class(name: str, user_concurrency: int, class_concurrency: int, rate: float, burst: int, priority: int) -> RouteClass:
+    """Defaults, overridable as LIMITS_<NAME>="user_concurrency,class_concurrency,rate,burst"."""
+    override = os.getenv(f"LIMITS_{name.upper()}")
+    if override:
+        uc, cc, r, b = override.split(",")
+        user_concurrency, class_concurrency, rate, burst = int(uc), int(cc), float(r), int(b)
+    return RouteClass(name, user_concurrency, class_concurrency, rate, burst, priority)
+
+
+ROUTE_CLASSES = {
+    # each call holds a threadpool thread on a provider request for up to 15 s
+    "search": _route_class("search", 2, 16, 1.0, 5, priority=0),
+    "bulk": _route_class("bulk", 1, 4, 0.2, 3, priority=0),
+    "read": _route_class("read", 8, 0, 20.0, 100, priority=1),
+    "write": _route_class("write", 8, 0, 10.0, 50, priority=2),
+    # keyed by client address, as these requests carry no token
+    "auth": _route_class("auth", 2, 0, 1.0, 10, priority=2),
+}
+
+# (method or "*", path regex, class name or None for unlimited); first match wins.
+# LIMITS_ROUTES prepends more: "POST ^/items/[^/]+/values$=bulk;GET ^/sync/snapshot$=bulk"
+ROUTE_RULES: list[tuple[str, str, str | None]] = [
+    ("GET", r"^/(health|ready)$", None),
+    # long-lived streams; the realtime hub caps those itself
+    ("GET", r"^/(events|ws)$", None),
+    # diagnostics must get through exactly when the service is overloaded
+    ("*", r"^/admin/", None),
+    ("GET", r"^/search/", "search"),
+    ("POST", r"^/batch$", "bulk"),
+    ("POST", r"^/collections/[^/]+/refresh-metadata$", "bulk"),
+    ("POST", r"^/collections/[^/]+/clone$", "bulk"),
+    ("*", r"^/auth/", "auth"),
+    ("GET", r"", "read"),
+    ("HEAD", r"", "read"),
+    ("*", r"", "write"),
+]
+
+
+def _parse_route_rules(spec: str) -> list[tuple[str, str, str | None]]:
+    rules = []
+    for entry in filter(None, (e.strip() for e in spec.split(";"))):
+        route, _, name = entry.rpartition("=")
+        method, _, pattern = route.strip().partition(" ")
+        if name not in ROUTE_CLASSES and name != "none":
+            raise ValueError(f"LIMITS_ROUTES: unknown route class {name!r}")
+        rules.append((method.upper(), pattern.strip(), None if name == "none" else name))
+    return rules
+
+
+_compiled_rules = [
+    (method, re.compile(pattern), name)
+    for method, pattern, name in _parse_route_rules(os.getenv("LIMITS_ROUTES", "")) + ROUTE_RULES
+]
+
+
+def classify(method: str, path: str) -> RouteClass | None:
+    for rule_method, pattern, name in _compiled_rules:
+        if rule_method in ("*", method) and pattern.search(path):
+            return ROUTE_CLASSES[name] if name else None
+    return None
+
+
+# -------------------------
+# Token buckets (GCRA)
+# -------------------------
+#
+# Each key stores a "theoretical arrival time": when the bucket would be full again.
+# A request is allowed if that moves it no more than burst intervals into the future.
+# One number per key, updated atomically, which is what makes the Postgres variant a
+# single statement.
+
+class MemoryBuckets:
+    MAX_KEYS = 100_000
+
+    def __init__(self):
+        self.tat: dict[str, float] = {}
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """0 if allowed, else seconds until a request would be."""
+        now = time.monotonic()
+        interval = 1.0 / rate
+        new_tat = max(self.tat.get(key, now), now) + interval
+        excess = new_tat - now - burst * interval
+        if excess > 0:
+            return excess
+        self.tat[key] = new_tat
+        if len(self.tat) > self.MAX_KEYS:
+            # a key whose tat has passed is indistinguishable from a fresh one
+            self.tat = {k: t for k, t in self.tat.items() if t > now}
+        return 0.0
+
+
+TAKE_SQL = """
+    INSERT INTO rate_limit_buckets AS b (key, tat)
+    VALUES (%(key)s, now() + make_interval(secs => %(interval)s))
+    ON CONFLICT (key) DO UPDATE
+    SET tat = GREATEST(b.tat, now()) + make_interval(secs => %(interval)s)
+    WHERE GREATEST(b.tat, now()) + make_interval(secs => %(interval)s)
+          <= now() + make_interval(secs => %(tolerance)s)
+    RETURNING 1
+"""
+
+RETRY_AFTER_SQL = """
+    SELECT extract(epoch FROM tat - now()) + %(interval)s - %(tolerance)s
+    FROM rate_limit_buckets WHERE key = %(key)s
+"""
+
+
+class PostgresBuckets:
+    """GCRA state in an UNLOGGED table, shared by every process using the database.
+
+    Runs on its own few async connections so limiter checks never wait for (or take)
+    a threadpool thread or an SQLAlchemy pool connection.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.conninfo = make_url(DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.idle: asyncio.Queue | None = None
+
+    async def _connection(self) -> psycopg.AsyncConnection:
+        if self.idle is None:
+            self.idle = asyncio.Queue()
+            for _ in range(self.size):
+                self.idle.put_nowait(None)
+        conn = await self.idle.get()
+        if conn is None or conn.closed:
+            try:
+                conn = await psycopg.AsyncConnection.connect(self.conninfo, autocommit=True)
+            except Exception:
+                self.idle.put_nowait(None)
+                raise
+        return conn
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        interval = 1.0 / rate
+        params = {"key": key, "interval": interval, "tolerance": burst * interval}
+        try:
+            conn = await self._connection()
+        except psycopg.Error:
+            # fail open: losing rate limits beats losing the API
+            log.exception("rate limit backend unavailable")
+            return 0.0
+        try:
+            cur = await conn.execute(TAKE_SQL, params)
+            if await cur.fetchone():
+                return 0.0
+            cur = await conn.execute(RETRY_AFTER_SQL, params)
+            row = await cur.fetchone()
+            return max(float(row[0]) if row else interval, 0.001)
+        except psycopg.Error:
+            log.exception("rate limit backend unavailable")
+            await conn.close()
+            conn = None
+            return 0.0
+        finally:
+            self.idle.put_nowait(conn)
+
+
+@job_handler("limits.prune_buckets", max_attempts=1)
+def prune_buckets(payload: dict) -> dict:
+    db = SessionLocal()
+    try:
+        result = db.execute(text("DELETE FROM rate_limit_buckets WHERE tat < now() - interval '1 hour'"))
+        db.commit()
+        return {"deleted": result.rowcount}
+    finally:
+        db.close()
+
+
+if LIMITS_BACKEND == "postgres":
+    schedule("limits.prune_buckets", {}, every_seconds=3600, dedupe_key="limits.prune_buckets")
+
+
+# -------------------------
+# Concurrency
+# -------------------------
+
+class Concurrency:
+    """In-flight counts per (user, class) and per class. Always per process: each
+    process has its own threadpool and DB pool, which is what these protect."""
+
+    def __init__(self):
+        self.per_key: Counter[tuple[str, str]] = Counter()
+        self.per_class: Counter[str] = Counter()
+
+    def acquire(self, key: str, rc: RouteClass) -> bool:
+        if rc.user_concurrency and self.per_key[(key, rc.name)] >= rc.user_concurrency:
+            return False
+        if rc.class_concurrency and self.per_class[rc.name] >= rc.class_concurrency:
+            return False
+        self.per_key[(key, rc.name)] += 1
+        self.per_class[rc.name] += 1
+        return True
+
+    def release(self, key: str, rc: RouteClass) -> None:
+        self.per_key[(key, rc.name)] -= 1
+        if self.per_key[(key, rc.name)] <= 0:
+            del self.per_key[(key, rc.name)]
+        self.per_class[rc.name] -= 1
+
+
+# -------------------------
+# Overload detection
+# -------------------------
+
+class QueueDelayMonitor:
+    """CoDel-style detector over threadpool queue wait.
+
+    Looks at the minimum wait per interval: bursts leave some requests unqueued and
+    keep the minimum low, while a standing queue delays every request.
+    """
+
+    def __init__(self, target_ms: float, interval_ms: float, severe_factor: float):
+        self.target = target_ms / 1000
+        self.interval = interval_ms / 1000
+        self.severe_factor = severe_factor
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.window_min = math.inf
+        self.last_min = 0.0
+        self.last_observed = 0.0
+
+    def observe(self, wait: float) -> None:
+        now = time.monotonic()
+        with self.lock:
+            self.last_observed = now
+            self.window_min = min(self.window_min, wait)
+            if now - self.window_start >= self.interval:
+                self.last_min = self.window_min
+                self.window_min = math.inf
+                self.window_start = now
+
+    def level(self) -> int:
+        """0 = fine, 1 = overloaded, 2 = severely overloaded."""
+        with self.lock:
+            if time.monotonic() - self.last_observed > 2 * self.interval:
+                # nothing got through lately: either idle or wedged; the per-class
+                # concurrency caps cover the wedged case
+                return 0
+            if self.last_min > self.target * self.severe_factor:
+                return 2
+            return 1 if self.last_min > self.target else 0
+
+    def retry_after(self) -> float:
+        return max(1.0, self.last_min * 2)
+
+
+monitor = QueueDelayMonitor(LIMITS_QUEUE_TARGET_MS, LIMITS_QUEUE_INTERVAL_MS, LIMITS_SEVERE_FACTOR)
+
+
+def record_queue_wait(request: Request) -> None:
+    """App-wide sync dependency: runs on the first free threadpool thread, so the time
+    since admission is how long the request queued for one."""
+    admitted_at = request.scope.get("state", {}).get("admitted_at")
+    if admitted_at is not None:
+        monitor.observe(time.monotonic() - admitted_at)
+
+
+# -------------------------
+# Middleware
+# -------------------------
+
+def _client_key(scope) -> str:
+    """The user id from a valid access token, else the client address."""
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            header = value.decode("latin-1")
+            if header.lower().startswith("bearer "):
+                try:
+                    return f"u:{owner_from_token(header[7:])}"
+                except HTTPException:
+                    pass
+            break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+async def _reject(send, status: int, detail: str, retry_after: float) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """Per-user concurrency and rate limits plus load shedding, applied before a request
+    reaches routing, the threadpool or the DB pool."""
+
+    def __init__(self, app):
+        self.app = app
+        self.buckets = PostgresBuckets(LIMITS_PG_CONNECTIONS) if LIMITS_BACKEND == "postgres" else MemoryBuckets()
+        self.concurrency = Concurrency()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not LIMITS_ENABLED:
+            return await self.app(scope, receive, send)
+
+        rc = classify(scope["method"], scope["path"])
+        if rc is None:
+            return await self.app(scope, receive, send)
+
+        level = monitor.level()
+        if level and rc.priority < level:
+            return await _reject(send, 503, "Server overloaded, try again shortly", monitor.retry_after())
+
+        key = _client_key(scope)
+        wait = await self.buckets.take(f"{key}:{rc.name}", rc.rate, rc.burst)
+        if wait > 0:
+            return await _reject(send, 429, "Rate limit exceeded", wait)
+
+        if not self.concurrency.acquire(key, rc):
+            return await _reject(send, 429, "Too many concurrent requests", 1)
+        scope.setdefault("state", {})["admitted_at"] = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.concurrency.release(key, rc)
@@ -1,15 +1,78 @@
-from fastapi import FastAPI
+import logging
+import os
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
 from app.api import router
-from app.db import engine
-app = FastAPI(title="Collector Lists API")
+from app.images import router as images_router
+from app.jobs import router as jobs_router
+from app.sync import router as sync_router
+from app.realtime import hub, router as realtime_router
+from app.db import READ_PIN_HEADER, READ_PIN_SECRET, ReadPinMiddleware, SessionLocal, engine
+from app.limits import AdmissionMiddleware, record_queue_wait
+from app.profiling import router as profiling_router
+from app.compression import CompressionMiddleware
+from app.response_cache import ResponseCacheMiddleware, router as cache_router
+
+log = logging.getLogger(__name__)
+
+# touching this file takes every worker out of rotation before a deploy stops them. It
+# is the only drain signal: once a worker gets SIGTERM, uvicorn stops accepting, so a
+# /ready probe never reaches it, and lifespan shutdown only runs after in-flight
+# requests have finished
+DRAIN_FILE = os.getenv("DRAIN_FILE", "/tmp/drain")
+ALEMBIC_INI = Path(__file__).resolve().parent.parent / "alembic.ini"
+
+_alembic_head: str | None = None
+
+
+def _expected_head() -> str | None:
+    """The migration head this code was built against; None when alembic.ini is not shipped."""
+    global _alembic_head
+    if _alembic_head is None and ALEMBIC_INI.exists():
+        from alembic.config import Config
+        from alembic.script import ScriptDirectory
+
+        _alembic_head = ScriptDirectory.from_config(Config(str(ALEMBIC_INI))).get_current_head()
+    return _alembic_head
+
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if not READ_PIN_SECRET:
+        raise RuntimeError("Set READ_PIN_SECRET or JWT_SECRET_KEY: read pins cannot be signed")
+    # one LISTEN connection per process feeds every SSE/WebSocket subscriber
+    await hub.start()
+    yield
+    await hub.stop()
+
+
+app = FastAPI(
+    title="Collector Lists API",
+    lifespan=lifespan,
+    dependencies=[Depends(record_queue_wait)],
+)
+
+# innermost, so it sees the pin of the route's session whatever response the route built
+app.add_middleware(ReadPinMiddleware)
+# inside admission control, so cache hits still go through it
+app.add_middleware(ResponseCacheMiddleware)
+# outside the cache, which compresses its own entries once and sends them encoded
+app.add_middleware(CompressionMiddleware)
+# added before CORS so CORS wraps it and rejections still carry CORS headers
+app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    # browsers hide other response headers from scripts
+    expose_headers=[READ_PIN_HEADER, "X-Next-Cursor"],
 )
 
 
@@ -17,4 +80,33 @@ app.add_middleware(
 def health():
     return {"status": "ok"}
 
+
+@app.get("/ready")
+def ready():
+    """Readiness, as opposed to /health liveness: 503 while DRAIN_FILE exists, when the
+    database is unreachable, or when its schema is not at the head this code expects."""
+    if os.path.exists(DRAIN_FILE):
+        return JSONResponse(status_code=503, content={"status": "draining"})
+
+    try:
+        with SessionLocal() as db:
+            current = db.execute(text("SELECT version_num FROM alembic_version")).scalar()
+    except Exception:
+        log.warning("readiness check could not reach the database", exc_info=True)
+        return JSONResponse(status_code=503, content={"status": "database unavailable"})
+
+    expected = _expected_head()
+    if expected is not None and current != expected:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "migrations pending", "database": current, "expected": expected},
+        )
+    return {"status": "ready", "revision": current}
+
 app.include_router(router)
+app.include_router(images_router)
+app.include_router(jobs_router)
+app.include_router(sync_router)
+app.include_router(realtime_router)
+app.include_router(profiling_router)
+app.include_router(cache_router)
@@ -1,10 +1,10 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import DateTime, ForeignKey, String, func
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import DateTime, ForeignKey, ForeignKeyConstraint, Index, String, UniqueConstraint, func, text
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import Boolean, Integer, JSON, Date
+from sqlalchemy import BigInteger, Boolean, Identity, Integer, JSON, Date
 
 class Base(DeclarativeBase):
     pass
@@ -21,22 +21,27 @@ class User(Base):
 
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
-    collections: Mapped[list["Collection"]] = relationship(back_populates="owner", cascade="all, delete-orphan")
+    collections: Mapped[list["Collection"]] = relationship(back_populates="owner", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Collection(Base):
     __tablename__ = "collections"
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    owner_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    owner_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
 
     name: Mapped[str] = mapped_column(String(120), nullable=False)
     description: Mapped[str | None] = mapped_column(String(500), nullable=True)
-    fields: Mapped[list["CollectionField"]] = relationship(back_populates="collection", cascade="all, delete-orphan")
-    items: Mapped[list["Item"]] = relationship(back_populates="collection", cascade="all, delete-orphan")
+    # children go through ON DELETE CASCADE in the database, never row by row through the ORM
+    fields: Mapped[list["CollectionField"]] = relationship(back_populates="collection", cascade="all, delete-orphan", passive_deletes=True)
+    items: Mapped[list["Item"]] = relationship(back_populates="collection", cascade="all, delete-orphan", passive_deletes=True)
     icon_url: Mapped[str | None] = mapped_column(String(500), nullable=True)
+    # sha256 of the locally cached icon, set by the image pipeline
+    icon_hash: Mapped[str | None] = mapped_column(String(64), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    # set while a large collection waits for its background purge; hidden from every route
+    deleted_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
     owner: Mapped["User"] = relationship(back_populates="collections")
     collection_type: Mapped[str] = mapped_column(String(32), nullable=False, server_default="custom")
@@ -48,7 +53,7 @@ class CollectionField(Base):
     __tablename__ = "collection_fields"
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    collection_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("collections.id", ondelete="CASCADE"), nullable=False)
+    collection_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("collections.id", ondelete="CASCADE"), nullable=False, index=True)
 
     # stable key like: "platform", "resolution"
     field_key: Mapped[str] = mapped_column(String(64), nullable=False)
@@ -58,43 +63,243 @@ class CollectionField(Base):
     data_type: Mapped[str] = mapped_column(String(32), nullable=False)
 
     required: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default="false")
+    # kept for older clients; fields are listed by rank
     sort_order: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    # position among the collection's fields, see app.ranks
+    rank: Mapped[str] = mapped_column(String(collation="C"), nullable=False)
 
     # for select fields: {"options": ["PS5","PC"]} etc
     options_json: Mapped[dict | None] = mapped_column(JSON, nullable=True)
 
+    # target type while a retype migration backfills values; data_type flips at cut-over
+    pending_data_type: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    # set while a large field's values are purged in the background; hidden from every route
+    deleted_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     collection: Mapped["Collection"] = relationship(back_populates="fields")
-    values: Mapped[list["ItemFieldValue"]] = relationship(back_populates="field", cascade="all, delete-orphan")
+    values: Mapped[list["ItemFieldValue"]] = relationship(back_populates="field", cascade="all, delete-orphan", passive_deletes=True)
+    # code -> label dictionary for select values; loaded with the field for its *Out schema
+    options: Mapped[list["CollectionFieldOption"]] = relationship(
+        back_populates="field",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        lazy="selectin",
+        order_by="CollectionFieldOption.code",
+    )
+
+    __table_args__ = (
+        Index("ix_collection_fields_collection_rank", "collection_id", "rank", "id"),
+    )
+
+
+class CollectionFieldOption(Base):
+    """One choice of a select field. Values store its code, so renaming it is one row
+    update; codes are numbered per field and never reused."""
+    __tablename__ = "collection_field_options"
+
+    field_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("collection_fields.id", ondelete="CASCADE"), primary_key=True)
+    code: Mapped[int] = mapped_column(Integer, primary_key=True)
+    label: Mapped[str] = mapped_column(String, nullable=False)
+
+    field: Mapped["CollectionField"] = relationship(back_populates="options")
+
+    __table_args__ = (
+        UniqueConstraint("field_id", "label", name="uq_collection_field_options_label"),
+    )
 
 
 class Item(Base):
+    """Hash-partitioned by collection_id. The table's primary key is (collection_id, id),
+    as Postgres requires the partition key in it; ids are still unique on their own, so
+    the ORM identifies rows by id alone. Filter on collection_id whenever it is known so
+    the planner can prune to one partition."""
     __tablename__ = "items"
 
-    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    collection_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("collections.id", ondelete="CASCADE"), nullable=False)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
+    collection_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("collections.id", ondelete="CASCADE"), primary_key=True)
 
     title: Mapped[str] = mapped_column(String(200), nullable=False)
     notes: Mapped[str | None] = mapped_column(String(2000), nullable=True)
-    cover_image_url: Mapped[str | None] = mapped_column(String(1000), nullable=True)
+    cover_image_url: Mapped[str | None] = mapped_column(String(1000), nullable=True, index=True)
+    # sha256 of the locally cached cover, set by the image pipeline
+    cover_image_hash: Mapped[str | None] = mapped_column(String(64), nullable=True)
+
+    # provider the item was picked from ("rawg", "tmdb", "anilist") and its id there
+    source: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    external_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    # normalized provider record, kept fresh by the enrichment job
+    metadata_json: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    metadata_refreshed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    # manual position within the collection, see app.ranks; "C" collation so the
+    # index orders keys bytewise
+    rank: Mapped[str] = mapped_column(String(collation="C"), nullable=False)
 
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
 
     collection: Mapped["Collection"] = relationship(back_populates="items")
-    field_values: Mapped[list["ItemFieldValue"]] = relationship(back_populates="item", cascade="all, delete-orphan")
+    field_values: Mapped[list["ItemFieldValue"]] = relationship(back_populates="item", cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (
+        Index("ix_items_source_external_id", "source", "external_id"),
+        # ORDER BY rank, id with keyset pagination, within one partition
+        Index("ix_items_collection_rank", "collection_id", "rank", "id"),
+        {"postgresql_partition_by": "HASH (collection_id)"},
+    )
+    __mapper_args__ = {"primary_key": ["id"]}
 
 
 class ItemFieldValue(Base):
+    """Partitioned like items, so an item and its values always share a partition number."""
     __tablename__ = "item_field_values"
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    item_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("items.id", ondelete="CASCADE"), nullable=False)
-    field_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("collection_fields.id", ondelete="CASCADE"), nullable=False)
-
-    # store value as json to support multiple types (string/number/bool/date/list)
-    value_json: Mapped[dict] = mapped_column(JSON, nullable=False)
+    # copied from the item; the partition key
+    collection_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    item_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    field_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("collection_fields.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    # store value as json to support multiple types (string/number/bool/date/list);
+    # NULL when a select value is stored as option codes instead (see app.options)
+    value_json: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    # single_select: the option's code
+    value_code: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # multi_select: the options' codes, in the order given
+    value_codes: Mapped[list[int] | None] = mapped_column(ARRAY(Integer), nullable=True)
 
     item: Mapped["Item"] = relationship(back_populates="field_values")
     field: Mapped["CollectionField"] = relationship(back_populates="values")
+
+    __table_args__ = (
+        ForeignKeyConstraint(["collection_id", "item_id"], ["items.collection_id", "items.id"], ondelete="CASCADE"),
+        Index("ix_item_field_values_collection_item", "collection_id", "item_id"),
+        # equality/IN filters and per-option counts from the index alone
+        Index(
+            "ix_item_field_values_field_code", "collection_id", "field_id", "value_code",
+            postgresql_where=text("value_code IS NOT NULL"),
+        ),
+        Index("ix_item_field_values_codes", "value_codes", postgresql_using="gin"),
+        {"postgresql_partition_by": "HASH (collection_id)"},
+    )
+    __mapper_args__ = {"primary_key": ["id"]}
+
+
+class FieldMigration(Base):
+    """Progress of an online retype or delete of one field, resumable from cursor."""
+    __tablename__ = "field_migrations"
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    # kept after the field itself is purged, so the outcome stays readable through its job
+    field_id: Mapped[uuid.UUID | None] = mapped_column(UUID(as_uuid=True), ForeignKey("collection_fields.id", ondelete="SET NULL"), nullable=True, index=True)
+    job_id: Mapped[uuid.UUID | None] = mapped_column(UUID(as_uuid=True), nullable=True)
+
+    # "retype" | "delete"
+    kind: Mapped[str] = mapped_column(String(16), nullable=False)
+    from_type: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    to_type: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    # "running" | "succeeded" | "cancelled"
+    status: Mapped[str] = mapped_column(String(16), nullable=False, server_default="running")
+    # "backfill" -> "compact" for retypes, "purge" for deletes
+    phase: Mapped[str] = mapped_column(String(16), nullable=False)
+    # last item_field_values.id handled in the current phase
+    cursor: Mapped[uuid.UUID | None] = mapped_column(UUID(as_uuid=True), nullable=True)
+
+    # values in the field when the job first ran
+    total: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    processed: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    failed: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    # first few conversion failures: [{"value_id", "item_id", "value", "error"}]
+    errors: Mapped[list] = mapped_column(JSON, nullable=False, default=list)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+class RateLimitBucket(Base):
+    """Shared limiter state for LIMITS_BACKEND=postgres; UNLOGGED, as losing it on a
+    crash only resets some rate limits."""
+    __tablename__ = "rate_limit_buckets"
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    key: Mapped[str] = mapped_column(String(200), primary_key=True)
+    # when the bucket would be full again (GCRA theoretical arrival time)
+    tat: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+
+class ImageAsset(Base):
+    __tablename__ = "image_assets"
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    source_url: Mapped[str] = mapped_column(String(1000), unique=True, nullable=False)
+
+    # "pending", "ready", "failed"
+    status: Mapped[str] = mapped_column(String(16), nullable=False, server_default="pending")
+    content_hash: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)
+    content_type: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    error: Mapped[str | None] = mapped_column(String(500), nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    fetched_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    kind: Mapped[str] = mapped_column(String(64), nullable=False)
+    payload: Mapped[dict] = mapped_column(JSON, nullable=False)
+
+    # "queued", "running", "succeeded", "failed"
+    status: Mapped[str] = mapped_column(String(16), nullable=False, server_default="queued")
+    priority: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    max_attempts: Mapped[int] = mapped_column(Integer, nullable=False, server_default="5")
+    run_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    locked_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    locked_by: Mapped[str | None] = mapped_column(String(128), nullable=True)
+
+    last_error: Mapped[str | None] = mapped_column(String(2000), nullable=True)
+    result: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+
+    # at most one queued job per key, so repeated triggers coalesce
+    dedupe_key: Mapped[str | None] = mapped_column(String(200), nullable=True)
+    owner_id: Mapped[uuid.UUID | None] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=True, index=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_jobs_claim", "kind", text("priority DESC"), "run_at", postgresql_where=text("status = 'queued'")),
+        Index("ux_jobs_dedupe_key", "dedupe_key", unique=True, postgresql_where=text("status = 'queued'")),
+    )
+
+
+class ChangeLog(Base):
+    """Append-only record of every mutation, read by GET /sync."""
+    __tablename__ = "change_log"
+
+    id: Mapped[int] = mapped_column(BigInteger, Identity(), primary_key=True)
+    owner_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+
+    # "collection", "field", "item", "value"
+    entity: Mapped[str] = mapped_column(String(16), nullable=False)
+    entity_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    collection_id: Mapped[uuid.UUID | None] = mapped_column(UUID(as_uuid=True), nullable=True)
+    # "upsert", "delete"
+    op: Mapped[str] = mapped_column(String(8), nullable=False)
+
+    # id of the writing transaction; sync tokens are snapshot xmins compared against it
+    txid: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default=text("pg_current_xact_id()::text::bigint"))
+    changed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_change_log_owner_txid", "owner_id", "txid"),
+        Index("ix_change_log_changed_at", "changed_at", postgresql_using="brin"),
+    )
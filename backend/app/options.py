@@ -0,0 +1,94 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.models import CollectionField, CollectionFieldOption
+from app.values import SELECT_TYPES, codable_labels, configured_options, encode_value
+
+# Select values are dictionary-encoded: each field's distinct labels live once in
+# collection_field_options and values hold their integer codes (see app.values).
+
+LOCK_SQL = text("SELECT pg_advisory_xact_lock(hashtextextended(:key, 0))")
+
+# single_select counts come from ix_item_field_values_field_code alone
+COUNT_CODE_SQL = text("""
+    SELECT value_code AS code, count(*) AS n
+    FROM item_field_values
+    WHERE collection_id = :collection AND field_id = :field AND value_code IS NOT NULL
+    GROUP BY value_code
+""")
+
+COUNT_CODES_SQL = text("""
+    SELECT c.code, count(*) AS n
+    FROM item_field_values v, unnest(v.value_codes) AS c(code)
+    WHERE v.collection_id = :collection AND v.field_id = :field AND v.value_codes IS NOT NULL
+    GROUP BY c.code
+""")
+
+
+def codes_for(db: Session, field: CollectionField, labels: list[str]) -> dict[str, int]:
+    """Codes of labels in field's dictionary, adding the ones it does not have yet."""
+    codes = {o.label: o.code for o in field.options}
+    if all(label in codes for label in labels):
+        return codes
+
+    # new codes are max + 1: serialize writers adding options to the same field, then
+    # reload in case one of them just added ours
+    db.execute(LOCK_SQL, {"key": f"options:{field.id}"})
+    db.expire(field, ["options"])
+    codes = {o.label: o.code for o in field.options}
+    next_code = max(codes.values(), default=0) + 1
+    for label in dict.fromkeys(labels):
+        if label not in codes:
+            field.options.append(CollectionFieldOption(code=next_code, label=label))
+            codes[label] = next_code
+            next_code += 1
+    db.flush()
+    return codes
+
+
+def encode(db: Session, field: CollectionField, value: object) -> dict:
+    """ItemFieldValue column values for writing value to field."""
+    if field.pending_data_type is None:
+        labels = codable_labels(field.data_type, value)
+        if labels is not None:
+            return encode_value(field, value, codes_for(db, field, labels))
+    return encode_value(field, value)
+
+
+def sync_configured_options(db: Session, field: CollectionField) -> None:
+    """Gives every choice listed in options_json a code, so the dictionary lists them
+    even before any value uses them."""
+    configured = configured_options(field)
+    if field.data_type in SELECT_TYPES and configured:
+        codes_for(db, field, configured)
+
+
+def rename_option(db: Session, field: CollectionField, code: int, label: str) -> CollectionFieldOption:
+    """Renames one choice: a single row update, whatever the number of values using it.
+
+    Raises LookupError for an unknown code and ValueError when label is taken.
+    """
+    option = next((o for o in field.options if o.code == code), None)
+    if option is None:
+        raise LookupError(f"field has no option {code}")
+    if any(o.label == label and o.code != code for o in field.options):
+        raise ValueError(f"option {label!r} already exists")
+
+    old = option.label
+    option.label = label
+    configured = (field.options_json or {}).get("options")
+    if isinstance(configured, list):
+        # reassigned, not mutated: plain JSON columns do not track in-place changes
+        field.options_json = {
+            **field.options_json,
+            "options": [label if str(o) == old else o for o in configured],
+        }
+    db.flush()
+    return option
+
+
+def option_counts(db: Session, field: CollectionField) -> list[dict]:
+    """Every option of field with the number of values choosing it."""
+    sql = COUNT_CODES_SQL if field.data_type == "multi_select" else COUNT_CODE_SQL
+    counts = dict(db.execute(sql, {"collection": field.collection_id, "field": field.id}).all())
+    return [{"code": o.code, "label": o.label, "count": counts.get(o.code, 0)} for o in field.options]
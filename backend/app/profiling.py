@@ -0,0 +1,200 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from functools import lru_cache
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.orm import Session
+
+from app.auth import get_admin_user
+from app.db import get_db
+from app.models import User
+
+# Admin-only diagnostics for the process that serves the request (one gunicorn worker;
+# X-Worker-Pid says which). Both tools are bounded: the sampler by a hard time cap and
+# one run at a time, tracemalloc by an automatic stop.
+
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "30"))
+PROFILE_MIN_INTERVAL_MS = float(os.getenv("PROFILE_MIN_INTERVAL_MS", "5"))
+PROFILE_MAX_DEPTH = int(os.getenv("PROFILE_MAX_DEPTH", "128"))
+# tracing costs memory and slows every allocation, so it never outlives this
+TRACEMALLOC_MAX_SECONDS = float(os.getenv("TRACEMALLOC_MAX_SECONDS", "900"))
+TRACEMALLOC_MAX_FRAMES = int(os.getenv("TRACEMALLOC_MAX_FRAMES", "25"))
+
+# leaf frames of threads that are parked, not working: thread pool workers waiting
+# for a job, the event loop waiting in select()
+IDLE_LEAVES = {("threading.py", "wait"), ("queue.py", "get"), ("selectors.py", "select")}
+
+router = APIRouter(prefix="/admin")
+
+_profile_lock = threading.Lock()
+_memory_lock = threading.Lock()
+_memory_timer: threading.Timer | None = None
+_memory_last: tracemalloc.Snapshot | None = None
+
+
+@lru_cache(maxsize=4096)
+def _short_path(filename: str) -> str:
+    for prefix in sorted(filter(None, sys.path), key=len, reverse=True):
+        if filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _is_idle(frame) -> bool:
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_LEAVES
+
+
+def sample_stacks(seconds: float, interval: float, include_idle: bool = False) -> tuple[Counter, int]:
+    """Samples every other thread's Python stack each interval for seconds; returns
+    collapsed stacks ("root;...;leaf" -> count) and the number of samples taken."""
+    me = threading.get_ident()
+    names: dict[int, str] = {}
+    stacks: Counter = Counter()
+    samples = 0
+
+    deadline = time.monotonic() + seconds
+    next_at = time.monotonic()
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me or (not include_idle and _is_idle(frame)):
+                continue
+            if ident not in names:
+                names.update((t.ident, t.name) for t in threading.enumerate())
+            labels = []
+            while frame is not None and len(labels) < PROFILE_MAX_DEPTH:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            labels.append(names.get(ident, f"thread-{ident}"))
+            stacks[";".join(reversed(labels))] += 1
+        samples += 1
+
+        next_at += interval
+        time.sleep(max(0.0, next_at - time.monotonic()))
+    return stacks, samples
+
+
+@router.post("/profile/cpu", response_class=PlainTextResponse)
+def profile_cpu(
+    seconds: float = Query(default=10, gt=0),
+    interval_ms: float = Query(default=10),
+    include_idle: bool = False,
+    admin: User = Depends(get_admin_user),
+    db: Session = Depends(get_db),
+):
+    """Collapsed stacks ("frame;frame;frame count" per line) of this worker's threads,
+    ready for flamegraph.pl or speedscope. The stacks are sampled, so overhead is one
+    walk of the thread stacks per interval, whatever the load."""
+    # auth is done; don't hold a pooled connection while sampling
+    db.close()
+
+    seconds = min(seconds, PROFILE_MAX_SECONDS)
+    interval = max(interval_ms, PROFILE_MIN_INTERVAL_MS) / 1000
+    if not _profile_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A profile is already running in this worker")
+    try:
+        stacks, samples = sample_stacks(seconds, interval, include_idle)
+    finally:
+        _profile_lock.release()
+
+    body = "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+    return PlainTextResponse(
+        body,
+        headers={
+            "X-Worker-Pid": str(os.getpid()),
+            "X-Profile-Samples": str(samples),
+            "X-Profile-Seconds": f"{seconds:g}",
+        },
+    )
+
+
+def _stop_tracing() -> None:
+    global _memory_timer, _memory_last
+    with _memory_lock:
+        if _memory_timer is not None:
+            _memory_timer.cancel()
+            _memory_timer = None
+        _memory_last = None
+        tracemalloc.stop()
+
+
+def _memory_status() -> dict:
+    traced, peak = tracemalloc.get_traced_memory()
+    return {
+        "pid": os.getpid(),
+        "tracing": tracemalloc.is_tracing(),
+        "traced_bytes": traced,
+        "peak_bytes": peak,
+        # tracemalloc's own bookkeeping
+        "overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+    }
+
+
+@router.post("/memory/start")
+def start_memory_tracing(
+    seconds: float = Query(default=300, gt=0),
+    frames: int = Query(default=10, ge=1),
+    admin: User = Depends(get_admin_user),
+):
+    """Starts tracing allocations in this worker; it stops by itself after seconds."""
+    global _memory_timer
+    seconds = min(seconds, TRACEMALLOC_MAX_SECONDS)
+    with _memory_lock:
+        if tracemalloc.is_tracing():
+            raise HTTPException(status_code=409, detail="Already tracing in this worker")
+        tracemalloc.start(min(frames, TRACEMALLOC_MAX_FRAMES))
+        _memory_timer = threading.Timer(seconds, _stop_tracing)
+        _memory_timer.daemon = True
+        _memory_timer.start()
+    return {**_memory_status(), "stops_in_seconds": seconds}
+
+
+@router.post("/memory/snapshot")
+def memory_snapshot(
+    top: int = Query(default=25, ge=1, le=500),
+    group_by: str = Query(default="lineno", pattern=r"^(lineno|filename|traceback)$"),
+    admin: User = Depends(get_admin_user),
+):
+    """Largest allocation sites still alive, plus growth since the previous snapshot."""
+    global _memory_last
+    with _memory_lock:
+        if not tracemalloc.is_tracing():
+            raise HTTPException(status_code=409, detail="Not tracing; POST /admin/memory/start first")
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ])
+        previous, _memory_last = _memory_last, snapshot
+
+    out = _memory_status()
+    out["top"] = [
+        {"where": stat.traceback.format(), "size": stat.size, "count": stat.count}
+        for stat in snapshot.statistics(group_by)[:top]
+    ]
+    if previous is not None:
+        out["growth"] = [
+            {
+                "where": stat.traceback.format(),
+                "size": stat.size,
+                "size_diff": stat.size_diff,
+                "count": stat.count,
+                "count_diff": stat.count_diff,
+            }
+            for stat in snapshot.compare_to(previous, group_by)[:top]
+        ]
+    return out
+
+
+@router.post("/memory/stop")
+def stop_memory_tracing(admin: User = Depends(get_admin_user)):
+    _stop_tracing()
+    return _memory_status()
@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+from typing import Any, Iterable
+from urllib.parse import quote
+
+import httpx
+
+# overridable to point at bench/provider_stub.py for offline work and load tests
+RAWG_API_URL = os.getenv("RAWG_API_URL", "https://api.rawg.io/api").rstrip("/")
+TMDB_API_URL = os.getenv("TMDB_API_URL", "https://api.themoviedb.org/3").rstrip("/")
+TMDB_IMAGE_URL = "https://image.tmdb.org/t/p/w500"
+ANILIST_URL = os.getenv("ANILIST_URL", "https://graphql.anilist.co")
+
+# requests per minute we allow ourselves against each provider
+RATE_LIMITS = {
+    "rawg": float(os.getenv("RAWG_RATE_PER_MINUTE", "120")),
+    "tmdb": float(os.getenv("TMDB_RATE_PER_MINUTE", "1200")),
+    "anilist": float(os.getenv("ANILIST_RATE_PER_MINUTE", "60")),
+}
+
+# AniList caps perPage at 50
+ANILIST_BATCH_SIZE = 50
+
+ANILIST_BATCH_QUERY = """
+query ($ids: [Int]) {
+  Page(page: 1, perPage: 50) {
+    media(id_in: $ids, type: ANIME) {
+      id
+      title { romaji english native }
+      coverImage { large }
+      startDate { year month day }
+      episodes
+      averageScore
+    }
+  }
+}
+"""
+
+
+# -------------------------
+# Normalization (shared by /search/* and enrichment)
+# -------------------------
+
+def normalize_rawg(g: dict) -> dict:
+    return {
+        "source": "rawg",
+        "external_id": g.get("id"),
+        "title": g.get("name"),
+        "cover_url": g.get("background_image"),
+        "released": g.get("released"),
+    }
+
+
+def normalize_tmdb(m: dict) -> dict:
+    poster = m.get("poster_path")
+    return {
+        "source": "tmdb",
+        "external_id": m.get("id"),
+        "title": m.get("title"),
+        "cover_url": f"{TMDB_IMAGE_URL}{poster}" if poster else None,
+        "released": m.get("release_date"),
+    }
+
+
+def normalize_anilist(m: dict) -> dict:
+    title = (m.get("title") or {})
+    start = (m.get("startDate") or {})
+    released = "-".join(
+        [str(x).zfill(2) for x in [start.get("year"), start.get("month"), start.get("day")] if x]
+    ) or None
+
+    return {
+        "source": "anilist",
+        "external_id": m.get("id"),
+        "title": title.get("english") or title.get("romaji") or title.get("native") or "",
+        "cover_url": (m.get("coverImage") or {}).get("large"),
+        "released": released,
+        "episodes": m.get("episodes"),
+        "score": m.get("averageScore"),
+    }
+
+
+# -------------------------
+# Pacing
+# -------------------------
+
+class Pacer:
+    """Spaces calls evenly so a provider never sees more than rate_per_minute."""
+
+    def __init__(self, rate_per_minute: float):
+        self.interval = 60.0 / rate_per_minute if rate_per_minute > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_at = 0.0
+
+    def wait(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+    def back_off(self, seconds: float) -> None:
+        with self.lock:
+            self.next_at = max(self.next_at, time.monotonic() + seconds)
+
+
+pacers = {source: Pacer(rate) for source, rate in RATE_LIMITS.items()}
+
+
+def _send(client: httpx.Client, source: str, method: str, url: str, **kwargs) -> httpx.Response | None:
+    """Paced request; honours one 429 Retry-After. Returns None for unknown ids."""
+    for _ in range(2):
+        pacers[source].wait()
+        r = client.request(method, url, **kwargs)
+        if r.status_code == 429:
+            pacers[source].back_off(float(r.headers.get("Retry-After") or 60))
+            continue
+        if r.status_code == 404:
+            return None
+        r.raise_for_status()
+        return r
+    r.raise_for_status()
+    return None
+
+
+def _chunks(ids: list[str], size: int) -> Iterable[list[str]]:
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+# -------------------------
+# Batch lookups by external id
+# -------------------------
+
+def fetch_rawg(client: httpx.Client, ids: list[str]) -> dict[str, dict | None]:
+    # RAWG has no multi-id lookup, so this is one paced call per game
+    key = os.getenv("RAWG_API_KEY")
+    if not key:
+        raise RuntimeError("RAWG_API_KEY not set")
+
+    out: dict[str, dict | None] = {}
+    # ids are validated on the way in, but rows stored before that may hold anything
+    for external_id in ids:
+        r = _send(client, "rawg", "GET", f"{RAWG_API_URL}/games/{quote(external_id, safe='')}", params={"key": key})
+        out[external_id] = normalize_rawg(r.json()) if r else None
+    return out
+
+
+def fetch_tmdb(client: httpx.Client, ids: list[str]) -> dict[str, dict | None]:
+    key = os.getenv("TMDB_API_KEY")
+    if not key:
+        raise RuntimeError("TMDB_API_KEY not set")
+
+    out: dict[str, dict | None] = {}
+    for external_id in ids:
+        r = _send(client, "tmdb", "GET", f"{TMDB_API_URL}/movie/{quote(external_id, safe='')}", params={"api_key": key})
+        out[external_id] = normalize_tmdb(r.json()) if r else None
+    return out
+
+
+def fetch_anilist(client: httpx.Client, ids: list[str]) -> dict[str, dict | None]:
+    out: dict[str, dict | None] = {}
+    for chunk in _chunks(ids, ANILIST_BATCH_SIZE):
+        numeric = [int(i) for i in chunk if i.isdigit()]
+        r = _send(
+            client,
+            "anilist",
+            "POST",
+            ANILIST_URL,
+            json={"query": ANILIST_BATCH_QUERY, "variables": {"ids": numeric}},
+            headers={"Content-Type": "application/json", "Accept": "application/json"},
+        )
+        media = ((r.json() if r else {}).get("data") or {}).get("Page", {}).get("media", []) or []
+        found = {str(m.get("id")): normalize_anilist(m) for m in media}
+        for external_id in chunk:
+            out[external_id] = found.get(external_id)
+    return out
+
+
+FETCHERS: dict[str, Any] = {
+    "rawg": fetch_rawg,
+    "tmdb": fetch_tmdb,
+    "anilist": fetch_anilist,
+}
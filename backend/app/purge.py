@@ -0,0 +1,83 @@
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal
+from app.jobs import enqueue, job_handler
+from app.models import Collection
+
+log = logging.getLogger(__name__)
+
+# collections with more items than this are soft-deleted and purged in the background
+PURGE_THRESHOLD = int(os.getenv("PURGE_THRESHOLD", "2000"))
+# items per purge transaction (their values go with them via ON DELETE CASCADE)
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "1000"))
+# breathing room between batches for replicas and concurrent writers
+PURGE_BATCH_PAUSE = float(os.getenv("PURGE_BATCH_PAUSE", "0.05"))
+
+COUNT_UP_TO_SQL = text("""
+    SELECT count(*) FROM (
+        SELECT 1 FROM items WHERE collection_id = :cid LIMIT :limit
+    ) s
+""")
+
+DELETE_ITEMS_BATCH_SQL = text("""
+    DELETE FROM items WHERE collection_id = :cid AND id IN (
+        SELECT id FROM items WHERE collection_id = :cid LIMIT :limit
+    )
+""")
+
+
+def is_large(db: Session, collection_id: UUID) -> bool:
+    # counts at most PURGE_THRESHOLD + 1 rows, so this stays cheap on huge collections
+    return db.execute(COUNT_UP_TO_SQL, {"cid": collection_id, "limit": PURGE_THRESHOLD + 1}).scalar() > PURGE_THRESHOLD
+
+
+def soft_delete_collection(db: Session, col: Collection) -> UUID:
+    """Hides col immediately and queues its purge in the caller's transaction."""
+    col.deleted_at = datetime.now(timezone.utc)
+    return enqueue(
+        db,
+        "collections.purge",
+        {"collection_id": str(col.id)},
+        owner_id=col.owner_id,
+        dedupe_key=f"collections.purge:{col.id}",
+    )
+
+
+@job_handler("collections.purge", concurrency=2, max_attempts=10)
+def purge_collection_job(payload: dict) -> dict:
+    """Deletes a soft-deleted collection in short transactions; resumes where it stopped."""
+    collection_id = UUID(payload["collection_id"])
+    purged = 0
+
+    while True:
+        db = SessionLocal()
+        try:
+            col = db.get(Collection, collection_id)
+            if col is None:
+                return {"items": purged}
+            if col.deleted_at is None:
+                # restored or never soft-deleted; nothing to do
+                return {"items": purged, "skipped": True}
+
+            deleted = db.execute(
+                DELETE_ITEMS_BATCH_SQL, {"cid": collection_id, "limit": PURGE_BATCH_SIZE}
+            ).rowcount
+            if deleted == 0:
+                # only fields (now value-less) and the collection row are left
+                db.execute(text("DELETE FROM collections WHERE id = :cid"), {"cid": collection_id})
+            db.commit()
+        finally:
+            db.close()
+
+        if deleted == 0:
+            log.info("purged collection %s (%d items)", collection_id, purged)
+            return {"items": purged}
+        purged += deleted
+        time.sleep(PURGE_BATCH_PAUSE)
@@ -0,0 +1,257 @@
+import logging
+import os
+from uuid import UUID
+
+from sqlalchemy import select, text, tuple_
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal
+from app.jobs import enqueue, job_handler
+from app.models import Collection, CollectionField, Item
+
+log = logging.getLogger(__name__)
+
+# A rank is a 12-digit base-62 integer followed by an optional base-62 fraction, compared
+# bytewise (the columns use the "C" collation). Appending or prepending steps the
+# integer, so keys only grow when elements are moved between two close neighbours;
+# each move rewrites the moved row and nothing else. Once a key gets longer than
+# RANK_MAX_LENGTH the collection is queued for a rebalance that respaces every key.
+RANK_MAX_LENGTH = int(os.getenv("RANK_MAX_LENGTH", "24"))
+
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+BASE = len(DIGITS)
+WIDTH = 12
+MAX_INT = BASE**WIDTH - 1
+FIRST_RANK = "V" + "0" * (WIDTH - 1)
+
+# evenly spaced keys in the current order: decimal strings are valid base-62 digits,
+# and at a fixed width they sort like the numbers they spell
+RESPACED_RANK_SQL = "(100000000000 + row_number() OVER (ORDER BY rank, id) * 1000)::text"
+
+REBALANCE_SQL = {
+    "item": text(f"""
+        WITH respaced AS (
+            SELECT id, {RESPACED_RANK_SQL} AS rank FROM items WHERE collection_id = :collection
+        ),
+        updated AS (
+            UPDATE items AS i SET rank = r.rank
+            FROM respaced r
+            WHERE i.collection_id = :collection AND i.id = r.id AND i.rank <> r.rank
+            RETURNING i.id
+        )
+        INSERT INTO change_log (owner_id, entity, entity_id, collection_id, op)
+        SELECT :owner, 'item', id, :collection, 'upsert' FROM updated
+    """),
+    "field": text(f"""
+        WITH respaced AS (
+            SELECT id, {RESPACED_RANK_SQL} AS rank
+            FROM collection_fields WHERE collection_id = :collection AND deleted_at IS NULL
+        ),
+        updated AS (
+            UPDATE collection_fields AS f SET rank = r.rank
+            FROM respaced r
+            WHERE f.id = r.id AND f.rank <> r.rank
+            RETURNING f.id
+        )
+        INSERT INTO change_log (owner_id, entity, entity_id, collection_id, op)
+        SELECT :owner, 'field', id, :collection, 'upsert' FROM updated
+    """),
+}
+
+LOCK_SQL = text("SELECT pg_advisory_xact_lock(hashtextextended(:key, 0))")
+
+MODELS = {"item": Item, "field": CollectionField}
+
+
+class RankSpaceExhausted(Exception):
+    """Nothing sorts before the smallest possible key; the collection needs respacing."""
+
+
+def _encode_int(n: int) -> str:
+    out = []
+    for _ in range(WIDTH):
+        n, d = divmod(n, BASE)
+        out.append(DIGITS[d])
+    return "".join(reversed(out))
+
+
+def _decode_int(s: str) -> int:
+    n = 0
+    for c in s:
+        n = n * BASE + DIGITS.index(c)
+    return n
+
+
+def _midpoint(a: str, b: str | None) -> str:
+    """A fraction strictly between a and b (None: 1). Fractions never end in "0",
+    so there is always room on both sides."""
+    if b is not None:
+        n = 0
+        while (a[n] if n < len(a) else "0") == b[n]:
+            n += 1
+        if n:
+            return b[:n] + _midpoint(a[n:], b[n:])
+
+    da = DIGITS.index(a[0]) if a else 0
+    db = DIGITS.index(b[0]) if b is not None else BASE
+    if db - da > 1:
+        return DIGITS[(da + db) // 2]
+    if b is not None and len(b) > 1:
+        return b[0]
+    return DIGITS[da] + _midpoint(a[1:], None)
+
+
+def rank_between(a: str | None, b: str | None) -> str:
+    """A rank sorting after a and before b; None means the start or the end."""
+    if a is not None and b is not None and a >= b:
+        raise ValueError(f"rank {a!r} does not sort before {b!r}")
+    if a is None and b is None:
+        return FIRST_RANK
+
+    ia = _decode_int(a[:WIDTH]) if a is not None else None
+    ib = _decode_int(b[:WIDTH]) if b is not None else None
+    if a is None:
+        if ib == 0 and len(b) == WIDTH:
+            raise RankSpaceExhausted(f"no rank sorts before {b!r}")
+        return _encode_int(ib - 1) if ib > 0 else b[:WIDTH] + _midpoint("", b[WIDTH:])
+    if b is None:
+        return _encode_int(ia + 1) if ia < MAX_INT else a[:WIDTH] + _midpoint(a[WIDTH:], None)
+    if ib - ia > 1:
+        return _encode_int((ia + ib) // 2)
+    if ib - ia == 1:
+        return a[:WIDTH] + _midpoint(a[WIDTH:], None)
+    return a[:WIDTH] + _midpoint(a[WIDTH:], b[WIDTH:])
+
+
+def lock_ranks(db: Session, collection_id: UUID) -> None:
+    """Serializes rank changes within a collection until the caller's transaction ends,
+    so two writers never pick the same key."""
+    db.execute(LOCK_SQL, {"key": f"ranks:{collection_id}"})
+
+
+def _scope(model, collection_id: UUID) -> list:
+    conds = [model.collection_id == collection_id]
+    if model is CollectionField:
+        conds.append(CollectionField.deleted_at.is_(None))
+    return conds
+
+
+def _edge_rank(db: Session, model, collection_id: UUID, last: bool) -> str | None:
+    order = (model.rank.desc(), model.id.desc()) if last else (model.rank.asc(), model.id.asc())
+    return db.execute(
+        select(model.rank).where(*_scope(model, collection_id)).order_by(*order).limit(1)
+    ).scalar()
+
+
+def _check_length(db: Session, entity: str, collection_id: UUID, rank: str, owner_id: UUID) -> None:
+    if len(rank) > RANK_MAX_LENGTH:
+        enqueue(
+            db,
+            "ranks.rebalance",
+            {"entity": entity, "collection_id": str(collection_id)},
+            owner_id=owner_id,
+            dedupe_key=f"ranks.rebalance:{entity}:{collection_id}",
+        )
+
+
+def _respace(db: Session, model, collection_id: UUID) -> None:
+    """What rebalance_job does, in the caller's transaction, which holds the ranks lock."""
+    entity = "item" if model is Item else "field"
+    owner_id = db.execute(select(Collection.owner_id).where(Collection.id == collection_id)).scalar_one()
+    db.flush()
+    db.execute(REBALANCE_SQL[entity], {"collection": collection_id, "owner": owner_id})
+    # loaded rows still hold their old ranks
+    db.expire_all()
+
+
+def first_rank(db: Session, model, collection_id: UUID) -> str:
+    """Rank that puts a new row before every other one; call before inserting it."""
+    lock_ranks(db, collection_id)
+    try:
+        return rank_between(None, _edge_rank(db, model, collection_id, last=False))
+    except RankSpaceExhausted:
+        _respace(db, model, collection_id)
+        return rank_between(None, _edge_rank(db, model, collection_id, last=False))
+
+
+def last_rank(db: Session, model, collection_id: UUID) -> str:
+    """Rank that puts a new row after every other one; call before inserting it."""
+    lock_ranks(db, collection_id)
+    return rank_between(_edge_rank(db, model, collection_id, last=True), None)
+
+
+def _neighbour(db: Session, model, scope: list, row_id: UUID):
+    neighbour = db.execute(select(model).where(*scope, model.id == row_id)).scalar_one_or_none()
+    if neighbour is None:
+        raise LookupError(f"{row_id} is not in this collection")
+    return neighbour
+
+
+def _adjacent(db: Session, model, scope: list, of, after: bool):
+    key = tuple_(model.rank, model.id)
+    if after:
+        stmt = select(model).where(*scope, key > tuple_(of.rank, of.id)).order_by(model.rank.asc(), model.id.asc())
+    else:
+        stmt = select(model).where(*scope, key < tuple_(of.rank, of.id)).order_by(model.rank.desc(), model.id.desc())
+    return db.execute(stmt.limit(1)).scalar_one_or_none()
+
+
+def move(db: Session, row, after_id: UUID | None, before_id: UUID | None, owner_id: UUID) -> None:
+    """Re-ranks row (an Item or CollectionField) to sit right after after_id and/or right
+    before before_id; the neighbour not given is looked up. Only row is written.
+
+    Raises LookupError for a neighbour outside row's collection and ValueError when
+    after_id does not sort before before_id.
+    """
+    model = type(row)
+    entity = "item" if model is Item else "field"
+    lock_ranks(db, row.collection_id)
+    try:
+        rank = _rank_for_move(db, row, after_id, before_id)
+    except RankSpaceExhausted:
+        # only when moving to the very top past the smallest key; respacing makes room
+        _respace(db, model, row.collection_id)
+        rank = _rank_for_move(db, row, after_id, before_id)
+
+    row.rank = rank
+    _check_length(db, entity, row.collection_id, row.rank, owner_id)
+
+
+def _rank_for_move(db: Session, row, after_id: UUID | None, before_id: UUID | None) -> str:
+    model = type(row)
+    # re-read under the lock: a concurrent move or rebalance may have changed it
+    db.refresh(row, ["rank"])
+
+    scope = _scope(model, row.collection_id) + [model.id != row.id]
+    after = _neighbour(db, model, scope, after_id) if after_id else None
+    before = _neighbour(db, model, scope, before_id) if before_id else None
+    if after is not None and before is None and before_id is None:
+        before = _adjacent(db, model, scope, after, after=True)
+    elif before is not None and after is None and after_id is None:
+        after = _adjacent(db, model, scope, before, after=False)
+
+    if after is not None and before is not None and (after.rank, after.id) >= (before.rank, before.id):
+        raise ValueError("after_id must come before before_id")
+
+    return rank_between(after.rank if after else None, before.rank if before else None)
+
+
+@job_handler("ranks.rebalance", concurrency=2, max_attempts=5)
+def rebalance_job(payload: dict) -> dict:
+    """Respaces the ranks of a collection's items or fields, keeping their order."""
+    entity = payload["entity"]
+    collection_id = UUID(payload["collection_id"])
+
+    db = SessionLocal()
+    try:
+        col = db.get(Collection, collection_id)
+        if col is None or entity not in MODELS:
+            return {"status": "skipped"}
+        lock_ranks(db, collection_id)
+        updated = db.execute(REBALANCE_SQL[entity], {"collection": collection_id, "owner": col.owner_id}).rowcount
+        db.commit()
+    finally:
+        db.close()
+
+    log.info("rebalanced %s ranks of collection %s: %s rows", entity, collection_id, updated)
+    return {"updated": updated}
@@ -0,0 +1,231 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Callable
+from uuid import UUID
+
+import psycopg
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from sqlalchemy.engine import make_url
+
+from app.auth import access_claims, get_token_claims
+from app.db import DATABASE_URL
+
+log = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# channel the change_log trigger notifies on (see the add_change_notify migration)
+CHANNEL = "collector_changes"
+
+REALTIME_HEARTBEAT_SECONDS = float(os.getenv("REALTIME_HEARTBEAT_SECONDS", "15"))
+# pending collection ids per subscriber before we give up tracking and ask for a resync
+REALTIME_MAX_PENDING = int(os.getenv("REALTIME_MAX_PENDING", "100"))
+REALTIME_MAX_SUBSCRIBERS = int(os.getenv("REALTIME_MAX_SUBSCRIBERS", "10000"))
+REALTIME_MAX_PER_OWNER = int(os.getenv("REALTIME_MAX_PER_OWNER", "20"))
+
+
+class Subscriber:
+    """One client connection. Events coalesce into a bounded pending set, so a slow
+    consumer costs at most REALTIME_MAX_PENDING ids no matter how much changes."""
+
+    def __init__(self, owner_id: UUID):
+        self.owner_id = owner_id
+        self.pending: set[str] = set()
+        self.resync = False
+        self.ready = asyncio.Event()
+
+    def push(self, collection_ids: list[str] | None) -> None:
+        if collection_ids is None or self.resync:
+            self.resync = True
+            self.pending.clear()
+        else:
+            self.pending.update(collection_ids)
+            if len(self.pending) > REALTIME_MAX_PENDING:
+                self.resync = True
+                self.pending.clear()
+        self.ready.set()
+
+    async def next_message(self, timeout: float = REALTIME_HEARTBEAT_SECONDS) -> dict | None:
+        """Waits for changes; returns None when it is time for a heartbeat."""
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+        self.ready.clear()
+        if self.resync:
+            self.resync = False
+            return {"type": "resync"}
+        collections, self.pending = sorted(self.pending), set()
+        return {"type": "changes", "collections": collections}
+
+
+class Hub:
+    """Fans out NOTIFY payloads from one LISTEN connection to this process's subscribers."""
+
+    def __init__(self):
+        self.subscribers: dict[UUID, set[Subscriber]] = {}
+        self.count = 0
+        self.task: asyncio.Task | None = None
+        # extra in-process consumers, called with (owner_id, collection_ids);
+        # (None, None) means notifications may have been missed
+        self.listeners: list[Callable[[UUID | None, list[str] | None], None]] = []
+
+    def subscribe(self, owner_id: UUID) -> Subscriber:
+        owned = self.subscribers.get(owner_id, set())
+        if self.count >= REALTIME_MAX_SUBSCRIBERS or len(owned) >= REALTIME_MAX_PER_OWNER:
+            raise HTTPException(status_code=503, detail="Too many subscribers", headers={"Retry-After": "30"})
+        sub = Subscriber(owner_id)
+        owned.add(sub)
+        self.subscribers[owner_id] = owned
+        self.count += 1
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        owned = self.subscribers.get(sub.owner_id)
+        if owned and sub in owned:
+            owned.discard(sub)
+            self.count -= 1
+            if not owned:
+                del self.subscribers[sub.owner_id]
+
+    def dispatch(self, owner_id: UUID, collection_ids: list[str] | None) -> None:
+        for sub in self.subscribers.get(owner_id, ()):
+            sub.push(collection_ids)
+        for listener in self.listeners:
+            listener(owner_id, collection_ids)
+
+    def dispatch_all_resync(self) -> None:
+        for owned in self.subscribers.values():
+            for sub in owned:
+                sub.push(None)
+        for listener in self.listeners:
+            listener(None, None)
+
+    def handle(self, payload: str) -> None:
+        try:
+            data = json.loads(payload)
+            owner_id = UUID(data["o"])
+        except (ValueError, KeyError, TypeError):
+            log.warning("ignoring malformed notification: %.200s", payload)
+            return
+        # "c" is null when the trigger had too many collections to list
+        self.dispatch(owner_id, data.get("c"))
+
+    async def _listen(self) -> None:
+        conninfo = make_url(DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        backoff = 1.0
+        first = True
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(conninfo, autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {CHANNEL}")
+                    log.info("listening on %s", CHANNEL)
+                    if not first:
+                        # notifications sent while we were disconnected are lost
+                        self.dispatch_all_resync()
+                    first = False
+                    backoff = 1.0
+                    async for notify in conn.notifies():
+                        self.handle(notify.payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("change listener disconnected; retrying in %.0fs", backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+
+    async def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+hub = Hub()
+
+
+# -------------------------
+# Endpoints
+# -------------------------
+
+def _until_expiry(expires_at: int) -> float:
+    return expires_at - time.time()
+
+
+@router.get("/events")
+async def events(request: Request, claims: tuple[UUID, int] = Depends(get_token_claims)):
+    """Server-sent events: "changes" with the touched collection ids, or "resync".
+
+    Clients react by calling GET /sync. EventSource cannot set headers, so the
+    access token may also be passed as ?access_token=. The stream ends with an
+    "expired" event when the token does; reconnect with a fresh one.
+    """
+    owner_id, expires_at = claims
+    sub = hub.subscribe(owner_id)
+
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                remaining = _until_expiry(expires_at)
+                if remaining <= 0:
+                    yield 'event: expired\ndata: {"type": "expired"}\n\n'
+                    break
+                message = await sub.next_message(min(REALTIME_HEARTBEAT_SECONDS, remaining))
+                if message is not None:
+                    yield f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+                elif _until_expiry(expires_at) > 0:
+                    yield ": ping\n\n"
+        finally:
+            hub.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/ws")
+async def websocket_events(websocket: WebSocket):
+    try:
+        owner_id, expires_at = access_claims(websocket.query_params.get("access_token", ""))
+    except HTTPException:
+        await websocket.close(code=4401)
+        return
+
+    await websocket.accept()
+    try:
+        sub = hub.subscribe(owner_id)
+    except HTTPException:
+        await websocket.close(code=1013)
+        return
+
+    try:
+        while True:
+            remaining = _until_expiry(expires_at)
+            if remaining <= 0:
+                await websocket.send_json({"type": "expired"})
+                await websocket.close(code=4401, reason="token expired")
+                break
+            message = await sub.next_message(min(REALTIME_HEARTBEAT_SECONDS, remaining))
+            if message is not None:
+                await websocket.send_json(message)
+            elif _until_expiry(expires_at) > 0:
+                await websocket.send_json({"type": "ping"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        hub.unsubscribe(sub)
@@ -0,0 +1,442 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from urllib.parse import parse_qsl
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import event
+
+from app.auth import get_admin_user, owner_from_token
+from app.compression import (
+    COMPRESSION_ENABLED,
+    COMPRESSION_MIN_BYTES,
+    compress,
+    encoded_headers,
+    negotiate,
+    off_loop,
+    with_vary,
+)
+from app.db import (
+    DB_REPLICA_STICKY_SECONDS,
+    READ_PIN_HEADER,
+    SessionLocal,
+    reads_pinned_to_primary,
+    replica_engine,
+)
+from app.models import ChangeLog, User
+from app.realtime import hub
+
+log = logging.getLogger(__name__)
+
+# Whole encoded responses of hot GET routes, per process. A hit is served from the
+# middleware: no routing, no SQL (the owner comes from the token alone), no JSON
+# encoding. Entries are dropped when their data changes: at commit for writes made in
+# this process, and through the change_log NOTIFY (app.realtime.hub) for writes made
+# in any other worker. The TTL only bounds the damage of a missed message.
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# bigger responses (large list_items pages) are not worth the memory
+RESPONSE_CACHE_MAX_ENTRY_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRY_BYTES", str(256 * 1024)))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "300"))
+# invalidation marks remembered per (owner, collection); past this they are folded into one
+RESPONSE_CACHE_MAX_MARKS = int(os.getenv("RESPONSE_CACHE_MAX_MARKS", "100000"))
+
+UUID_RE = r"[0-9a-fA-F-]{36}"
+
+# (name, path); a "collection" group scopes the entry to that collection, otherwise it
+# depends on everything the owner has
+CACHED_ROUTES = [
+    ("list_collections", re.compile(r"^/collections$")),
+    ("list_fields", re.compile(rf"^/collections/(?P<collection>{UUID_RE})/fields$")),
+    ("list_items", re.compile(rf"^/collections/(?P<collection>{UUID_RE})/items$")),
+]
+
+# collection part of a scope that stands for all of an owner's collections
+ALL = "*"
+
+# rough per-entry bookkeeping on top of the body and headers
+ENTRY_OVERHEAD = 300
+
+
+@dataclass
+class CachedResponse:
+    headers: list[tuple[bytes, bytes]]
+    body: bytes
+    scope: tuple
+    size: int
+    expires_at: float
+    # encoding -> compressed body, made on first request for it
+    variants: dict[str, bytes] = field(default_factory=dict)
+
+
+class ResponseCache:
+    """LRU of encoded responses under a byte budget, invalidated per (owner, collection).
+
+    A response is stored only if nothing it depends on was invalidated since its request
+    began, so a slow read racing a write can never cache pre-write data.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[tuple, CachedResponse] = OrderedDict()
+        self.keys_by_scope: dict[tuple, set[tuple]] = {}
+        self.scopes_by_owner: dict[UUID, set[tuple]] = {}
+        self.bytes = 0
+        # bumped by every invalidation; requests remember its value when they begin
+        self.clock = 0
+        self.marks: dict[tuple, tuple[int, float]] = {}
+        self.floor: tuple[int, float] = (0, 0.0)
+        self.stats = Counter()
+        self.route_stats: dict[str, Counter] = {}
+
+    def _count(self, route: str, outcome: str) -> None:
+        self.stats[outcome] += 1
+        self.route_stats.setdefault(route, Counter())[outcome] += 1
+
+    def get(self, key: tuple) -> CachedResponse | None:
+        route = key[0]
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self._count(route, "misses")
+                return None
+            self.entries.move_to_end(key)
+            self._count(route, "hits")
+            return entry
+
+    def begin(self) -> int:
+        with self.lock:
+            return self.clock
+
+    def _stale(self, scope: tuple, started: int, from_replica: bool) -> bool:
+        now = time.monotonic()
+        owner = scope[0]
+        for mark in (self.floor, self.marks.get(scope), self.marks.get((owner, ALL))):
+            if mark is None:
+                continue
+            clock, at = mark
+            if clock > started:
+                return True
+            # the replica may not have replayed that change yet when we read it
+            if from_replica and now - at < DB_REPLICA_STICKY_SECONDS:
+                return True
+        return False
+
+    def put(self, key: tuple, entry: CachedResponse, started: int, from_replica: bool) -> None:
+        with self.lock:
+            if self._stale(entry.scope, started, from_replica):
+                self._count(key[0], "skipped")
+                return
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = entry
+            self.keys_by_scope.setdefault(entry.scope, set()).add(key)
+            self.scopes_by_owner.setdefault(entry.scope[0], set()).add(entry.scope)
+            self.bytes += entry.size
+            self._count(key[0], "stores")
+            while self.bytes > self.max_bytes and self.entries:
+                self._drop(next(iter(self.entries)))
+                self.stats["evictions"] += 1
+
+    def add_variant(self, key: tuple, entry: CachedResponse, encoding: str, body: bytes) -> None:
+        with self.lock:
+            if encoding in entry.variants:
+                return
+            entry.variants[encoding] = body
+            if self.entries.get(key) is entry:
+                entry.size += len(body)
+                self.bytes += len(body)
+                self.stats["compressions"] += 1
+                while self.bytes > self.max_bytes and self.entries:
+                    self._drop(next(iter(self.entries)))
+                    self.stats["evictions"] += 1
+
+    def _drop(self, key: tuple) -> None:
+        entry = self.entries.pop(key)
+        self.bytes -= entry.size
+        keys = self.keys_by_scope.get(entry.scope)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.keys_by_scope[entry.scope]
+                scopes = self.scopes_by_owner.get(entry.scope[0])
+                if scopes is not None:
+                    scopes.discard(entry.scope)
+                    if not scopes:
+                        del self.scopes_by_owner[entry.scope[0]]
+
+    def _drop_scope(self, scope: tuple) -> None:
+        for key in list(self.keys_by_scope.get(scope, ())):
+            self._drop(key)
+
+    def invalidate(self, owner_id: UUID, collection_ids: list[UUID] | None) -> None:
+        """Drops what changes to collection_ids (None: any of the owner's data) affect."""
+        with self.lock:
+            self.clock += 1
+            mark = (self.clock, time.monotonic())
+            self.stats["invalidations"] += 1
+
+            if collection_ids is None:
+                self.marks[(owner_id, ALL)] = mark
+                for scope in list(self.scopes_by_owner.get(owner_id, ())):
+                    self._drop_scope(scope)
+            else:
+                # owner-wide routes (list_collections) depend on every collection
+                for scope in [(owner_id, None)] + [(owner_id, c) for c in collection_ids]:
+                    self.marks[scope] = mark
+                    self._drop_scope(scope)
+
+            if len(self.marks) > RESPONSE_CACHE_MAX_MARKS:
+                self.marks.clear()
+                self.floor = mark
+
+    def clear(self) -> None:
+        with self.lock:
+            self.clock += 1
+            self.floor = (self.clock, time.monotonic())
+            self.marks.clear()
+            self.entries.clear()
+            self.keys_by_scope.clear()
+            self.scopes_by_owner.clear()
+            self.bytes = 0
+            self.stats["clears"] += 1
+
+    def report(self) -> dict:
+        with self.lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                "pid": os.getpid(),
+                "enabled": RESPONSE_CACHE_ENABLED,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hit_ratio": self.stats["hits"] / lookups if lookups else None,
+                **self.stats,
+                "routes": {
+                    route: {
+                        **counts,
+                        "hit_ratio": counts["hits"] / (counts["hits"] + counts["misses"])
+                        if counts["hits"] + counts["misses"] else None,
+                    }
+                    for route, counts in self.route_stats.items()
+                },
+            }
+
+
+cache = ResponseCache(RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL_SECONDS)
+
+
+# -------------------------
+# Invalidation
+# -------------------------
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_changes(session, flush_context):
+    # every write path logs its changes (app.sync.record_change); session.new still
+    # holds them here
+    for obj in session.new:
+        if isinstance(obj, ChangeLog):
+            session.info.setdefault("cache_changes", set()).add((obj.owner_id, obj.collection_id))
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _invalidate_committed(session):
+    changes = session.info.pop("cache_changes", None)
+    if not changes:
+        return
+    by_owner: dict[UUID, list[UUID]] = {}
+    for owner_id, collection_id in changes:
+        ids = by_owner.setdefault(owner_id, [])
+        if collection_id is not None:
+            ids.append(collection_id)
+    for owner_id, collection_ids in by_owner.items():
+        cache.invalidate(owner_id, collection_ids)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_changes(session):
+    session.info.pop("cache_changes", None)
+
+
+def _on_notify(owner_id: UUID | None, collection_ids: list[str] | None) -> None:
+    if owner_id is None:
+        # the listener reconnected and may have missed changes
+        cache.clear()
+        return
+    try:
+        ids = [UUID(c) for c in collection_ids] if collection_ids is not None else None
+    except (TypeError, ValueError):
+        ids = None
+    cache.invalidate(owner_id, ids)
+
+
+hub.listeners.append(_on_notify)
+
+
+# -------------------------
+# Middleware
+# -------------------------
+
+def _match(path: str) -> tuple[str, UUID | None] | None:
+    for name, pattern in CACHED_ROUTES:
+        m = pattern.match(path)
+        if m is None:
+            continue
+        collection = m.groupdict().get("collection")
+        try:
+            return name, UUID(collection) if collection else None
+        except ValueError:
+            return None
+    return None
+
+
+def _owner(scope) -> UUID | None:
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            header = value.decode("latin-1")
+            if header.lower().startswith("bearer "):
+                try:
+                    return owner_from_token(header[7:])
+                except HTTPException:
+                    return None
+            return None
+    return None
+
+
+def _read_pin(scope) -> str | None:
+    wanted = READ_PIN_HEADER.lower().encode()
+    for name, value in scope.get("headers", ()):
+        if name == wanted:
+            return value.decode("latin-1")
+    return None
+
+
+def _accepted_encoding(scope) -> str | None:
+    if not COMPRESSION_ENABLED:
+        return None
+    for name, value in scope.get("headers", ()):
+        if name == b"accept-encoding":
+            return negotiate(value.decode("latin-1"))
+    return None
+
+
+async def _send_entry(send, key: tuple, entry: CachedResponse, encoding: str | None, outcome: bytes) -> None:
+    """Sends entry, compressed with encoding when worth it; each variant is compressed
+    once and kept with the entry, so app.compression passes these through."""
+    headers = entry.headers + [(b"x-cache", outcome)]
+    body = entry.body
+    if encoding is not None and len(body) >= COMPRESSION_MIN_BYTES:
+        variant = entry.variants.get(encoding)
+        if variant is None:
+            variant = await off_loop(lambda data: compress(data, encoding), body)
+            cache.add_variant(key, entry, encoding, variant)
+        headers, body = encoded_headers(headers, encoding, len(variant)), variant
+    elif COMPRESSION_ENABLED:
+        headers = with_vary(headers)
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+class ResponseCacheMiddleware:
+    """Serves CACHED_ROUTES from the response cache, filling it on 200 responses."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or not RESPONSE_CACHE_ENABLED:
+            return await self.app(scope, receive, send)
+        matched = _match(scope["path"])
+        if matched is None:
+            return await self.app(scope, receive, send)
+        # unauthenticated or invalid: let the route answer 401
+        owner_id = _owner(scope)
+        if owner_id is None:
+            return await self.app(scope, receive, send)
+        # the client just wrote, possibly through another worker whose invalidation has
+        # not reached this one yet: read from the primary, as get_read_db will
+        if reads_pinned_to_primary(owner_id, _read_pin(scope)):
+            return await self.app(scope, receive, send)
+
+        route, collection_id = matched
+        query = tuple(sorted(parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True)))
+        key = (route, owner_id, collection_id, query)
+        encoding = _accepted_encoding(scope)
+
+        entry = cache.get(key)
+        if entry is not None:
+            return await _send_entry(send, key, entry, encoding, b"hit")
+
+        started = cache.begin()
+        # unpinned, so get_read_db will use the replica if there is one
+        from_replica = replica_engine is not None
+        start = None
+        chunks: list[bytes] = []
+        size = 0
+        buffering = True
+
+        async def send_and_capture(message):
+            nonlocal start, size, buffering
+            if not buffering:
+                return await send(message)
+            if message["type"] == "http.response.start":
+                if message["status"] != 200:
+                    buffering = False
+                    return await send(message)
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                return await send(message)
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            chunks.append(body)
+            size += len(body)
+            if size > RESPONSE_CACHE_MAX_ENTRY_BYTES:
+                # too big to keep: hand over what was held back and stream the rest
+                buffering = False
+                await send({**start, "headers": list(start.get("headers", ())) + [(b"x-cache", b"miss")]})
+                await send({"type": "http.response.body", "body": b"".join(chunks), "more_body": more_body})
+                chunks.clear()
+                return
+            if more_body:
+                return
+
+            buffering = False
+            headers = list(start.get("headers", ()))
+            body = b"".join(chunks)
+            entry = CachedResponse(
+                headers=headers,
+                body=body,
+                scope=(owner_id, collection_id),
+                size=len(body) + sum(len(k) + len(v) for k, v in headers) + ENTRY_OVERHEAD,
+                expires_at=time.monotonic() + cache.ttl,
+            )
+            cache.put(key, entry, started, from_replica)
+            await _send_entry(send, key, entry, encoding, b"miss")
+
+        await self.app(scope, receive, send_and_capture)
+
+
+router = APIRouter(prefix="/admin")
+
+
+@router.get("/cache")
+def cache_stats(admin: User = Depends(get_admin_user)):
+    """This worker's response cache: hit ratio, memory use and churn, overall and per route."""
+    return cache.report()
+
+
+@router.delete("/cache", status_code=204)
+def clear_cache(admin: User = Depends(get_admin_user)):
+    cache.clear()
@@ -1,4 +1,6 @@
-from pydantic import BaseModel, Field
+from typing import Annotated, Any, Literal
+
+from pydantic import BaseModel, BeforeValidator, Field
 from uuid import UUID
 from datetime import datetime
 
@@ -9,6 +11,20 @@ class CollectionCreate(BaseModel):
     collection_type: str = "custom"
     icon_url: str | None = None
 
+class CollectionUpdate(BaseModel):
+    name: str | None = None
+    description: str | None = None
+    icon_url: str | None = None
+    collection_type: str | None = None
+
+
+class CollectionClone(BaseModel):
+    # defaults to "<source name> (copy)"
+    name: str | None = Field(default=None, min_length=1, max_length=120)
+    # false copies the fields only, e.g. to start a new list from a template
+    include_items: bool = True
+
+
 class CollectionOut(BaseModel):
     id: UUID
     owner_id: UUID
@@ -18,6 +34,7 @@ class CollectionOut(BaseModel):
     updated_at: datetime
     collection_type: str
     icon_url: str | None
+    icon_hash: str | None = None
     class Config:
         from_attributes = True
 
@@ -28,10 +45,25 @@ class CollectionFieldCreate(BaseModel):
     label: str = Field(min_length=1, max_length=120)
     data_type: str = Field(min_length=1, max_length=32)  # we'll validate allowed values later
     required: bool = False
+    # stored for older clients; new fields are ranked last (see POST /fields/{id}/move)
     sort_order: int = 0
     options_json: dict | None = None
 
 
+class FieldOptionOut(BaseModel):
+    code: int
+    label: str
+    # values choosing the option; only from GET /fields/{id}/options
+    count: int | None = None
+
+    class Config:
+        from_attributes = True
+
+
+class FieldOptionUpdate(BaseModel):
+    label: str = Field(min_length=1, max_length=200)
+
+
 class CollectionFieldOut(BaseModel):
     id: UUID
     collection_id: UUID
@@ -40,18 +72,72 @@ class CollectionFieldOut(BaseModel):
     data_type: str
     required: bool
     sort_order: int
+    rank: str
     options_json: dict | None
+    # code -> label dictionary of select values, for decoding value_code(s)
+    options: list[FieldOptionOut] = []
+    # set while values are being migrated to a new data_type
+    pending_data_type: str | None = None
     created_at: datetime
 
     class Config:
         from_attributes = True
+
+
+class CollectionFieldUpdate(BaseModel):
+    field_key: str | None = Field(default=None, min_length=1, max_length=64, pattern=r"^[a-zA-Z][a-zA-Z0-9_]*$")
+    label: str | None = Field(default=None, min_length=1, max_length=120)
+    # changing it starts an online migration of the field's values
+    data_type: str | None = Field(default=None, pattern=r"^(text|number|boolean|date|single_select|multi_select)$")
+    required: bool | None = None
+    sort_order: int | None = None
+    options_json: dict | None = None
+
+
+class FieldMigrationOut(BaseModel):
+    id: UUID
+    field_id: UUID | None
+    job_id: UUID | None
+    kind: str
+    from_type: str | None
+    to_type: str | None
+    status: str
+    phase: str
+    total: int | None
+    processed: int
+    failed: int
+    errors: list
+    created_at: datetime
+    updated_at: datetime
+    finished_at: datetime | None
+
+    class Config:
+        from_attributes = True
         
         
 
+def _number_to_str(value):
+    # search results carry the RAWG/TMDB/AniList ids as numbers
+    return str(value) if isinstance(value, int) and not isinstance(value, bool) else value
+
+
+# a provider's id for an item: stored as String(64) and part of provider URLs
+ExternalId = Annotated[str, BeforeValidator(_number_to_str), Field(pattern=r"^[0-9A-Za-z_-]{1,64}$")]
+
+
 class ItemCreate(BaseModel):
     title: str = Field(min_length=1, max_length=200)
     notes: str | None = Field(default=None, max_length=2000)
     cover_image_url: str | None = Field(default=None, max_length=1000)
+    # set when the item was picked from a /search/* result
+    source: str | None = Field(default=None, pattern=r"^(rawg|tmdb|anilist)$")
+    external_id: ExternalId | None = None
+
+
+class ItemUpdate(BaseModel):
+    title: str | None = Field(default=None, min_length=1, max_length=200)
+    notes: str | None = Field(default=None, max_length=2000)
+    cover_image_url: str | None = Field(default=None, max_length=1000)
 
 
 class ItemOut(BaseModel):
@@ -60,6 +146,11 @@ class ItemOut(BaseModel):
     title: str
     notes: str | None
     cover_image_url: str | None
+    cover_image_hash: str | None = None
+    source: str | None = None
+    external_id: ExternalId | None = None
+    metadata_json: dict | None = None
+    rank: str
     created_at: datetime
     updated_at: datetime
 
@@ -67,6 +158,13 @@ class ItemOut(BaseModel):
         from_attributes = True
 
 
+class MoveRequest(BaseModel):
+    # the element to place this one right after and/or right before; the one left out
+    # is taken to be the current neighbour of the one given
+    after_id: UUID | None = None
+    before_id: UUID | None = None
+
+
 
 class ItemFieldValueUpsert(BaseModel):
     field_key: str = Field(min_length=1, max_length=64)
@@ -83,6 +181,12 @@ class ItemFieldValueOut(BaseModel):
 
     value: object | None = None
     value_json: dict
+    # select values: the option codes behind value, stable across option renames
+    value_code: int | None = None
+    value_codes: list[int] | None = None
+    # while the field is being retyped: the value as it will read after cut-over
+    pending_data_type: str | None = None
+    pending_value: object | None = None
 
     class Config:
         from_attributes = True
@@ -107,3 +211,78 @@ class TokenPair(BaseModel):
 
 class RefreshRequest(BaseModel):
     refresh_token: str
+
+
+
+class JobOut(BaseModel):
+    id: UUID
+    kind: str
+    status: str
+    attempts: int
+    max_attempts: int
+    run_at: datetime
+    last_error: str | None
+    result: dict | None
+    created_at: datetime
+    finished_at: datetime | None
+
+    class Config:
+        from_attributes = True
+
+
+class JobAccepted(BaseModel):
+    job_id: UUID
+    status_url: str
+
+
+
+class BatchOperation(BaseModel):
+    op: Literal[
+        "create_collection",
+        "update_collection",
+        "delete_collection",
+        "create_field",
+        "update_field",
+        "delete_field",
+        "create_item",
+        "update_item",
+        "delete_item",
+        "upsert_values",
+    ]
+    # name later operations can use as "$<ref>" in collection_id / field_id / item_id
+    ref: str | None = Field(default=None, min_length=1, max_length=64)
+    collection_id: str | None = None
+    field_id: str | None = None
+    item_id: str | None = None
+    # body of the equivalent single-object request
+    data: dict | list | None = None
+
+
+class BatchRequest(BaseModel):
+    operations: list[BatchOperation] = Field(min_length=1, max_length=1000)
+
+
+class BatchResult(BaseModel):
+    index: int
+    op: str
+    ref: str | None
+    id: UUID | None
+    result: Any = None
+
+
+
+class Tombstone(BaseModel):
+    entity: str
+    id: UUID
+    collection_id: UUID | None = None
+
+
+class SyncOut(BaseModel):
+    token: str
+    # true when the client must reload GET /sync/snapshot instead of applying a delta
+    reset: bool = False
+    collections: list[CollectionOut] = []
+    fields: list[CollectionFieldOut] = []
+    items: list[ItemOut] = []
+    values: list[ItemFieldValueOut] = []
+    deleted: list[Tombstone] = []
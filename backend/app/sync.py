@@ -0,0 +1,259 @@
+import os
+import time
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.auth import get_current_user
+from app.db import SessionLocal, get_db
+from app.jobs import job_handler, schedule
+from app.models import ChangeLog, Collection, CollectionField, Item, ItemFieldValue, User
+from app.schemas import SyncOut
+from app.values import value_view
+
+router = APIRouter()
+
+# change_log rows older than this are pruned; older tokens must re-snapshot
+SYNC_RETENTION_DAYS = float(os.getenv("SYNC_RETENTION_DAYS", "30"))
+# past this many changed rows a full snapshot is cheaper than a delta
+SYNC_MAX_CHANGES = int(os.getenv("SYNC_MAX_CHANGES", "5000"))
+
+
+def record_change(
+    db: Session,
+    owner_id: UUID,
+    entity: str,
+    entity_id: UUID,
+    op: str = "upsert",
+    collection_id: UUID | None = None,
+) -> None:
+    """Logs a mutation in the caller's transaction so it commits (or not) with it."""
+    db.add(ChangeLog(owner_id=owner_id, entity=entity, entity_id=entity_id, collection_id=collection_id, op=op))
+
+
+# -------------------------
+# Tokens
+# -------------------------
+#
+# A token is "<xmin>.<issued_at>": xmin is the oldest transaction still running
+# when the token was issued, so every change with txid < xmin was already visible.
+# Changes at or above it may have been in flight and are sent again next time,
+# which is harmless because clients apply them as upserts.
+
+CURRENT_XMIN_SQL = text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+
+
+def _issue_token(db: Session) -> str:
+    return f"{db.execute(CURRENT_XMIN_SQL).scalar()}.{int(time.time())}"
+
+
+def _parse_token(token: str) -> tuple[int, int]:
+    try:
+        xmin, issued_at = token.split(".", 1)
+        return int(xmin), int(issued_at)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+
+
+def _reset(token: str) -> dict:
+    return {"token": token, "reset": True}
+
+
+CHANGED_SQL = text("""
+    SELECT DISTINCT ON (entity, entity_id) entity, entity_id, collection_id, op
+    FROM change_log
+    WHERE owner_id = :owner AND txid >= :since
+    ORDER BY entity, entity_id, id DESC
+    LIMIT :limit
+""")
+
+
+def _value_rows(db: Session, value_ids: list[UUID], collection_ids: set[UUID]) -> list[dict]:
+    rows = (
+        db.query(ItemFieldValue, CollectionField)
+        .join(CollectionField, ItemFieldValue.field_id == CollectionField.id)
+        .filter(
+            ItemFieldValue.collection_id.in_(collection_ids),
+            ItemFieldValue.id.in_(value_ids),
+            CollectionField.deleted_at.is_(None),
+        )
+        .all()
+    )
+    return [value_view(v, f) for (v, f) in rows]
+
+
+@router.get("/sync", response_model=SyncOut)
+def sync(
+    since: str | None = Query(default=None),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Rows changed since the token plus tombstones for deleted ones.
+
+    A deleted collection or item implies its fields/items/values are gone too;
+    those cascaded rows get no tombstones of their own.
+    """
+    # issued before reading, so anything committing meanwhile is re-sent next time
+    token = _issue_token(db)
+    if since is None:
+        return _reset(token)
+
+    since_xmin, issued_at = _parse_token(since)
+    if time.time() - issued_at > SYNC_RETENTION_DAYS * 86400:
+        return _reset(token)
+
+    changed = db.execute(
+        CHANGED_SQL,
+        {"owner": current_user.id, "since": since_xmin, "limit": SYNC_MAX_CHANGES + 1},
+    ).all()
+    if len(changed) > SYNC_MAX_CHANGES:
+        return _reset(token)
+
+    ids: dict[str, list[UUID]] = {"collection": [], "field": [], "item": [], "value": []}
+    # partition keys of the changed items/values, so those lookups prune
+    collection_ids: dict[str, set[UUID]] = {"item": set(), "value": set()}
+    for row in changed:
+        ids[row.entity].append(row.entity_id)
+        if row.entity in collection_ids:
+            collection_ids[row.entity].add(row.collection_id)
+
+    collections = (
+        db.query(Collection)
+        .filter(
+            Collection.id.in_(ids["collection"]),
+            Collection.owner_id == current_user.id,
+            Collection.deleted_at.is_(None),
+        )
+        .all()
+    ) if ids["collection"] else []
+    fields = (
+        db.query(CollectionField)
+        .filter(CollectionField.id.in_(ids["field"]), CollectionField.deleted_at.is_(None))
+        .all()
+    ) if ids["field"] else []
+    items = (
+        db.query(Item)
+        .filter(Item.collection_id.in_(collection_ids["item"]), Item.id.in_(ids["item"]))
+        .all()
+    ) if ids["item"] else []
+    values = _value_rows(db, ids["value"], collection_ids["value"]) if ids["value"] else []
+
+    present = {c.id for c in collections} | {f.id for f in fields} | {i.id for i in items} | {v["id"] for v in values}
+    deleted = [
+        {"entity": row.entity, "id": row.entity_id, "collection_id": row.collection_id}
+        for row in changed
+        if row.entity_id not in present
+    ]
+
+    return {
+        "token": token,
+        "reset": False,
+        "collections": collections,
+        "fields": fields,
+        "items": items,
+        "values": values,
+        "deleted": deleted,
+    }
+
+
+# one round trip: the whole library as a single JSON document built by Postgres
+SNAPSHOT_SQL = text("""
+    SELECT json_build_object(
+        'token', pg_snapshot_xmin(pg_current_snapshot())::text || '.' || floor(extract(epoch FROM now()))::bigint::text,
+        'collections', COALESCE((
+            SELECT json_agg(c ORDER BY c.created_at) FROM (
+                SELECT id, owner_id, name, description, collection_type, icon_url, icon_hash,
+                       created_at, updated_at
+                FROM collections WHERE owner_id = :owner AND deleted_at IS NULL
+            ) c), '[]'::json),
+        'fields', COALESCE((
+            SELECT json_agg(f) FROM (
+                SELECT f.id, f.collection_id, f.field_key, f.label, f.data_type, f.required,
+                       f.sort_order, f.rank, f.options_json, f.pending_data_type, f.created_at,
+                       COALESCE((
+                           SELECT json_agg(json_build_object('code', o.code, 'label', o.label) ORDER BY o.code)
+                           FROM collection_field_options o WHERE o.field_id = f.id
+                       ), '[]'::json) AS options
+                FROM collection_fields f JOIN collections c ON c.id = f.collection_id
+                WHERE c.owner_id = :owner AND c.deleted_at IS NULL AND f.deleted_at IS NULL
+            ) f), '[]'::json),
+        'items', COALESCE((
+            SELECT json_agg(i) FROM (
+                SELECT i.id, i.collection_id, i.title, i.notes, i.cover_image_url, i.cover_image_hash,
+                       i.source, i.external_id, i.metadata_json, i.rank, i.created_at, i.updated_at
+                FROM items i JOIN collections c ON c.id = i.collection_id
+                WHERE c.owner_id = :owner AND c.deleted_at IS NULL
+            ) i), '[]'::json),
+        'values', COALESCE((
+            SELECT json_agg(v) FROM (
+                -- option codes are decoded; during a field retype only the representation
+                -- current for data_type is sent; see app.values
+                SELECT v.id, v.item_id, v.field_id, v.value_code, v.value_codes,
+                       CASE WHEN v.value_code IS NOT NULL
+                            THEN json_build_object('value', (
+                                SELECT o.label FROM collection_field_options o
+                                WHERE o.field_id = v.field_id AND o.code = v.value_code))
+                            WHEN v.value_codes IS NOT NULL
+                            THEN json_build_object('value', COALESCE((
+                                SELECT json_agg(o.label ORDER BY c.n)
+                                FROM unnest(v.value_codes) WITH ORDINALITY AS c(code, n)
+                                JOIN collection_field_options o ON o.field_id = v.field_id AND o.code = c.code
+                            ), '[]'::json))
+                            WHEN v.value_json->>'t' = f.data_type
+                            THEN json_build_object('value', v.value_json->'next')
+                            ELSE json_build_object('value', v.value_json->'value')
+                       END AS value_json
+                FROM item_field_values v
+                JOIN collection_fields f ON f.id = v.field_id
+                JOIN collections c ON c.id = v.collection_id
+                WHERE c.owner_id = :owner AND c.deleted_at IS NULL AND f.deleted_at IS NULL
+            ) v), '[]'::json)
+    )::text
+""")
+
+
+@router.get("/sync/snapshot")
+def sync_snapshot(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Cold-start download: the full library and a token to continue with GET /sync."""
+    body = db.execute(SNAPSHOT_SQL, {"owner": current_user.id}).scalar().encode()
+    db.close()
+
+    # compressed on the way out by app.compression
+    return Response(content=body, media_type="application/json", headers={"Cache-Control": "no-store"})
+
+
+# -------------------------
+# Retention
+# -------------------------
+
+@job_handler("sync.prune_change_log", max_attempts=3)
+def prune_change_log(payload: dict) -> dict:
+    db = SessionLocal()
+    try:
+        deleted = 0
+        while True:
+            # bounded batches keep each transaction short
+            result = db.execute(
+                text("""
+                    DELETE FROM change_log WHERE id IN (
+                        SELECT id FROM change_log
+                        WHERE changed_at < now() - make_interval(secs => :secs)
+                        LIMIT 10000
+                    )
+                """),
+                {"secs": SYNC_RETENTION_DAYS * 86400},
+            )
+            db.commit()
+            deleted += result.rowcount
+            if result.rowcount < 10000:
+                return {"deleted": deleted}
+    finally:
+        db.close()
+
+
+schedule("sync.prune_change_log", {}, every_seconds=86400, dedupe_key="sync.prune_change_log")
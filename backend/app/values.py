@@ -0,0 +1,189 @@
+import math
+from datetime import date
+
+from app.models import CollectionField, ItemFieldValue
+
+DATA_TYPES = ("text", "number", "boolean", "date", "single_select", "multi_select")
+
+# value_json normally is {"value": v}. While a retype migration runs, rows also carry
+# the converted value: {"value": old, "next": new, "t": to_type}, plus "err" when the
+# conversion failed. "next" wins as soon as t matches the field's data_type, so
+# cut-over is a single update of the field row and never touches the values.
+DUAL_KEYS = ("next", "t", "err")
+
+# Select values that are plain labels (a string; a list of strings) are stored as
+# option codes in value_code / value_codes with value_json NULL. Anything else, and
+# every value of a field in the middle of a retype, stays in value_json.
+SELECT_TYPES = ("single_select", "multi_select")
+
+TRUE_STRINGS = {"true", "yes", "y", "1", "on"}
+FALSE_STRINGS = {"false", "no", "n", "0", "off"}
+
+
+def configured_options(field: CollectionField) -> list[str] | None:
+    options = (field.options_json or {}).get("options")
+    # an empty list means "not configured", not "nothing allowed"
+    return [str(o) for o in options] if isinstance(options, list) and options else None
+
+
+def _check_option(value: str, options: list[str] | None) -> str:
+    if options is not None and value not in options:
+        raise ValueError(f"{value!r} is not one of the field's options")
+    return value
+
+
+def convert_value(value: object, to_type: str, options: list[str] | None = None) -> object:
+    """Converts a stored value to to_type; raises ValueError when there is no faithful equivalent."""
+    if value is None or value == "" or value == []:
+        return None
+
+    if to_type == "text":
+        if isinstance(value, list):
+            return ", ".join(str(v) for v in value)
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        return str(value)
+
+    if to_type == "number":
+        if isinstance(value, bool):
+            raise ValueError("booleans do not convert to numbers")
+        if isinstance(value, (int, float)):
+            return value
+        if isinstance(value, str):
+            s = value.strip()
+            try:
+                return int(s)
+            except ValueError:
+                n = float(s)
+            if not math.isfinite(n):
+                raise ValueError(f"{value!r} is not a finite number")
+            return n
+        raise ValueError(f"cannot convert {type(value).__name__} to a number")
+
+    if to_type == "boolean":
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, (int, float)) and value in (0, 1):
+            return bool(value)
+        if isinstance(value, str):
+            s = value.strip().lower()
+            if s in TRUE_STRINGS:
+                return True
+            if s in FALSE_STRINGS:
+                return False
+        raise ValueError(f"{value!r} is not a boolean")
+
+    if to_type == "date":
+        if isinstance(value, str):
+            # accepts full timestamps too and keeps their date part
+            return date.fromisoformat(value.strip()[:10]).isoformat()
+        raise ValueError(f"{value!r} is not a date")
+
+    if to_type == "single_select":
+        if isinstance(value, list):
+            if len(value) != 1:
+                raise ValueError("only a single choice converts to single_select")
+            value = value[0]
+        return _check_option(str(value), options)
+
+    if to_type == "multi_select":
+        if isinstance(value, list):
+            choices = [str(v) for v in value]
+        elif isinstance(value, str):
+            choices = [s.strip() for s in value.split(",") if s.strip()]
+        else:
+            choices = [str(value)]
+        return [_check_option(c, options) for c in choices]
+
+    raise ValueError(f"unknown data_type {to_type!r}")
+
+
+def effective_value(value_json: dict | None, data_type: str) -> object:
+    value_json = value_json or {}
+    if "t" in value_json and value_json["t"] == data_type:
+        return value_json.get("next")
+    return value_json.get("value")
+
+
+def dual_value(value: object, field: CollectionField, to_type: str) -> dict:
+    """Both representations of value: as the field's current type and as to_type."""
+    out = {"value": value, "t": to_type, "next": None}
+    try:
+        out["next"] = convert_value(value, to_type, configured_options(field))
+    except ValueError as e:
+        out["err"] = str(e)
+    return out
+
+
+def codable_labels(data_type: str, value: object) -> list[str] | None:
+    """The option labels value is made of, or None when it is kept as JSON."""
+    if data_type == "single_select" and isinstance(value, str) and value != "":
+        return [value]
+    if data_type == "multi_select" and isinstance(value, list) and all(isinstance(v, str) for v in value):
+        return value
+    return None
+
+
+def coded_columns(data_type: str, labels: list[str], codes: dict[str, int]) -> dict:
+    if data_type == "single_select":
+        return {"value_json": None, "value_code": codes[labels[0]], "value_codes": None}
+    return {"value_json": None, "value_code": None, "value_codes": [codes[label] for label in labels]}
+
+
+def encode_value(field: CollectionField, value: object, codes: dict[str, int] | None = None) -> dict:
+    """Column values for a write: option codes when value is made of labels found in
+    codes, otherwise value_json, which carries both representations while a retype is pending."""
+    if field.pending_data_type is not None:
+        return {"value_json": dual_value(value, field, field.pending_data_type), "value_code": None, "value_codes": None}
+    labels = codable_labels(field.data_type, value)
+    if labels is not None and codes is not None:
+        return coded_columns(field.data_type, labels, codes)
+    return {"value_json": {"value": value}, "value_code": None, "value_codes": None}
+
+
+def stored_value(v, data_type: str, labels: dict[int, str]) -> object:
+    """What a value row (ORM object or result row) reads as, decoding option codes with labels."""
+    if v.value_code is not None:
+        return labels.get(v.value_code)
+    if v.value_codes is not None:
+        return [labels.get(c) for c in v.value_codes]
+    return effective_value(v.value_json, data_type)
+
+
+def compact_value(value_json: dict, data_type: str) -> dict:
+    """Drops the migration bookkeeping once data_type is final; failed conversions keep
+    their original value under "invalid" instead of losing it."""
+    out = {"value": effective_value(value_json, data_type)}
+    if value_json.get("t") == data_type and "err" in value_json:
+        out["invalid"] = value_json.get("value")
+    return out
+
+
+def option_labels(field: CollectionField) -> dict[int, str]:
+    return {o.code: o.label for o in field.options}
+
+
+def value_view(v: ItemFieldValue, f: CollectionField) -> dict:
+    """ItemFieldValueOut fields for one value row."""
+    raw = v.value_json or {}
+    value = stored_value(v, f.data_type, option_labels(f))
+    row = {
+        "id": v.id,
+        "item_id": v.item_id,
+        "field_id": v.field_id,
+        "field_key": f.field_key,
+        "label": f.label,
+        "data_type": f.data_type,
+        "value": value,
+        "value_json": {**{k: x for k, x in raw.items() if k not in DUAL_KEYS}, "value": value},
+        "value_code": v.value_code,
+        "value_codes": v.value_codes,
+    }
+    if f.pending_data_type is not None:
+        row["pending_data_type"] = f.pending_data_type
+        if raw.get("t") == f.pending_data_type:
+            row["pending_value"] = raw.get("next")
+        else:
+            # not backfilled yet: convert on the fly
+            row["pending_value"] = dual_value(value, f, f.pending_data_type)["next"]
+    return row
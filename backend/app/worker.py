@@ -0,0 +1,172 @@
+import importlib
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from uuid import UUID
+
+from app import jobs
+from app.db import SessionLocal
+
+log = logging.getLogger("app.worker")
+
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_VISIBILITY_TIMEOUT = float(os.getenv("JOB_VISIBILITY_TIMEOUT", "300"))
+JOB_HEARTBEAT_INTERVAL = JOB_VISIBILITY_TIMEOUT / 3
+
+# modules whose @job_handler registrations the worker serves
+HANDLER_MODULES = [
+    "app.images",
+    "app.enrichment",
+    "app.sync",
+    "app.purge",
+    "app.field_migrations",
+    "app.limits",
+    "app.ranks",
+]
+
+
+class Worker:
+    def __init__(self, name: str | None = None):
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.inflight: Counter[str] = Counter()
+        self.running: set[UUID] = set()
+        self.next_periodic: dict[int, float] = {}
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, sum(t.concurrency for t in jobs.registry.values())),
+            thread_name_prefix="job",
+        )
+
+    def stop(self, *_args) -> None:
+        log.info("worker %s draining", self.name)
+        self.stopping.set()
+
+    def run(self) -> None:
+        log.info("worker %s serving %s", self.name, ", ".join(sorted(jobs.registry)))
+        last_maintenance = 0.0
+
+        while not self.stopping.is_set():
+            now = time.monotonic()
+            if now - last_maintenance >= JOB_HEARTBEAT_INTERVAL:
+                self._maintenance()
+                last_maintenance = now
+
+            self._enqueue_periodic(now)
+            claimed = self._claim_available()
+            if not claimed:
+                self.stopping.wait(JOB_POLL_INTERVAL)
+
+        # let in-flight jobs finish; anything killed mid-way is requeued by visibility timeout
+        self.executor.shutdown(wait=True)
+        log.info("worker %s stopped", self.name)
+
+    def _maintenance(self) -> None:
+        db = SessionLocal()
+        try:
+            with self.lock:
+                running = list(self.running)
+            jobs.heartbeat(db, running)
+            requeued = jobs.requeue_stale(db, JOB_VISIBILITY_TIMEOUT)
+            if requeued:
+                log.warning("requeued or failed %d stale jobs", requeued)
+        except Exception:
+            log.exception("job maintenance failed")
+            db.rollback()
+        finally:
+            db.close()
+
+    def _enqueue_periodic(self, now: float) -> None:
+        due = [
+            (i, p) for i, p in enumerate(jobs.periodic)
+            if self.next_periodic.get(i, 0.0) <= now
+        ]
+        if not due:
+            return
+
+        db = SessionLocal()
+        try:
+            for i, p in due:
+                jobs.enqueue(db, p.kind, p.payload, dedupe_key=p.dedupe_key)
+                self.next_periodic[i] = now + p.every_seconds
+            db.commit()
+        except Exception:
+            log.exception("enqueueing periodic jobs failed")
+            db.rollback()
+        finally:
+            db.close()
+
+    def _claim_available(self) -> int:
+        claimed = 0
+        db = SessionLocal()
+        try:
+            for kind, job_type in jobs.registry.items():
+                with self.lock:
+                    free = job_type.concurrency - self.inflight[kind]
+                if free <= 0:
+                    continue
+
+                for row in jobs.claim(db, kind, free, self.name):
+                    with self.lock:
+                        self.inflight[kind] += 1
+                        self.running.add(row.id)
+                    self.executor.submit(self._execute, job_type, row)
+                    claimed += 1
+        except Exception:
+            log.exception("claiming jobs failed")
+            db.rollback()
+        finally:
+            db.close()
+        return claimed
+
+    def _execute(self, job_type: jobs.JobType, row) -> None:
+        started = time.monotonic()
+        db = SessionLocal()
+        try:
+            try:
+                result = job_type.handler(row.payload or {})
+            except Exception as e:
+                log.warning("job %s (%s) attempt %d failed: %s", row.id, row.kind, row.attempts, e)
+                error = "".join(traceback.format_exception_only(type(e), e)).strip()
+                recorded = jobs.mark_failed(
+                    db, row.id, self.name, row.attempts, row.max_attempts, error, job_type.backoff_seconds
+                )
+            else:
+                recorded = jobs.mark_succeeded(db, row.id, self.name, result)
+                log.info("job %s (%s) done in %.2fs", row.id, row.kind, time.monotonic() - started)
+            if not recorded:
+                log.warning(
+                    "job %s (%s) attempt %d was requeued as stale before it finished; outcome dropped",
+                    row.id, row.kind, row.attempts,
+                )
+        except Exception:
+            log.exception("recording outcome of job %s failed", row.id)
+        finally:
+            db.close()
+            with self.lock:
+                self.inflight[job_type.kind] -= 1
+                self.running.discard(row.id)
+
+
+def main() -> None:
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO"),
+        format="%(asctime)s %(levelname)s %(name)s %(message)s",
+    )
+    for module in HANDLER_MODULES:
+        importlib.import_module(module)
+
+    worker = Worker()
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""Local stand-in for the RAWG, TMDB and AniList APIs, for load tests with no network.
+
+Replays recorded responses ("cassettes") with injectable latency, jitter, server
+errors and 429s, so the search and enrichment paths (caching, pooling, timeouts,
+fan-out) can be measured deterministically:
+
+    python bench/provider_stub.py --latency-ms 120 --jitter-ms 40 --error-rate 0.01 \\
+        --throttle-rate 0.02 --seed 1
+
+    RAWG_API_URL=http://127.0.0.1:8787/rawg TMDB_API_URL=http://127.0.0.1:8787/tmdb \\
+    ANILIST_URL=http://127.0.0.1:8787/anilist RAWG_API_KEY=stub TMDB_API_KEY=stub \\
+        uvicorn app.main:app
+
+Cassettes are recorded once on a machine with network access, with real keys in the
+app's environment: --record forwards each unrecorded request to the real provider and
+saves the answer to <cassettes>/<provider>.json, without the key. Requests with no
+recording get a 502, or with --synthesize a generated answer shaped like the
+provider's. GET /_stub/stats returns per-provider counters.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import httpx
+
+UPSTREAMS = {
+    "rawg": "https://api.rawg.io/api",
+    "tmdb": "https://api.themoviedb.org/3",
+    "anilist": "https://graphql.anilist.co",
+}
+
+# never written to cassettes nor part of the match
+SECRET_PARAMS = {"key", "api_key"}
+
+
+def request_key(method: str, path: str, query: str, body: bytes) -> str:
+    """What a recording is matched on: method, path, query without keys, JSON body."""
+    params = sorted((k, v) for k, v in parse_qsl(query, keep_blank_values=True) if k not in SECRET_PARAMS)
+    payload = ""
+    if body:
+        try:
+            data = json.loads(body)
+        except ValueError:
+            payload = body.decode("utf-8", "replace")
+        else:
+            if isinstance(data, dict) and isinstance(data.get("query"), str):
+                # GraphQL documents differ only in whitespace between callers
+                data["query"] = " ".join(data["query"].split())
+            payload = json.dumps(data, sort_keys=True)
+    return f"{method} {path}?{urlencode(params)} {payload}".rstrip()
+
+
+class Cassettes:
+    """Recorded interactions per provider, one JSON file each."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.recorded: dict[str, dict[str, dict]] = {}
+        for provider in UPSTREAMS:
+            path = directory / f"{provider}.json"
+            entries = json.loads(path.read_text()) if path.exists() else []
+            self.recorded[provider] = {e["request"]: e for e in entries}
+
+    def get(self, provider: str, key: str) -> dict | None:
+        return self.recorded[provider].get(key)
+
+    def add(self, provider: str, entry: dict) -> None:
+        with self.lock:
+            self.recorded[provider][entry["request"]] = entry
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.directory / f"{provider}.json"
+            tmp = path.with_suffix(".json.tmp")
+            tmp.write_text(json.dumps(list(self.recorded[provider].values()), indent=1, sort_keys=True))
+            os.replace(tmp, path)
+
+
+class Faults:
+    """Latency and failures to inject; one seeded generator makes runs repeatable."""
+
+    def __init__(self, args):
+        self.latency = args.latency_ms / 1000
+        self.jitter = args.jitter_ms / 1000
+        self.error_rate = args.error_rate
+        self.throttle_rate = args.throttle_rate
+        self.retry_after = args.retry_after
+        self.rate_per_minute = args.rate_per_minute
+        self.rng = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.windows: dict[str, deque] = {provider: deque() for provider in UPSTREAMS}
+
+    def delay(self) -> float:
+        with self.lock:
+            return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+    def fault(self, provider: str) -> tuple[int, float | None] | None:
+        """(status, Retry-After) to fail this request with, or None to answer it."""
+        with self.lock:
+            now = time.monotonic()
+            if self.rate_per_minute > 0:
+                # the provider's own limit, as a sliding one-minute window
+                window = self.windows[provider]
+                while window and window[0] <= now - 60:
+                    window.popleft()
+                if len(window) >= self.rate_per_minute:
+                    return 429, window[0] + 60 - now
+                window.append(now)
+            roll = self.rng.random()
+            if roll < self.throttle_rate:
+                return 429, self.retry_after
+            if roll < self.throttle_rate + self.error_rate:
+                return self.rng.choice((500, 502, 503)), None
+        return None
+
+
+# -------------------------
+# Synthetic answers
+# -------------------------
+#
+# Only the fields app.providers' normalize_* read, derived from the request so the same
+# request always gets the same answer.
+
+def _release(rng: random.Random) -> str:
+    return f"{rng.randint(1985, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+
+
+def synthesize(provider: str, method: str, path: str, query: str, body: bytes, key: str) -> dict | None:
+    rng = random.Random(key)
+    params = dict(parse_qsl(query))
+    if provider == "rawg":
+        def game(game_id: int, name: str) -> dict:
+            return {"id": game_id, "name": name, "background_image": None, "released": _release(rng)}
+
+        if path == "/games":
+            search = params.get("search", "game")
+            size = min(int(params.get("page_size", 10)), 40)
+            return {"results": [game(rng.randint(1, 10**6), f"{search} {i + 1}") for i in range(size)]}
+        if path.startswith("/games/") and path[7:].isdigit():
+            return game(int(path[7:]), f"Game {path[7:]}")
+    elif provider == "tmdb":
+        def movie(movie_id: int, title: str) -> dict:
+            return {"id": movie_id, "title": title, "poster_path": None, "release_date": _release(rng)}
+
+        if path == "/search/movie":
+            search = params.get("query", "movie")
+            return {"results": [movie(rng.randint(1, 10**6), f"{search} {i + 1}") for i in range(20)]}
+        if path.startswith("/movie/") and path[7:].isdigit():
+            return movie(int(path[7:]), f"Movie {path[7:]}")
+    elif provider == "anilist" and method == "POST":
+        variables = (json.loads(body or b"{}").get("variables") or {})
+
+        def media(media_id: int, title: str) -> dict:
+            year, month, day = (int(x) for x in _release(rng).split("-"))
+            return {
+                "id": media_id,
+                "title": {"romaji": title, "english": title, "native": None},
+                "coverImage": {"large": None},
+                "startDate": {"year": year, "month": month, "day": day},
+                "episodes": rng.randint(1, 100),
+                "averageScore": rng.randint(40, 95),
+            }
+
+        if "ids" in variables:
+            found = [media(i, f"Anime {i}") for i in variables["ids"] or []]
+        else:
+            search = variables.get("search") or "anime"
+            found = [media(rng.randint(1, 10**6), f"{search} {i + 1}") for i in range(10)]
+        return {"data": {"Page": {"media": found}}}
+    return None
+
+
+# -------------------------
+# Server
+# -------------------------
+
+class StubHandler(BaseHTTPRequestHandler):
+    # keep-alive, so client connection pooling behaves as against the real APIs
+    protocol_version = "HTTP/1.1"
+    server: "StubServer"
+
+    def do_GET(self):
+        self.answer()
+
+    def do_POST(self):
+        self.answer()
+
+    def log_message(self, format, *args):
+        if self.server.args.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status: int, data, headers: dict | None = None) -> None:
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def answer(self) -> None:
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        url = urlsplit(self.path)
+        if url.path == "/_stub/stats":
+            return self.send_json(200, {p: dict(c) for p, c in server.stats.items()})
+
+        provider, _, rest = url.path.lstrip("/").partition("/")
+        if provider not in UPSTREAMS:
+            return self.send_json(404, {"detail": f"unknown provider {provider!r}"})
+        path = "/" + rest if rest else ""
+        stats = server.stats[provider]
+        stats["requests"] += 1
+
+        time.sleep(server.faults.delay())
+        fault = server.faults.fault(provider)
+        if fault is not None:
+            status, retry_after = fault
+            if status == 429:
+                stats["throttled"] += 1
+                return self.send_json(429, {"detail": "rate limited"}, {"Retry-After": str(math.ceil(retry_after))})
+            stats["errors"] += 1
+            return self.send_json(status, {"detail": "injected failure"})
+
+        key = request_key(self.command, path, url.query, body)
+        entry = server.cassettes.get(provider, key)
+        if entry is None and server.args.record:
+            entry = self.forward(provider, path, url.query, body, key)
+            stats["recorded"] += 1
+        elif entry is not None:
+            stats["replayed"] += 1
+        if entry is not None:
+            return self.send_json(entry["status"], entry["body"])
+
+        data = synthesize(provider, self.command, path, url.query, body, key) if server.args.synthesize else None
+        if data is not None:
+            stats["synthesized"] += 1
+            return self.send_json(200, data)
+        stats["missed"] += 1
+        return self.send_json(502, {"detail": f"no recording for {provider} {key}"})
+
+    def forward(self, provider: str, path: str, query: str, body: bytes, key: str) -> dict:
+        r = self.server.upstream.request(
+            self.command,
+            UPSTREAMS[provider] + path,
+            params=parse_qsl(query, keep_blank_values=True),
+            content=body or None,
+            headers={"Content-Type": "application/json", "Accept": "application/json"},
+        )
+        try:
+            data = r.json()
+        except ValueError:
+            data = {"detail": r.text}
+        entry = {"request": key, "status": r.status_code, "body": data}
+        # failures are the provider's weather, not its answer
+        if r.status_code < 500 and r.status_code != 429:
+            self.server.cassettes.add(provider, entry)
+        return entry
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, args):
+        super().__init__((args.host, args.port), StubHandler)
+        self.args = args
+        self.cassettes = Cassettes(Path(args.cassettes))
+        self.faults = Faults(args)
+        self.stats: dict[str, Counter] = {provider: Counter() for provider in UPSTREAMS}
+        self.upstream = httpx.Client(timeout=30)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--cassettes", default=str(Path(__file__).resolve().parent / "cassettes"))
+    parser.add_argument("--record", action="store_true", help="forward unrecorded requests and save the answers")
+    parser.add_argument("--synthesize", action="store_true", help="generate answers to unrecorded requests")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction answered 500/502/503")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="fraction answered 429")
+    parser.add_argument("--retry-after", type=float, default=1, help="Retry-After of injected 429s, seconds")
+    parser.add_argument("--rate-per-minute", type=float, default=0, help="per-provider limit enforced with 429s")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = StubServer(args)
+    recorded = {p: len(e) for p, e in server.cassettes.recorded.items()}
+    print(f"serving {recorded} recordings on http://{args.host}:{args.port}")
+    for provider, env in (("rawg", "RAWG_API_URL"), ("tmdb", "TMDB_API_URL"), ("anilist", "ANILIST_URL")):
+        print(f"  {env}=http://{args.host}:{args.port}/{provider}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+#!/bin/sh
+set -e
+
+# every replica may run this; alembic/env.py serializes them on an advisory lock,
+# so one migrates and the rest wait and then find nothing to do
+if [ "${RUN_MIGRATIONS:-true}" = "true" ]; then
+    python -m alembic upgrade head
+fi
+
+exec gunicorn -c gunicorn.conf.py app.main:app
@@ -0,0 +1,37 @@
+# Production server: gunicorn manages worker processes, each running the app on uvicorn.
+#   gunicorn -c gunicorn.conf.py app.main:app
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# import the app once in the master: workers fork with it loaded, start fast and
+# share its memory pages copy-on-write
+preload_app = os.getenv("PRELOAD_APP", "true").lower() in ("1", "true", "yes")
+
+# on SIGTERM workers stop accepting, finish in-flight requests for up to this long,
+# then run the lifespan shutdown
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+# a worker silent for this long is killed and replaced
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+
+# recycle workers now and then to cap slow leaks; jitter keeps them from restarting together
+max_requests = int(os.getenv("MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "1000"))
+
+accesslog = os.getenv("ACCESS_LOG", "-")
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+
+def post_fork(server, worker):
+    # connections opened in the master (by preload) must not be shared across processes;
+    # close=False leaves them to the master and gives the worker fresh pools
+    from app.db import engine, replica_engine
+
+    engine.dispose(close=False)
+    if replica_engine is not None:
+        replica_engine.dispose(close=False)
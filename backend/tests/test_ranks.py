@@ -0,0 +1,59 @@
+"""Rank key arithmetic; pure functions, no database. Run from backend/: python -m pytest tests"""
+import random
+
+import pytest
+
+from app.ranks import FIRST_RANK, MAX_INT, RankSpaceExhausted, WIDTH, _encode_int, rank_between
+
+SMALLEST = _encode_int(0)
+LARGEST = _encode_int(MAX_INT)
+
+
+def test_first_rank_of_empty_list():
+    assert rank_between(None, None) == FIRST_RANK
+
+
+def test_nothing_sorts_before_the_smallest_key():
+    assert SMALLEST == "0" * WIDTH
+    with pytest.raises(RankSpaceExhausted):
+        rank_between(None, SMALLEST)
+
+
+def test_before_a_smallest_key_with_a_fraction():
+    b = SMALLEST + "1"
+    r = rank_between(None, b)
+    assert SMALLEST < r < b
+
+
+def test_after_the_largest_key_extends_it():
+    r = rank_between(LARGEST, None)
+    assert r > LARGEST and r.startswith(LARGEST)
+
+
+@pytest.mark.parametrize("a, b", [
+    (_encode_int(5), _encode_int(6)),
+    (_encode_int(5), _encode_int(5) + "1"),
+    (_encode_int(5) + "z", _encode_int(6)),
+    (_encode_int(5) + "0001", _encode_int(5) + "0002"),
+])
+def test_between_close_neighbours(a, b):
+    r = rank_between(a, b)
+    assert a < r < b
+
+
+def test_rejects_misordered_bounds():
+    with pytest.raises(ValueError):
+        rank_between(_encode_int(6), _encode_int(5))
+
+
+def test_repeated_inserts_keep_order():
+    rng = random.Random(1)
+    ranks = [FIRST_RANK]
+    for _ in range(2000):
+        i = rng.randrange(len(ranks) + 1)
+        a = ranks[i - 1] if i > 0 else None
+        b = ranks[i] if i < len(ranks) else None
+        r = rank_between(a, b)
+        assert (a is None or a < r) and (b is None or r < b)
+        ranks.insert(i, r)
+    assert ranks == sorted(ranks)
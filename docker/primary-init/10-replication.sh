@@ -0,0 +1,4 @@
+#!/bin/sh
+# Lets the replica container stream WAL from this primary (runs on first init only).
+set -e
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
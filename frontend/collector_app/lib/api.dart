@@ -10,6 +10,10 @@ class ApiClient {
   // used to avoid multiple refresh calls in parallel
   Completer<void>? _refreshCompleter;
 
+  // handed out after a write and sent back, so reads right after it see it
+  // whichever server instance answers them
+  String? _readPin;
+
   ApiClient({required this.tokenStore})
       : dio = Dio(BaseOptions(baseUrl: AppConfig.apiBaseUrl)) {
     dio.interceptors.add(
@@ -19,8 +23,18 @@ class ApiClient {
           if (token != null && token.isNotEmpty) {
             options.headers['Authorization'] = 'Bearer $token';
           }
+          if (_readPin != null) {
+            options.headers['X-Read-Pin'] = _readPin;
+          }
           handler.next(options);
         },
+        onResponse: (response, handler) {
+          final pin = response.headers.value('x-read-pin');
+          if (pin != null) {
+            _readPin = pin;
+          }
+          handler.next(response);
+        },
         onError: (e, handler) async {
           // Only handle 401s from protected endpoints (not login/register)
           final status = e.response?.statusCode;